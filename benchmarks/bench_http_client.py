@@ -0,0 +1,83 @@
+#!/usr/bin/env python
+"""
+Benchmark of connection reuse in catalog.http_client.
+
+Runs a local HTTP/1.1 stand-in server and compares plain requests.get
+(new connection per call) with the pooled requests_get session.
+
+Usage: python benchmarks/bench_http_client.py [--requests 500]
+"""
+import argparse
+import os
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nestflix.settings')
+
+import django
+django.setup()
+
+from loguru import logger
+logger.disable('catalog')
+
+import requests
+from catalog.http_client import requests_get, close_sessions
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    connections = 0
+    lock = threading.Lock()
+
+    def setup(self):
+        super().setup()
+        with StandInHandler.lock:
+            StandInHandler.connections += 1
+
+    def do_GET(self):
+        body = b'{"results": []}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(label, get, url, count):
+    StandInHandler.connections = 0
+    started = time.perf_counter()
+    for _ in range(count):
+        get(url, timeout=5).raise_for_status()
+    elapsed = time.perf_counter() - started
+    print(f"{label:<22} {count / elapsed:>9.0f} req/s  {elapsed * 1000 / count:>6.2f} ms/req  "
+          f"{StandInHandler.connections:>5} connections")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=500)
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(('127.0.0.1', 0), StandInHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/3/movie/1"
+
+    try:
+        run('requests.get', requests.get, url, args.requests)
+        run('pooled requests_get', requests_get, url, args.requests)
+    finally:
+        close_sessions()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+#!/usr/bin/env python
+"""
+Parsing cost of thumbnail-bearing Plex webhook requests.
+
+Builds a multipart request like the ones Plex sends (a JSON payload field
+plus a JPEG thumbnail of --thumb-kb KiB) and reads request.POST --requests
+times, once with Django's default upload handlers and once with
+DiscardFilesUploadHandler, reporting time per request and peak traced memory.
+
+Usage: python benchmarks/bench_plex_multipart.py [--requests 200] [--thumb-kb 300]
+"""
+import argparse
+import json
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nestflix.settings')
+
+import django
+django.setup()
+
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory
+from catalog.plex_utils import DiscardFilesUploadHandler
+
+PAYLOAD = json.dumps({
+    'event': 'media.scrobble',
+    'Account': {'id': 1, 'title': 'owner'},
+    'Server': {'title': 'server', 'uuid': 'abc'},
+    'Player': {'local': True, 'title': 'TV', 'uuid': 'def'},
+    'Metadata': {'type': 'movie', 'ratingKey': '42', 'guid': 'plex://movie/5d776', 'Guid': [{'id': 'tmdb://42'}]},
+})
+
+
+def make_request(thumb):
+    thumb.seek(0)
+    return RequestFactory().post('/plex/webhook/', {'payload': PAYLOAD, 'thumb': thumb})
+
+
+def run(label, thumb, count, discard):
+    requests = [make_request(thumb) for _ in range(count)]
+    tracemalloc.start()
+    started = time.perf_counter()
+    for request in requests:
+        if discard:
+            request.upload_handlers = [DiscardFilesUploadHandler(request)]
+        assert request.POST['payload'] == PAYLOAD
+        for upload in request.FILES.values():
+            upload.close()
+    elapsed = time.perf_counter() - started
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    print(f"{label:<10} {elapsed / count * 1000:>8.3f} ms/request   peak {peak / 1024:>9.1f} KiB")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=200)
+    parser.add_argument('--thumb-kb', type=int, default=300)
+    args = parser.parse_args()
+
+    thumb = SimpleUploadedFile('thumb.jpg', b'\xff\xd8' + os.urandom(args.thumb_kb * 1024), content_type='image/jpeg')
+    print(f"{args.requests} webhook requests with a {args.thumb_kb} KiB thumbnail")
+
+    default = run('default', thumb, args.requests, discard=False)
+    discard = run('discard', thumb, args.requests, discard=True)
+    print(f"discarding thumbnails is {default / discard:.1f}x faster")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,118 @@
+#!/usr/bin/env python
+"""
+Acknowledgement latency of the Plex webhook receiver under bursts.
+
+Creates a throwaway on-disk SQLite database and fires --bursts bursts of
+--burst-size concurrent webhooks at plex_webhook_receiver, first with the
+previous inline processing and then with the queued receiver. TMDB is
+replaced with a fake that sleeps --delay milliseconds per details call, and
+each event uses a different title so it is never found locally.
+
+Usage: python benchmarks/bench_plex_webhook.py [--bursts 20] [--burst-size 10] [--delay 300]
+"""
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import count
+from pathlib import Path
+from unittest.mock import patch
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nestflix.settings')
+
+import django
+django.setup()
+
+from loguru import logger
+logger.disable('catalog')
+
+from django.contrib.auth.models import User
+from django.db import connection, connections
+from django.test import Client
+from django.test.utils import override_settings
+from django.urls import reverse
+from catalog.models import PlexWebhookEvent, UserSettings
+from catalog.plex_utils import process_plex_event, log_webhook_event
+
+TOKEN = 'bench-webhook-token'
+
+
+def fake_details(delay):
+    def get_details(media_type, tmdb_id, *args, **kwargs):
+        time.sleep(delay)
+        return {'id': tmdb_id, 'title': f'Movie {tmdb_id}', 'poster_path': None}
+    return get_details
+
+
+def inline_queue(user, event_type, payload):
+    """The receiver's previous inline processing, kept for comparison."""
+    processed = process_plex_event(user, event_type, payload)
+    log_webhook_event(user, event_type, payload, processed, '' if processed else 'Event not processed')
+    return None, False
+
+
+def post_webhook(tmdb_id):
+    payload = {
+        'event': 'media.scrobble',
+        'Metadata': {'type': 'movie', 'guid': f'tmdb://{tmdb_id}', 'title': f'Movie {tmdb_id}', 'Guid': []},
+    }
+    started = time.perf_counter()
+    response = Client().post(reverse('catalog:plex_webhook', args=[TOKEN]), {'payload': json.dumps(payload)})
+    elapsed = time.perf_counter() - started
+    connections.close_all()
+    if response.status_code != 200:
+        raise RuntimeError(f"Webhook failed with {response.status_code}: {response.content[:200]}")
+    return elapsed
+
+
+def run_bursts(label, bursts, burst_size, ids):
+    latencies = []
+    with ThreadPoolExecutor(max_workers=burst_size) as executor:
+        for _ in range(bursts):
+            latencies.extend(executor.map(post_webhook, [next(ids) for _ in range(burst_size)]))
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2] * 1000
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000
+    print(f"{label:<8} p50 {p50:>8.1f} ms   p99 {p99:>8.1f} ms   max {latencies[-1] * 1000:>8.1f} ms")
+    return p99
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--bursts', type=int, default=20)
+    parser.add_argument('--burst-size', type=int, default=10)
+    parser.add_argument('--delay', type=int, default=300, help='simulated TMDB latency in ms')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = str(Path(tmp) / 'bench.sqlite3')
+        connection.settings_dict.setdefault('OPTIONS', {})['timeout'] = 60
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            user = User.objects.create_user(username='bench')
+            UserSettings.objects.create(
+                user=user, tmdb_api_key='bench', plex_webhook_token=TOKEN, plex_webhook_enabled=True,
+            )
+            ids = count(1)
+            print(f"{args.bursts} bursts of {args.burst_size} webhooks, TMDB delay {args.delay} ms")
+
+            with override_settings(ALLOWED_HOSTS=['testserver']), \
+                    patch('catalog.plex_utils.get_movie_details', side_effect=fake_details(args.delay / 1000)):
+                with patch('catalog.views.queue_webhook_event', side_effect=inline_queue):
+                    inline = run_bursts('inline', args.bursts, args.burst_size, ids)
+                PlexWebhookEvent.objects.all().delete()
+                queued = run_bursts('queued', args.bursts, args.burst_size, ids)
+
+            print(f"p99 acknowledgement {inline / queued:.1f}x faster, "
+                  f"{PlexWebhookEvent.objects.filter(processed_at__isnull=True).count()} events left for the worker")
+        finally:
+            connection.creation.destroy_test_db(connection.settings_dict['NAME'], verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
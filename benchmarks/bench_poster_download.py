@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+"""
+Throughput of bulk poster caching against a slow image host.
+
+Runs a local HTTP/1.1 stand-in for image.tmdb.org that answers every
+poster request after --latency-ms with a 500x750 JPEG, creates a
+throwaway SQLite database with --posters movies and caches their posters
+(download plus local derivation of POSTER_SIZES) with cache_posters_bulk,
+first with one worker (the serial command) and then with --workers threads. --trace-memory also reports peak traced
+memory (tracing slows the runs down, so throughput is not comparable).
+
+Usage: python benchmarks/bench_poster_download.py [--posters 200] [--workers 8] [--latency-ms 50] [--trace-memory]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+from io import BytesIO
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from unittest.mock import patch
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nestflix.settings')
+
+import django
+django.setup()
+
+from loguru import logger
+logger.disable('catalog')
+
+from django.db import connection
+from django.test import override_settings
+from catalog.http_client import close_sessions
+from catalog.models import Movie
+from catalog import poster_cache
+from PIL import Image
+
+
+class PosterHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    latency = 0.05
+    body = b''
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        self.send_response(200)
+        self.send_header('Content-Type', 'image/jpeg')
+        self.send_header('Content-Length', str(len(self.body)))
+        self.end_headers()
+        self.wfile.write(self.body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def run(label, workers, count, trace_memory):
+    Movie.objects.update(poster_file='', poster_cached_at=None)
+    if trace_memory:
+        tracemalloc.start()
+    stats = poster_cache.cache_posters_bulk(Movie.objects.all(), workers=workers, per_host=workers)
+    line = (f"{label:<12} {count / stats['elapsed']:>8.1f} posters/s  "
+            f"{stats['bytes'] / 1024 / 1024 / stats['elapsed']:>7.2f} MB/s  {stats['elapsed']:>6.2f}s")
+    if trace_memory:
+        line += f"  peak {tracemalloc.get_traced_memory()[1] / 1024:>8.1f} KiB"
+        tracemalloc.stop()
+    assert stats['cached'] == count, stats
+    print(line)
+    return stats['elapsed']
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--posters', type=int, default=200)
+    parser.add_argument('--workers', type=int, default=8)
+    parser.add_argument('--latency-ms', type=int, default=50)
+    parser.add_argument('--trace-memory', action='store_true')
+    args = parser.parse_args()
+
+    PosterHandler.latency = args.latency_ms / 1000
+    buffer = BytesIO()
+    Image.effect_noise((500, 750), 48).convert('RGB').save(buffer, 'JPEG', quality=85)
+    PosterHandler.body = buffer.getvalue()
+    server = ThreadingHTTPServer(('127.0.0.1', 0), PosterHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base_url = f"http://127.0.0.1:{server.server_port}"
+
+    def local_url(movie, size='w300'):
+        return f"{base_url}/t/p/{size}{movie.data['poster_path']}"
+
+    with tempfile.TemporaryDirectory() as tmp, \
+            override_settings(MEDIA_ROOT=tmp, HTTP_POOL_MAXSIZE=max(10, args.workers)), \
+            patch.object(poster_cache, 'poster_url', local_url):
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = str(Path(tmp) / 'bench.sqlite3')
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            Movie.objects.bulk_create(
+                Movie(tmdb_id=i, media_type='movie', title=f'Movie {i}', data={'poster_path': f'/{i}.jpg'})
+                for i in range(1, args.posters + 1)
+            )
+            print(f"{args.posters} posters of {len(PosterHandler.body) // 1024} KiB, {args.latency_ms} ms per request")
+            serial = run('1 worker', 1, args.posters, args.trace_memory)
+            pooled = run(f'{args.workers} workers', args.workers, args.posters, args.trace_memory)
+            print(f"{args.workers} workers are {serial / pooled:.1f}x faster")
+        finally:
+            close_sessions()
+            server.shutdown()
+            connection.creation.destroy_test_db(connection.settings_dict['NAME'], verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
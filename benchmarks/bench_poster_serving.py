@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Requests per second for cached poster hits through the full WSGI handler.
+
+Writes a --poster-kb KiB poster to a temporary MEDIA_ROOT and requests it
+--requests times with the project's middleware stack, comparing Django's
+static serve view (what DEBUG mode routes MEDIA_URL to) with
+PosterServingMiddleware answering full responses, revalidations (304),
+range requests (206) and X-Accel-Redirect hand-offs to a front proxy.
+
+Usage: python benchmarks/bench_poster_serving.py [--requests 2000] [--poster-kb 40]
+"""
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nestflix.settings')
+
+import django
+django.setup()
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.test import RequestFactory, override_settings
+from django.urls import re_path
+from django.views.static import serve
+
+NAME = 'tmdb_7_w300.0123456789ab.jpg'
+MEDIA_ROOT = tempfile.mkdtemp()
+
+# URLconf for the baseline: MEDIA_URL served by django.views.static.serve, as with DEBUG
+urlpatterns = [
+    re_path(r'^media/(?P<path>.*)$', serve, {'document_root': MEDIA_ROOT}),
+]
+
+
+def run(label, count, headers=None, expected=200, poster_middleware=True, **overrides):
+    middleware = [m for m in settings.MIDDLEWARE if poster_middleware or not m.endswith('PosterServingMiddleware')]
+    with override_settings(MEDIA_ROOT=MEDIA_ROOT, MEDIA_URL='/media/', ROOT_URLCONF=__name__,
+                           MIDDLEWARE=middleware, ALLOWED_HOSTS=['*'], **overrides):
+        handler = WSGIHandler()
+        factory = RequestFactory()
+        started = time.perf_counter()
+        for _ in range(count):
+            environ = factory.get(f'/media/posters/{NAME}', headers=headers).environ
+            status = []
+            body = handler(environ, lambda code, response_headers: status.append(code))
+            for _ in body:
+                pass
+            body.close()
+            assert status[0].startswith(str(expected)), status[0]
+        elapsed = time.perf_counter() - started
+    print(f"{label:<18} {count / elapsed:>9.0f} req/s   {elapsed / count * 1e6:>7.1f} us/request")
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--requests', type=int, default=2000)
+    parser.add_argument('--poster-kb', type=int, default=40)
+    args = parser.parse_args()
+
+    try:
+        bench(args)
+    finally:
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+
+
+def bench(args):
+    posters = Path(MEDIA_ROOT) / 'posters'
+    posters.mkdir()
+    (posters / NAME).write_bytes(b'\xff\xd8' + os.urandom(args.poster_kb * 1024))
+    stat = (posters / NAME).stat()
+    etag = f'"{int(stat.st_mtime):x}-{stat.st_size:x}"'
+    print(f"{args.requests} requests for a {args.poster_kb} KiB poster")
+
+    baseline = run('static.serve', args.requests, poster_middleware=False)
+    full = run('middleware 200', args.requests)
+    run('middleware 304', args.requests, headers={'If-None-Match': etag}, expected=304)
+    run('middleware 206', args.requests, headers={'Range': 'bytes=0-1023'}, expected=206)
+    run('x-accel-redirect', args.requests, POSTER_SENDFILE='x-accel-redirect')
+    print(f"middleware is {baseline / full:.1f}x faster than static.serve for full responses")
+
+
+if __name__ == '__main__':
+    main()
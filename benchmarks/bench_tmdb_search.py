@@ -0,0 +1,92 @@
+#!/usr/bin/env python
+"""
+Latency benchmark of tmdb_client.search_movies modes.
+
+Runs a local stand-in for the TMDB search endpoints that sleeps for
+--delay milliseconds per request and times the concurrent, sequential
+and multi modes. The search result cache is bypassed, so every search
+reaches the stand-in.
+
+Usage: python benchmarks/bench_tmdb_search.py [--delay 150] [--iterations 20]
+"""
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import urlsplit
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nestflix.settings')
+
+import django
+django.setup()
+
+from loguru import logger
+logger.disable('catalog')
+
+from catalog import tmdb_client
+from catalog.http_client import close_sessions
+
+MOVIES = [{'id': i, 'title': f'Movie {i}', 'media_type': 'movie'} for i in range(1, 21)]
+SHOWS = [{'id': i, 'name': f'Show {i}', 'media_type': 'tv'} for i in range(21, 41)]
+
+
+class DelayedTMDBHandler(BaseHTTPRequestHandler):
+    protocol_version = 'HTTP/1.1'
+    disable_nagle_algorithm = True
+    delay = 0.15
+
+    def do_GET(self):
+        time.sleep(self.delay)
+        path = urlsplit(self.path).path
+        if path.endswith('/search/movie'):
+            results = MOVIES
+        elif path.endswith('/search/tv'):
+            results = SHOWS
+        else:
+            results = MOVIES + SHOWS
+        body = json.dumps({'results': results}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--delay', type=int, default=150, help='Injected delay per TMDB request, ms')
+    parser.add_argument('--iterations', type=int, default=20)
+    args = parser.parse_args()
+
+    DelayedTMDBHandler.delay = args.delay / 1000
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DelayedTMDBHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    tmdb_client.TMDB_BASE_URL = f"http://127.0.0.1:{server.server_port}/3"
+
+    try:
+        print(f"Injected delay: {args.delay} ms per request, {args.iterations} searches per mode")
+        for mode in tmdb_client.SEARCH_MODES:
+            timings = []
+            for _ in range(args.iterations):
+                started = time.perf_counter()
+                results = tmdb_client.search_movies('bench', 'fake_api_key', mode=mode, use_cache=False)
+                timings.append((time.perf_counter() - started) * 1000)
+            print(f"{mode:<11} median {statistics.median(timings):>7.1f} ms  "
+                  f"max {max(timings):>7.1f} ms  {len(results)} results")
+    finally:
+        close_sessions()
+        server.shutdown()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,132 @@
+#!/usr/bin/env python
+"""
+Write-time benchmark of the Trakt import on a synthetic history.
+
+Creates a throwaway on-disk SQLite database, then imports --items synthetic
+Trakt titles twice: once with the previous per-item get_or_create/save
+loop and once with the batched import_trakt_data_task. Trakt and TMDB are
+replaced with in-memory fakes so only database writes are measured.
+
+Usage: python benchmarks/bench_trakt_import.py [--items 5000]
+"""
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+from unittest.mock import patch
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(BASE_DIR))
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'nestflix.settings')
+
+import django
+django.setup()
+
+from loguru import logger
+logger.disable('catalog')
+
+from django.contrib.auth.models import User
+from django.db import connection
+from catalog.models import ImportTask, Movie, UserRating
+from catalog.tasks import import_trakt_data_task, _parse_trakt_datetime
+
+
+def synthetic_history(count):
+    watched = [
+        {'tmdb_id': i, 'media_type': 'movie', 'title': f'Movie {i}', 'last_watched_at': '2020-01-01T12:00:00Z'}
+        for i in range(1, count + 1)
+    ]
+    rated = [
+        {'tmdb_id': i, 'media_type': 'movie', 'title': f'Movie {i}', 'rating': i % 10 + 1}
+        for i in range(1, count + 1, 3)
+    ]
+    return watched, rated
+
+
+def fake_details(media_type, tmdb_id, *args, **kwargs):
+    return {'id': tmdb_id, 'title': f'Movie {tmdb_id}', 'overview': 'x' * 200, 'poster_path': f'/{tmdb_id}.jpg'}
+
+
+def legacy_import(task, user_id, watched, rated):
+    """The per-item write loop used before batching, kept for comparison."""
+    total_items = len(watched) + len(rated)
+    all_items = {}
+    processed_count = 0
+    for item in watched:
+        all_items[f"movie_{item['tmdb_id']}"] = {
+            'tmdb_id': item['tmdb_id'], 'media_type': 'movie', 'title': item['title'],
+            'watched_at': item['last_watched_at'], 'rating': None,
+        }
+        processed_count += 1
+        task.progress = int((processed_count / total_items) * 50)
+        task.save()
+    for item in rated:
+        all_items[f"movie_{item['tmdb_id']}"]['rating'] = item['rating']
+        processed_count += 1
+        task.progress = min(50, int((processed_count / total_items) * 50))
+        task.save()
+
+    imported_count = 0
+    for item in all_items.values():
+        movie_data = fake_details('movie', item['tmdb_id'])
+        movie, created = Movie.objects.get_or_create(
+            tmdb_id=item['tmdb_id'], media_type='movie',
+            defaults={'title': movie_data['title'], 'data': movie_data},
+        )
+        if not created:
+            movie.data = movie_data
+            movie.save()
+        UserRating.objects.get_or_create(
+            user_id=user_id, movie=movie,
+            defaults={'rating': item['rating'], 'watched_at': _parse_trakt_datetime(item['watched_at'])},
+        )
+        imported_count += 1
+        task.imported_count = imported_count
+        task.save()
+
+
+def reset_data():
+    UserRating.objects.all().delete()
+    Movie.objects.all().delete()
+    ImportTask.objects.all().delete()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--items', type=int, default=5000)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        connection.settings_dict.setdefault('TEST', {})['NAME'] = str(Path(tmp) / 'bench.sqlite3')
+        connection.creation.create_test_db(verbosity=0)
+        try:
+            user = User.objects.create_user(username='bench')
+            watched, rated = synthetic_history(args.items)
+            print(f"Synthetic history: {len(watched)} watched, {len(rated)} rated")
+
+            task = ImportTask.objects.create(user=user, task_id='legacy')
+            started = time.perf_counter()
+            legacy_import(task, user.id, watched, rated)
+            legacy = time.perf_counter() - started
+            print(f"per-item writes  {legacy:>8.2f} s")
+
+            reset_data()
+            ImportTask.objects.create(user=user, task_id='batched')
+            with patch('catalog.tasks.iter_watched_movies', return_value=watched), \
+                    patch('catalog.tasks.iter_watched_shows', return_value=[]), \
+                    patch('catalog.tasks.iter_rated_movies', return_value=rated), \
+                    patch('catalog.tasks.iter_rated_shows', return_value=[]), \
+                    patch('catalog.tasks.get_movie_details', side_effect=fake_details):
+                started = time.perf_counter()
+                import_trakt_data_task.now('batched', user.id, 'bench', 'client', 'key')
+                batched = time.perf_counter() - started
+            print(f"batched writes   {batched:>8.2f} s  ({legacy / batched:.1f}x faster)")
+            print(f"Rows: {Movie.objects.count()} movies, {UserRating.objects.count()} ratings")
+        finally:
+            connection.creation.destroy_test_db(connection.settings_dict['NAME'], verbosity=0)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,22 +1,46 @@
 from django.contrib import admin
-from .models import Movie, UserRating, UserSettings, ImportTask, PlexWebhookEvent
+from .models import (
+    Movie, UserRating, UserSettings, ImportTask, PlexWebhookEvent, PlexGuidMapping, EpisodeWatch, ShowProgress,
+    StatCounter, WatchEvent,
+)
 
 @admin.register(Movie)
 class MovieAdmin(admin.ModelAdmin):
     list_display = ('title', 'media_type', 'tmdb_id')
     list_filter = ('media_type',)
     search_fields = ('title', 'tmdb_id')
-    readonly_fields = ('tmdb_id', 'data')
+    readonly_fields = ('tmdb_id', 'data', 'data_fetched_at', 'data_language', 'data_hash')
     ordering = ('title',)
 
 @admin.register(UserRating)
 class UserRatingAdmin(admin.ModelAdmin):
-    list_display = ('user', 'movie', 'rating', 'watched_at', 'created_at')
+    list_display = ('user', 'movie', 'rating', 'play_count', 'watched_at', 'created_at')
     list_filter = ('rating', 'created_at', 'watched_at')
     search_fields = ('user__username', 'movie__title')
-    readonly_fields = ('created_at',)
+    readonly_fields = ('created_at', 'play_count', 'first_watched_at', 'watched_at')
     ordering = ('-created_at',)
 
+@admin.register(WatchEvent)
+class WatchEventAdmin(admin.ModelAdmin):
+    list_display = ('user', 'movie', 'source', 'watched_at')
+    list_filter = ('source', 'watched_at')
+    search_fields = ('user__username', 'movie__title')
+    ordering = ('-watched_at',)
+
+@admin.register(EpisodeWatch)
+class EpisodeWatchAdmin(admin.ModelAdmin):
+    list_display = ('user', 'show', 'season', 'episode', 'watched_at')
+    list_filter = ('watched_at',)
+    search_fields = ('user__username', 'show__title')
+    ordering = ('-watched_at',)
+
+@admin.register(ShowProgress)
+class ShowProgressAdmin(admin.ModelAdmin):
+    list_display = ('user', 'show', 'episodes_watched', 'watch_count', 'last_season', 'last_episode', 'last_watched_at')
+    search_fields = ('user__username', 'show__title')
+    readonly_fields = ('episodes_watched', 'watch_count', 'last_season', 'last_episode', 'last_watched_at')
+    ordering = ('-last_watched_at',)
+
 @admin.register(UserSettings)
 class UserSettingsAdmin(admin.ModelAdmin):
     list_display = ('user', 'tmdb_api_key_masked', 'trakt_username', 'trakt_client_id_masked', 'plex_webhook_enabled', 'updated_at')
@@ -33,13 +57,29 @@ class ImportTaskAdmin(admin.ModelAdmin):
 
 @admin.register(PlexWebhookEvent)
 class PlexWebhookEventAdmin(admin.ModelAdmin):
-    list_display = ('user', 'event_type', 'processed', 'created_at')
+    list_display = ('user', 'event_type', 'processed', 'repeat_count', 'created_at', 'processed_at')
     list_filter = ('event_type', 'processed', 'created_at')
     search_fields = ('user__username', 'event_type')
-    readonly_fields = ('user', 'event_type', 'payload', 'processed', 'error_message', 'created_at')
+    readonly_fields = (
+        'user', 'event_type', 'payload', 'processed', 'processed_at', 'error_message',
+        'dedup_key', 'repeat_count', 'created_at', 'last_seen_at',
+    )
     
     def has_add_permission(self, request):
         return False
     
     def has_change_permission(self, request, obj=None):
         return False
+
+@admin.register(PlexGuidMapping)
+class PlexGuidMappingAdmin(admin.ModelAdmin):
+    list_display = ('plex_guid', 'media_type', 'tmdb_id', 'created_at')
+    list_filter = ('media_type',)
+    search_fields = ('plex_guid', 'tmdb_id')
+    readonly_fields = ('created_at',)
+
+@admin.register(StatCounter)
+class StatCounterAdmin(admin.ModelAdmin):
+    list_display = ('name', 'value', 'updated_at')
+    search_fields = ('name',)
+    readonly_fields = ('name', 'value', 'updated_at')
@@ -0,0 +1,89 @@
+import os
+import threading
+import time
+import weakref
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.models import F
+from .logger import logger
+
+_instances = weakref.WeakSet()
+
+
+class SharedCounters:
+    """
+    Named runtime counters summed over every process.
+
+    Increments are in-process additions; they are added to StatCounter rows
+    at most every STATS_FLUSH_INTERVAL seconds, so the web workers and
+    process_tasks report into the same totals. Counts not yet flushed when
+    a process exits are lost; a failed flush keeps them for the next one.
+
+    Args:
+        prefix: Namespace of the counter rows ("<prefix>.<name>")
+        names: Counter names
+    """
+
+    def __init__(self, prefix, names):
+        self.prefix = prefix
+        self.names = tuple(names)
+        self._pending = dict.fromkeys(self.names, 0)
+        self._lock = threading.Lock()
+        self._flushed_at = time.monotonic()
+        _instances.add(self)
+
+    def incr(self, *names):
+        with self._lock:
+            for name in names:
+                self._pending[name] += 1
+            due = time.monotonic() - self._flushed_at >= getattr(settings, 'STATS_FLUSH_INTERVAL', 60)
+        if due:
+            self.flush()
+
+    def flush(self):
+        """Add the pending increments to the shared rows"""
+        from .models import StatCounter
+
+        with self._lock:
+            pending = {name: count for name, count in self._pending.items() if count}
+            self._pending = dict.fromkeys(self.names, 0)
+            self._flushed_at = time.monotonic()
+        if not pending:
+            return
+        try:
+            with transaction.atomic():
+                for name, count in pending.items():
+                    row = f"{self.prefix}.{name}"
+                    if not StatCounter.objects.filter(name=row).update(value=F('value') + count):
+                        StatCounter.objects.create(name=row, value=count)
+        except DatabaseError as e:
+            logger.warning(f"Could not save {self.prefix} counters, keeping them for the next flush: {e}")
+            with self._lock:
+                for name, count in pending.items():
+                    self._pending[name] += count
+
+    def totals(self):
+        """Counter values over all processes, including this one's pending increments"""
+        from .models import StatCounter
+
+        self.flush()
+        rows = dict(StatCounter.objects.filter(name__startswith=f"{self.prefix}.").values_list('name', 'value'))
+        return {name: rows.get(f"{self.prefix}.{name}", 0) for name in self.names}
+
+    def reset(self):
+        from .models import StatCounter
+
+        with self._lock:
+            self._pending = dict.fromkeys(self.names, 0)
+        StatCounter.objects.filter(name__startswith=f"{self.prefix}.").delete()
+
+
+def _reset_after_fork():
+    # A forked worker must not flush the parent's pending increments a second time
+    for counters in list(_instances):
+        counters._lock = threading.Lock()
+        counters._pending = dict.fromkeys(counters.names, 0)
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
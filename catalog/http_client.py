@@ -1,12 +1,22 @@
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 from django.conf import settings
 from .logger import logger
 
+_sessions = {}
+_sessions_lock = threading.Lock()
+
 
 def get_proxies():
     """
     Get configured proxies for requests.
-    
+
     Returns:
         dict or None: Proxies configuration or None if disabled
     """
@@ -17,17 +27,121 @@ def get_proxies():
     return None
 
 
-def requests_get(*args, **kwargs):
+def _build_retry():
+    """Transport-level retry policy for idempotent GET requests."""
+    return Retry(
+        total=getattr(settings, 'HTTP_MAX_RETRIES', 3),
+        backoff_factor=getattr(settings, 'HTTP_BACKOFF_FACTOR', 0.5),
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=frozenset(['GET', 'HEAD']),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+
+
+def _build_session():
+    """Create a pooled keep-alive session with retries and proxies applied once."""
+    session = requests.Session()
+    adapter = HTTPAdapter(
+        pool_connections=getattr(settings, 'HTTP_POOL_CONNECTIONS', 4),
+        pool_maxsize=getattr(settings, 'HTTP_POOL_MAXSIZE', 10),
+        max_retries=_build_retry(),
+    )
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+
+    proxies = get_proxies()
+    if proxies:
+        session.proxies.update(proxies)
+    return session
+
+
+def get_session(url):
     """
-    Wrapper for requests.get with automatic proxy support.
-    
-    All arguments are passed through to requests.get().
-    Automatically adds proxies if PROXY_ENABLED=True.
-    
+    Get the pooled session for the host of the given URL.
+
+    Sessions are created lazily, one per host, and shared by every thread
+    of the current process. A forked child (e.g. a gunicorn worker) never
+    reuses sockets opened by its parent.
+
     Returns:
-        requests.Response: Response object from requests.get()
+        requests.Session: Session bound to the URL host
     """
-    proxies = get_proxies()
-    if proxies:
-        kwargs['proxies'] = proxies
-    return requests.get(*args, **kwargs)
+    host = urlsplit(url).netloc
+    session = _sessions.get(host)
+    if session is None:
+        with _sessions_lock:
+            session = _sessions.get(host)
+            if session is None:
+                logger.debug(f"Creating pooled HTTP session for {host}")
+                session = _build_session()
+                _sessions[host] = session
+    return session
+
+
+def close_sessions():
+    """Close all pooled sessions of the current process."""
+    with _sessions_lock:
+        for session in _sessions.values():
+            session.close()
+        _sessions.clear()
+
+
+def _reset_after_fork():
+    # Sockets inherited from the parent must not be shared with it
+    global _sessions_lock
+    _sessions_lock = threading.Lock()
+    _sessions.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+class RateLimiter:
+    """
+    Thread-safe token bucket limiting calls to `rate` per second.
+
+    Args:
+        rate: Sustained calls per second (0 or None disables limiting)
+        burst: Calls allowed back to back before throttling starts
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = rate
+        self.capacity = burst or max(1, int(rate or 1))
+        self._tokens = float(self.capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, amount=1):
+        """Take `amount` tokens (e.g. bytes for a bandwidth cap), sleeping until they are available."""
+        if not self.rate:
+            return
+        # Amounts larger than the bucket go through once it is full and are paid back by later callers
+        needed = min(amount, self.capacity)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= needed:
+                    self._tokens -= amount
+                    return
+                wait = (needed - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def requests_get(url, **kwargs):
+    """
+    Wrapper for requests.get using a pooled keep-alive session.
+
+    All keyword arguments are passed through to Session.get().
+    Proxies and transport retries are configured on the session,
+    and HTTP_TIMEOUT is applied when no timeout is given.
+
+    Returns:
+        requests.Response: Response object from Session.get()
+    """
+    kwargs.setdefault('timeout', getattr(settings, 'HTTP_TIMEOUT', 15))
+    return get_session(url).get(url, **kwargs)
@@ -0,0 +1,24 @@
+from django.core.management.base import BaseCommand
+from catalog.plex_utils import backfill_guid_mappings
+
+
+class Command(BaseCommand):
+    help = 'Learn Plex GUID to TMDB ID mappings from stored Plex webhook events'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Events read and mappings written per batch',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Mining stored Plex webhook events for GUID mappings...')
+
+        created = backfill_guid_mappings(chunk_size=options['chunk_size'])
+
+        if created > 0:
+            self.stdout.write(self.style.SUCCESS(f'Learned {created} new Plex GUID mappings'))
+        else:
+            self.stdout.write('No new Plex GUID mappings found')
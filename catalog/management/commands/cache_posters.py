@@ -1,7 +1,10 @@
 from django.core.management.base import BaseCommand
 from django.db.models import Q
 from catalog.models import Movie
-from catalog.poster_cache import download_tmdb_poster
+from catalog.poster_cache import (
+    download_tmdb_poster, cache_posters_bulk, derive_poster_sizes, enabled_poster_formats, poster_encoding,
+    size_width, transcode_poster,
+)
 from catalog.logger import logger
 
 
@@ -25,8 +28,41 @@ class Command(BaseCommand):
             action='store_true',
             help='Force re-download even if cached',
         )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Download concurrently with this many threads and save in batches',
+        )
+        parser.add_argument(
+            '--per-host',
+            type=int,
+            default=None,
+            help='Concurrent requests per host with --workers (default: POSTER_DOWNLOAD_PER_HOST)',
+        )
+        parser.add_argument(
+            '--max-kbps',
+            type=int,
+            default=None,
+            help='Cap total download rate in KiB/s with --workers (default: POSTER_DOWNLOAD_MAX_KBPS)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Movies saved per database update with --workers or --transcode',
+        )
+        parser.add_argument(
+            '--transcode',
+            action='store_true',
+            help='Transcode already cached posters to POSTER_FORMATS without downloading',
+        )
 
     def handle(self, *args, **options):
+        if options['transcode']:
+            self.transcode(options)
+            return
+        
         self.stdout.write(self.style.NOTICE('Starting poster caching...'))
         
         if options['all']:
@@ -45,6 +81,10 @@ class Command(BaseCommand):
         total = movies.count()
         self.stdout.write(f'Found {total} movies to process')
         
+        if options['workers']:
+            self.cache_concurrently(movies, total, options)
+            return
+        
         success_count = 0
         error_count = 0
         skipped_count = 0
@@ -82,3 +122,87 @@ class Command(BaseCommand):
                 f'\nCompleted: {success_count} cached, {error_count} errors, {skipped_count} skipped'
             )
         )
+
+    def cache_concurrently(self, movies, total, options):
+        skipped = 0
+        done = 0
+
+        def to_download():
+            nonlocal skipped
+            for movie in self.iter_movies(movies):
+                if not options['force'] and movie.poster_file and not movie.needs_poster_refresh():
+                    skipped += 1
+                    continue
+                yield movie
+
+        def report(movie, error):
+            nonlocal done
+            done += 1
+            if error is None:
+                self.stdout.write(f'[{done + skipped}/{total}] ✓ {movie.title}')
+            else:
+                self.stdout.write(self.style.WARNING(f'[{done + skipped}/{total}] ✗ {movie.title}: {error}'))
+
+        max_kbps = options['max_kbps']
+        stats = cache_posters_bulk(
+            to_download(),
+            workers=options['workers'],
+            per_host=options['per_host'],
+            max_bytes_per_sec=None if max_kbps is None else max_kbps * 1024,
+            batch_size=options['batch_size'],
+            on_result=report,
+        )
+
+        elapsed = stats['elapsed'] or 1e-9
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"\nCompleted: {stats['cached']} cached, {stats['errors']} errors, {skipped} skipped"
+            )
+        )
+        self.stdout.write(
+            f"Throughput: {(stats['cached'] + stats['errors']) / elapsed:.1f} posters/s, "
+            f"{stats['bytes'] / 1024 / 1024 / elapsed:.2f} MB/s over {stats['elapsed']:.1f}s"
+        )
+
+    def iter_movies(self, movies):
+        pks = list(movies.values_list('pk', flat=True))
+        # Load in chunks by primary key: the batched saves must not run under an open cursor
+        for start in range(0, len(pks), 500):
+            yield from Movie.objects.filter(pk__in=pks[start:start + 500])
+
+    def transcode(self, options):
+        formats = enabled_poster_formats()
+        if not formats:
+            self.stdout.write(self.style.WARNING('No usable formats in POSTER_FORMATS, nothing to transcode'))
+            return
+        self.stdout.write(self.style.NOTICE(f"Transcoding cached posters to {', '.join(formats)}..."))
+
+        movies = Movie.objects.exclude(Q(poster_file='') | Q(poster_file__isnull=True))
+        if options['limit']:
+            movies = movies[:options['limit']]
+
+        encoding = poster_encoding()
+        transcoded = 0
+        skipped = 0
+        batch = []
+        for movie in self.iter_movies(movies):
+            if not movie.poster_sizes:
+                # Cached before sizes were derived locally; re-cache it to transcode
+                skipped += 1
+                continue
+            if movie.poster_encoding != encoding:
+                # Resized under other settings; re-derive the sizes so all copies share one encoding
+                derive_poster_sizes(movie, max(movie.poster_sizes, key=size_width))
+            else:
+                transcode_poster(movie)
+            if movie.poster_formats == formats:
+                transcoded += 1
+            batch.append(movie)
+            if len(batch) >= options['batch_size']:
+                Movie.objects.bulk_update(batch, ['poster_sizes', 'poster_formats', 'poster_encoding'])
+                batch.clear()
+        Movie.objects.bulk_update(batch, ['poster_sizes', 'poster_formats', 'poster_encoding'])
+
+        self.stdout.write(
+            self.style.SUCCESS(f'\nCompleted: {transcoded} transcoded, {skipped} skipped (no local sizes)')
+        )
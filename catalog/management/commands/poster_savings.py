@@ -0,0 +1,53 @@
+from django.core.management.base import BaseCommand
+from catalog.poster_cache import poster_format_savings, size_width
+
+
+def _size(num_bytes):
+    return f'{num_bytes / 1024 / 1024:.1f} MB' if num_bytes >= 1024 * 1024 else f'{num_bytes / 1024:.1f} KiB'
+
+
+class Command(BaseCommand):
+    help = 'Show bytes saved by transcoded poster formats compared to JPEG'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--page-size',
+            type=int,
+            default=20,
+            help='Posters per library page for the per-page estimate',
+        )
+
+    def handle(self, *args, **options):
+        savings = poster_format_savings()
+
+        self.stdout.write('\n=== Poster Format Savings ===')
+        if not savings:
+            self.stdout.write('No transcoded posters found (set POSTER_FORMATS and run cache_posters --transcode)')
+            return
+
+        totals = {}
+        for (fmt, size), row in sorted(savings.items(), key=lambda item: (item[0][0], size_width(item[0][1]))):
+            saved = row['jpeg_bytes'] - row['bytes']
+            self.stdout.write(
+                f"{fmt:<5} {size:<5} {row['files']:>6} files  JPEG {_size(row['jpeg_bytes']):>10} -> "
+                f"{_size(row['bytes']):>10}  ({saved / row['jpeg_bytes'] * 100:.1f}% saved)"
+            )
+            total = totals.setdefault(fmt, {'jpeg_bytes': 0, 'bytes': 0})
+            total['jpeg_bytes'] += row['jpeg_bytes']
+            total['bytes'] += row['bytes']
+
+        for fmt, total in totals.items():
+            saved = total['jpeg_bytes'] - total['bytes']
+            self.stdout.write(self.style.SUCCESS(
+                f"Total {fmt}: {_size(saved)} saved of {_size(total['jpeg_bytes'])} ({saved / total['jpeg_bytes'] * 100:.1f}%)"
+            ))
+
+        # Library pages render w200 posters
+        page = options['page_size']
+        for (fmt, size), row in savings.items():
+            if size == 'w200':
+                self.stdout.write(
+                    f"Library page of {page} posters, {fmt}: {_size(row['jpeg_bytes'] / row['files'] * page)} -> "
+                    f"{_size(row['bytes'] / row['files'] * page)}"
+                )
+        self.stdout.write('=' * 29 + '\n')
@@ -0,0 +1,80 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+from catalog.plex_utils import prune_webhook_events, compact_webhook_events
+
+
+class Command(BaseCommand):
+    help = 'Prune old Plex webhook events and reclaim database space'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days',
+            type=int,
+            default=None,
+            help='Remove handled events older than this many days (default: PLEX_EVENT_RETENTION_DAYS)',
+        )
+        parser.add_argument(
+            '--max-per-user',
+            type=int,
+            default=None,
+            help='Keep at most this many events per user (default: PLEX_EVENT_MAX_PER_USER)',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=500,
+            help='Rows deleted per transaction',
+        )
+        parser.add_argument(
+            '--compact',
+            action='store_true',
+            help='Also strip stored payloads down to the fields NestFlix uses',
+        )
+        parser.add_argument(
+            '--no-vacuum',
+            action='store_true',
+            help='Skip reclaiming free pages from the SQLite file',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Pruning Plex webhook events...')
+
+        result = prune_webhook_events(
+            max_age_days=options['days'],
+            max_per_user=options['max_per_user'],
+            chunk_size=options['chunk_size'],
+        )
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Removed {result['expired']} expired events and {result['over_cap']} events over the per-user cap"
+            )
+        )
+
+        if options['compact']:
+            compacted = compact_webhook_events(chunk_size=options['chunk_size'])
+            self.stdout.write(self.style.SUCCESS(f'Compacted {compacted} stored payloads'))
+
+        if not options['no_vacuum']:
+            self.vacuum()
+
+    def vacuum(self):
+        if connection.vendor != 'sqlite':
+            return
+        if connection.in_atomic_block:
+            self.stdout.write(self.style.WARNING('Skipping VACUUM inside a transaction'))
+            return
+
+        with connection.cursor() as cursor:
+            cursor.execute('PRAGMA freelist_count')
+            free_pages = cursor.fetchone()[0]
+            cursor.execute('PRAGMA auto_vacuum')
+            if cursor.fetchone()[0] != 2:
+                # Switching to incremental mode needs one full VACUUM; later runs are incremental
+                self.stdout.write('Enabling incremental auto-vacuum (one-time full VACUUM)...')
+                cursor.execute('PRAGMA auto_vacuum = INCREMENTAL')
+                cursor.execute('VACUUM')
+            else:
+                cursor.execute('PRAGMA incremental_vacuum')
+                cursor.fetchall()
+
+        self.stdout.write(f'Reclaimed {free_pages} free database pages')
@@ -0,0 +1,54 @@
+from django.core.management.base import BaseCommand
+from catalog.plex_utils import replay_webhook_events
+
+
+class Command(BaseCommand):
+    help = 'Re-process stored Plex webhook events that failed or are still pending'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            action='append',
+            dest='users',
+            help='Only replay events of this username (can be repeated)',
+        )
+        parser.add_argument(
+            '--failed-only',
+            action='store_true',
+            help='Skip events still waiting for the background worker',
+        )
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=200,
+            help='Events processed per transaction',
+        )
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=None,
+            help='Parallel users and TMDB requests (default: TMDB_IMPORT_WORKERS)',
+        )
+
+    def handle(self, *args, **options):
+        self.stdout.write('Replaying Plex webhook events...')
+
+        stats = replay_webhook_events(
+            usernames=options['users'],
+            include_pending=not options['failed_only'],
+            chunk_size=options['chunk_size'],
+            workers=options['workers'],
+        )
+
+        if not stats['events']:
+            self.stdout.write('No Plex events to replay')
+            return
+
+        rate = stats['events'] / stats['elapsed'] if stats['elapsed'] else 0
+        self.stdout.write(
+            self.style.SUCCESS(
+                f"Replayed {stats['events']} events for {stats['users']} users: "
+                f"{stats['processed']} processed, {stats['events'] - stats['processed']} still failing"
+            )
+        )
+        self.stdout.write(f"{stats['elapsed']:.1f}s, {rate:.1f} events/s")
@@ -0,0 +1,38 @@
+from django.core.management.base import BaseCommand
+from catalog.plex_utils import get_webhook_stats, reset_webhook_stats
+from catalog.tmdb_client import get_details_cache_stats, reset_details_cache_stats
+
+
+class Command(BaseCommand):
+    help = 'Show runtime counters summed over all processes (web workers and process_tasks)'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Reset the counters after showing them',
+        )
+
+    def handle(self, *args, **options):
+        webhooks = get_webhook_stats()
+        received = webhooks['received']
+        self.stdout.write('\n=== Plex Webhooks ===')
+        for stat in ('received', 'queued', 'ignored', 'suppressed'):
+            share = f" ({webhooks[stat] / received * 100:.1f}%)" if received and stat != 'received' else ''
+            self.stdout.write(f'{stat.capitalize():<11} {webhooks[stat]}{share}')
+        self.stdout.write('=' * 21 + '\n')
+
+        details = get_details_cache_stats()
+        hits = details['memory_hits'] + details['store_hits'] + details['stale_hits']
+        lookups = hits + details['misses']
+        self.stdout.write('=== TMDB Details Cache ===')
+        for stat in ('memory_hits', 'store_hits', 'stale_hits', 'misses', 'refreshes'):
+            self.stdout.write(f"{stat.replace('_', ' ').capitalize():<12} {details[stat]}")
+        if lookups:
+            self.stdout.write(f'Hit rate     {hits / lookups * 100:.1f}%')
+        self.stdout.write('=' * 26 + '\n')
+
+        if options['reset']:
+            reset_webhook_stats()
+            reset_details_cache_stats()
+            self.stdout.write(self.style.SUCCESS('Counters reset'))
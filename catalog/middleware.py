@@ -1,4 +1,25 @@
+import re
+from pathlib import Path
+from urllib.parse import urlsplit
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.http import FileResponse, HttpResponse, HttpResponseNotModified
 from django.utils import translation
+from django.utils.http import http_date, parse_etags, parse_http_date_safe
+
+# tmdb_<id>_<size>[.<hash>[-<encoding>]].<format>, see poster_cache.poster_name
+POSTER_NAME_RE = re.compile(r'^tmdb_\d+_w\d+(?:\.(?P<hash>[0-9a-f]{12})(?:-[0-9a-f]{8})?)?\.(?P<format>jpg|webp|avif)$')
+POSTER_CONTENT_TYPES = {
+    'jpg': 'image/jpeg',
+    'webp': 'image/webp',
+    'avif': 'image/avif',
+}
+POSTER_SENDFILE_HEADERS = {
+    'x-accel-redirect': 'X-Accel-Redirect',
+    'x-sendfile': 'X-Sendfile',
+}
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
 
 
 class UserLanguageMiddleware:
@@ -18,3 +39,128 @@ class UserLanguageMiddleware:
         response = self.get_response(request)
         translation.deactivate()
         return response
+
+
+def _parse_range(header, size):
+    """
+    First and last byte of a single `bytes=` range, both inclusive
+
+    Returns None for headers that are ignored and answered with the full
+    file (multiple ranges, other units, malformed); raises ValueError for
+    ranges outside the file.
+    """
+    match = RANGE_RE.match(header.strip())
+    if not match:
+        return None
+    first, last = match.groups()
+    if first:
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and end < start:
+            return None
+    elif last:
+        if not int(last):
+            raise ValueError('Empty suffix range')
+        start = max(size - int(last), 0)
+        end = size - 1
+    else:
+        return None
+    if start >= size:
+        raise ValueError('Range starts after the end of the file')
+    return start, min(end, size - 1)
+
+
+class PosterServingMiddleware:
+    """
+    Serve cached posters from MEDIA_ROOT/posters in production
+
+    Placed right after WhiteNoiseMiddleware, poster hits return before
+    sessions, auth and locale are touched. Content-hashed names are cached
+    by browsers for a year as immutable, legacy names for POSTER_MAX_AGE.
+    ETags follow nginx's "<mtime>-<size>" format, so they stay the same
+    when POSTER_SENDFILE hands the body to the front proxy; without it
+    conditional and single-range requests are answered here. Anything
+    that is not a known poster name falls through to the URLconf.
+    """
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        self.prefix = urlsplit(settings.MEDIA_URL).path + 'posters/'
+        self.root = Path(settings.MEDIA_ROOT) / 'posters'
+        self.max_age = getattr(settings, 'POSTER_MAX_AGE', 86400)
+        sendfile = getattr(settings, 'POSTER_SENDFILE', '').lower()
+        if sendfile and sendfile not in POSTER_SENDFILE_HEADERS:
+            raise ImproperlyConfigured(
+                f"POSTER_SENDFILE must be one of {', '.join(POSTER_SENDFILE_HEADERS)}, not '{sendfile}'"
+            )
+        self.sendfile_header = POSTER_SENDFILE_HEADERS.get(sendfile)
+        self.sendfile_prefix = getattr(settings, 'POSTER_SENDFILE_PREFIX', '/protected-posters/')
+
+    def __call__(self, request):
+        if request.method in ('GET', 'HEAD') and request.path_info.startswith(self.prefix):
+            match = POSTER_NAME_RE.match(request.path_info[len(self.prefix):])
+            if match:
+                response = self.serve(request, match)
+                if response is not None:
+                    return response
+        return self.get_response(request)
+
+    def serve(self, request, match):
+        path = self.root / match.group(0)
+        try:
+            stat = path.stat()
+        except OSError:
+            return None
+        mtime = int(stat.st_mtime)
+        etag = f'"{mtime:x}-{stat.st_size:x}"'
+        headers = {
+            'Cache-Control': IMMUTABLE_CACHE_CONTROL if match['hash'] else f'public, max-age={self.max_age}',
+            'ETag': etag,
+            'Last-Modified': http_date(mtime),
+        }
+
+        if self.sendfile_header:
+            # The proxy reads the file and handles conditional and range requests itself
+            response = HttpResponse(content_type=POSTER_CONTENT_TYPES[match['format']], headers=headers)
+            if self.sendfile_header == 'X-Accel-Redirect':
+                response[self.sendfile_header] = self.sendfile_prefix + match.group(0)
+            else:
+                response[self.sendfile_header] = str(path)
+            return response
+
+        if_none_match = request.META.get('HTTP_IF_NONE_MATCH')
+        if if_none_match is not None:
+            etags = [tag.removeprefix('W/') for tag in parse_etags(if_none_match)]
+            not_modified = etag in etags or '*' in etags
+        else:
+            modified_since = parse_http_date_safe(request.META.get('HTTP_IF_MODIFIED_SINCE'))
+            not_modified = modified_since is not None and mtime <= modified_since
+        if not_modified:
+            return HttpResponseNotModified(headers=headers)
+
+        headers['Accept-Ranges'] = 'bytes'
+        byte_range = None
+        if_range = request.META.get('HTTP_IF_RANGE')
+        if 'HTTP_RANGE' in request.META and (if_range is None or if_range in (etag, headers['Last-Modified'])):
+            try:
+                byte_range = _parse_range(request.META['HTTP_RANGE'], stat.st_size)
+            except ValueError:
+                headers['Content-Range'] = f'bytes */{stat.st_size}'
+                return HttpResponse(status=416, headers=headers)
+
+        content_type = POSTER_CONTENT_TYPES[match['format']]
+        if byte_range:
+            start, end = byte_range
+            headers['Content-Range'] = f'bytes {start}-{end}/{stat.st_size}'
+            # Posters are small enough to read the requested part into memory
+            with path.open('rb') as poster:
+                poster.seek(start)
+                body = b'' if request.method == 'HEAD' else poster.read(end - start + 1)
+            response = HttpResponse(body, status=206, content_type=content_type, headers=headers)
+            response['Content-Length'] = end - start + 1
+            return response
+        if request.method == 'HEAD':
+            response = HttpResponse(content_type=content_type, headers=headers)
+            response['Content-Length'] = stat.st_size
+            return response
+        return FileResponse(path.open('rb'), content_type=content_type, headers=headers)
@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-16 21:15
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0010_movie_poster_cached_at_movie_poster_file'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='data_fetched_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='TMDB Data Fetched At'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='data_hash',
+            field=models.CharField(blank=True, max_length=64, verbose_name='TMDB Data Hash'),
+        ),
+        migrations.AddField(
+            model_name='movie',
+            name='data_language',
+            field=models.CharField(blank=True, max_length=10, verbose_name='TMDB Data Language'),
+        ),
+    ]
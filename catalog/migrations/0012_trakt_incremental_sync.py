@@ -0,0 +1,23 @@
+# Generated by Django 5.2.6 on 2026-10-16 21:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0011_movie_data_freshness'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importtask',
+            name='mode',
+            field=models.CharField(choices=[('full', 'Полный импорт'), ('incremental', 'Только новое')], default='full', max_length=20),
+        ),
+        migrations.AddField(
+            model_name='usersettings',
+            name='trakt_last_synced_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Trakt.tv Last Synced'),
+        ),
+    ]
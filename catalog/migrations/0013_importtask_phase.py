@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-16 21:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0012_trakt_incremental_sync'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='importtask',
+            name='phase',
+            field=models.CharField(blank=True, choices=[('fetching', 'Получение данных Trakt'), ('importing', 'Загрузка в библиотеку')], max_length=20),
+        ),
+    ]
@@ -0,0 +1,32 @@
+# Generated by Django 5.2.6 on 2026-10-16 21:24
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def mark_existing_processed(apps, schema_editor):
+    # Events received before the queue existed were handled inline
+    PlexWebhookEvent = apps.get_model('catalog', 'PlexWebhookEvent')
+    PlexWebhookEvent.objects.filter(processed_at__isnull=True).update(processed_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0013_importtask_phase'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plexwebhookevent',
+            name='processed_at',
+            field=models.DateTimeField(blank=True, null=True, verbose_name='Processed At'),
+        ),
+        migrations.RunPython(mark_existing_processed, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='plexwebhookevent',
+            index=models.Index(fields=['user', 'processed_at'], name='plexevent_user_pending_idx'),
+        ),
+    ]
@@ -0,0 +1,42 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:20
+
+import django.utils.timezone
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def copy_created_at(apps, schema_editor):
+    PlexWebhookEvent = apps.get_model('catalog', 'PlexWebhookEvent')
+    PlexWebhookEvent.objects.update(last_seen_at=F('created_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0014_plex_event_queue'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plexwebhookevent',
+            name='dedup_key',
+            field=models.CharField(blank=True, max_length=255, verbose_name='Dedup Key'),
+        ),
+        migrations.AddField(
+            model_name='plexwebhookevent',
+            name='last_seen_at',
+            field=models.DateTimeField(default=django.utils.timezone.now, verbose_name='Last Seen At'),
+        ),
+        migrations.AddField(
+            model_name='plexwebhookevent',
+            name='repeat_count',
+            field=models.PositiveIntegerField(default=1, verbose_name='Repeat Count'),
+        ),
+        migrations.RunPython(copy_created_at, migrations.RunPython.noop),
+        migrations.AddIndex(
+            model_name='plexwebhookevent',
+            index=models.Index(fields=['user', 'dedup_key', 'last_seen_at'], name='plexevent_dedup_idx'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:22
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0015_plex_event_dedup'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='plexwebhookevent',
+            name='raw_payload',
+            field=models.BinaryField(blank=True, null=True, verbose_name='Raw Payload'),
+        ),
+    ]
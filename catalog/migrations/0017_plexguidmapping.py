@@ -0,0 +1,28 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:25
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0016_plex_event_raw_payload'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='PlexGuidMapping',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('plex_guid', models.CharField(max_length=255, unique=True, verbose_name='Plex GUID')),
+                ('media_type', models.CharField(max_length=10, verbose_name='Media Type')),
+                ('tmdb_id', models.IntegerField(verbose_name='TMDB ID')),
+                ('created_at', models.DateTimeField(default=django.utils.timezone.now, verbose_name='Created At')),
+            ],
+            options={
+                'verbose_name': 'Plex GUID Mapping',
+                'verbose_name_plural': 'Plex GUID Mappings',
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:37
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0017_plexguidmapping'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='EpisodeWatch',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('season', models.PositiveSmallIntegerField()),
+                ('episode', models.PositiveSmallIntegerField()),
+                ('watched_at', models.DateTimeField()),
+                ('show', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.movie')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'show', 'season', 'episode', 'watched_at')},
+            },
+        ),
+        migrations.CreateModel(
+            name='ShowProgress',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('episodes_watched', models.PositiveIntegerField(default=0)),
+                ('watch_count', models.PositiveIntegerField(default=0)),
+                ('last_season', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('last_episode', models.PositiveSmallIntegerField(blank=True, null=True)),
+                ('last_watched_at', models.DateTimeField(blank=True, null=True)),
+                ('show', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.movie')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+            options={
+                'unique_together': {('user', 'show')},
+            },
+        ),
+    ]
@@ -0,0 +1,70 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:42
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import F
+
+
+def seed_watch_history(apps, schema_editor):
+    UserRating = apps.get_model('catalog', 'UserRating')
+    WatchEvent = apps.get_model('catalog', 'WatchEvent')
+    watched = UserRating.objects.filter(watched_at__isnull=False)
+    WatchEvent.objects.bulk_create(
+        (WatchEvent(user_id=rating.user_id, movie_id=rating.movie_id, watched_at=rating.watched_at)
+         for rating in watched.only('user_id', 'movie_id', 'watched_at').iterator()),
+        batch_size=500,
+    )
+    watched.update(play_count=1, first_watched_at=F('watched_at'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0018_episode_watches'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='WatchEvent',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('watched_at', models.DateTimeField()),
+                ('source', models.CharField(blank=True, choices=[('plex', 'Plex'), ('trakt', 'Trakt'), ('manual', 'Manual')], max_length=10)),
+            ],
+        ),
+        migrations.AddField(
+            model_name='userrating',
+            name='first_watched_at',
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name='userrating',
+            name='play_count',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name='userrating',
+            index=models.Index(fields=['user', '-watched_at', '-created_at'], name='userrating_library_idx'),
+        ),
+        migrations.AddField(
+            model_name='watchevent',
+            name='movie',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='catalog.movie'),
+        ),
+        migrations.AddField(
+            model_name='watchevent',
+            name='user',
+            field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL),
+        ),
+        migrations.AddIndex(
+            model_name='watchevent',
+            index=models.Index(fields=['user', '-watched_at'], name='watchevent_user_time_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='watchevent',
+            unique_together={('user', 'movie', 'watched_at')},
+        ),
+        migrations.RunPython(seed_watch_history, migrations.RunPython.noop),
+    ]
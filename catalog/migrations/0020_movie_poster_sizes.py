@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-16 22:57
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0019_watch_events'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='poster_sizes',
+            field=models.JSONField(blank=True, default=list, verbose_name='Cached Poster Sizes'),
+        ),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0020_movie_poster_sizes'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='poster_formats',
+            field=models.JSONField(blank=True, default=list, verbose_name='Cached Poster Formats'),
+        ),
+    ]
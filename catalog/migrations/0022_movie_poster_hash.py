@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:40
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0021_movie_poster_formats'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='poster_hash',
+            field=models.CharField(blank=True, max_length=12, verbose_name='Cached Poster Hash'),
+        ),
+    ]
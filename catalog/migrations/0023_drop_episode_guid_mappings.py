@@ -0,0 +1,36 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:50
+
+import re
+
+from django.db import migrations
+
+TMDB_GUID_RE = re.compile(r'(?:^tmdb|themoviedb)://(\d+)')
+
+
+def drop_tv_mappings(apps, schema_editor):
+    # Show mappings were learned from episode Guid arrays, i.e. episode IDs; they are relearned on
+    # demand. A mapping matching the Guid array of a stored show-level event (e.g. one entered in
+    # the admin) is correct and kept.
+    PlexGuidMapping = apps.get_model('catalog', 'PlexGuidMapping')
+    PlexWebhookEvent = apps.get_model('catalog', 'PlexWebhookEvent')
+    confirmed = set()
+    for metadata in PlexWebhookEvent.objects.filter(payload__Metadata__type='show').values_list(
+            'payload__Metadata', flat=True).iterator():
+        for guid_obj in metadata.get('Guid') or []:
+            match = TMDB_GUID_RE.search(guid_obj.get('id') or '')
+            if match:
+                confirmed.add((metadata.get('guid', '')[:255], int(match.group(1))))
+    for mapping in PlexGuidMapping.objects.filter(media_type='tv').iterator():
+        if (mapping.plex_guid, mapping.tmdb_id) not in confirmed:
+            mapping.delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0022_movie_poster_hash'),
+    ]
+
+    operations = [
+        migrations.RunPython(drop_tv_mappings, migrations.RunPython.noop),
+    ]
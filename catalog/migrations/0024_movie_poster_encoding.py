@@ -0,0 +1,18 @@
+# Generated by Django 5.2.6 on 2026-10-16 23:29
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0023_drop_episode_guid_mappings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='movie',
+            name='poster_encoding',
+            field=models.CharField(blank=True, max_length=8, verbose_name='Cached Poster Encoding'),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 5.2.6 on 2026-10-17 00:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('catalog', '0024_movie_poster_encoding'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='StatCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('name', models.CharField(max_length=100, unique=True, verbose_name='Name')),
+                ('value', models.BigIntegerField(default=0, verbose_name='Value')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='Updated At')),
+            ],
+            options={
+                'verbose_name': 'Stat Counter',
+                'verbose_name_plural': 'Stat Counters',
+                'ordering': ['name'],
+            },
+        ),
+    ]
@@ -1,3 +1,8 @@
+import hashlib
+import json
+import zlib
+from datetime import timedelta
+from django.conf import settings
 from django.db import models
 from django.contrib.auth.models import User
 from django.utils import timezone
@@ -19,9 +24,55 @@ class Movie(models.Model):
         blank=True,
         verbose_name="Poster Cache Date"
     )
+    # TMDB size names cached locally as posters/tmdb_<id>_<size>.<hash>.jpg, master included
+    poster_sizes = models.JSONField(default=list, blank=True, verbose_name="Cached Poster Sizes")
+    # Formats besides JPEG (e.g. 'avif', 'webp') every cached size is also stored in
+    poster_formats = models.JSONField(default=list, blank=True, verbose_name="Cached Poster Formats")
+    # Content hash of the master, part of every cached poster file name so the files can be cached forever
+    poster_hash = models.CharField(max_length=12, blank=True, verbose_name="Cached Poster Hash")
+    # Digest of the resize and encode settings, part of the names of the resized and transcoded copies
+    poster_encoding = models.CharField(max_length=8, blank=True, verbose_name="Cached Poster Encoding")
+    data_fetched_at = models.DateTimeField(null=True, blank=True, verbose_name="TMDB Data Fetched At")
+    data_language = models.CharField(max_length=10, blank=True, verbose_name="TMDB Data Language")
+    data_hash = models.CharField(max_length=64, blank=True, verbose_name="TMDB Data Hash")
 
     def __str__(self):
         return self.title
+
+    @staticmethod
+    def hash_data(data):
+        """Stable SHA-256 of a TMDB payload"""
+        payload = json.dumps(data, sort_keys=True, separators=(',', ':'), ensure_ascii=False)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    @staticmethod
+    def fresh_cutoff():
+        """Oldest data_fetched_at still considered fresh"""
+        return timezone.now() - timedelta(days=getattr(settings, 'TMDB_DATA_FRESH_DAYS', 7))
+
+    def is_data_fresh(self, language):
+        """Check if stored TMDB data was fetched in this language within the freshness window"""
+        if not self.data or not self.data_fetched_at or self.data_language != language:
+            return False
+        return self.data_fetched_at >= self.fresh_cutoff()
+
+    def set_data(self, data, language):
+        """
+        Store a fetched TMDB payload without saving.
+
+        data_fetched_at is the payload's fetched_at when it has one (see
+        tmdb_client.MovieDetails), which is older than now for cached data.
+
+        Returns:
+            bool: True if the payload differs from the stored one
+        """
+        data_hash = self.hash_data(data)
+        changed = data_hash != self.data_hash or not self.data
+        self.data = data
+        self.data_hash = data_hash
+        self.data_language = language
+        self.data_fetched_at = getattr(data, 'fetched_at', None) or timezone.now()
+        return changed
     
     def get_poster_url(self):
         """Get poster URL - local first, then TMDB fallback"""
@@ -35,8 +86,6 @@ class Movie(models.Model):
         """Check if poster cache needs refresh"""
         if not self.poster_cached_at:
             return True
-        from datetime import timedelta
-        from django.conf import settings
         age = timezone.now() - self.poster_cached_at
         return age.days > getattr(settings, 'POSTER_CACHE_DAYS', 30)
 
@@ -45,19 +94,82 @@ class UserRating(models.Model):
     movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
     rating = models.PositiveSmallIntegerField(null=True, blank=True, choices=[(i, i) for i in range(1, 11)])
     created_at = models.DateTimeField(default=timezone.now)
+    # Last watch; watched_at, first_watched_at and play_count are maintained from WatchEvent
     watched_at = models.DateTimeField(null=True, blank=True)
+    first_watched_at = models.DateTimeField(null=True, blank=True)
+    play_count = models.PositiveIntegerField(default=0)
 
     class Meta:
         unique_together = ('user', 'movie')
+        indexes = [
+            models.Index(fields=['user', '-watched_at', '-created_at'], name='userrating_library_idx'),
+        ]
 
     def __str__(self):
         return f"{self.user.username} - {self.movie.title}"
 
+class WatchEvent(models.Model):
+    """One watch of a movie or show; rows are only ever added"""
+    SOURCE_PLEX = 'plex'
+    SOURCE_TRAKT = 'trakt'
+    SOURCE_MANUAL = 'manual'
+    SOURCE_CHOICES = [
+        (SOURCE_PLEX, 'Plex'),
+        (SOURCE_TRAKT, 'Trakt'),
+        (SOURCE_MANUAL, 'Manual'),
+    ]
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    movie = models.ForeignKey(Movie, on_delete=models.CASCADE)
+    watched_at = models.DateTimeField()
+    # Blank for watches carried over from UserRating.watched_at when history was introduced
+    source = models.CharField(max_length=10, choices=SOURCE_CHOICES, blank=True)
+
+    class Meta:
+        unique_together = ('user', 'movie', 'watched_at')
+        indexes = [
+            models.Index(fields=['user', '-watched_at'], name='watchevent_user_time_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.user.username} - {self.movie.title} ({self.watched_at:%Y-%m-%d})"
+
+class EpisodeWatch(models.Model):
+    """One watch of a TV episode; rows are only ever added"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    show = models.ForeignKey(Movie, on_delete=models.CASCADE)
+    season = models.PositiveSmallIntegerField()
+    episode = models.PositiveSmallIntegerField()
+    watched_at = models.DateTimeField()
+
+    class Meta:
+        unique_together = ('user', 'show', 'season', 'episode', 'watched_at')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.show.title} S{self.season:02d}E{self.episode:02d}"
+
+class ShowProgress(models.Model):
+    """Per-show rollup of a user's EpisodeWatch rows, kept up to date as watches are recorded"""
+    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    show = models.ForeignKey(Movie, on_delete=models.CASCADE)
+    episodes_watched = models.PositiveIntegerField(default=0)
+    watch_count = models.PositiveIntegerField(default=0)
+    last_season = models.PositiveSmallIntegerField(null=True, blank=True)
+    last_episode = models.PositiveSmallIntegerField(null=True, blank=True)
+    last_watched_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        unique_together = ('user', 'show')
+
+    def __str__(self):
+        return f"{self.user.username} - {self.show.title}: {self.episodes_watched} episodes"
+
 class UserSettings(models.Model):
     user = models.OneToOneField(User, on_delete=models.CASCADE)
     tmdb_api_key = models.CharField(max_length=100, blank=True, verbose_name="TMDB API Key")
     trakt_username = models.CharField(max_length=50, blank=True, verbose_name="Trakt.tv Username")
     trakt_client_id = models.CharField(max_length=100, blank=True, verbose_name="Trakt.tv Client ID")
+    trakt_last_synced_at = models.DateTimeField(null=True, blank=True, verbose_name="Trakt.tv Last Synced")
     plex_webhook_token = models.CharField(max_length=64, blank=True, unique=True, null=True, verbose_name="Plex Webhook Token")
     plex_webhook_enabled = models.BooleanField(default=False, verbose_name="Plex Webhook Enabled")
     plex_webhook_created_at = models.DateTimeField(null=True, blank=True, verbose_name="Plex Webhook Created")
@@ -95,10 +207,20 @@ class ImportTask(models.Model):
         ('completed', 'Завершено'),
         ('failed', 'Ошибка'),
     ]
+    MODE_CHOICES = [
+        ('full', 'Полный импорт'),
+        ('incremental', 'Только новое'),
+    ]
+    PHASE_CHOICES = [
+        ('fetching', 'Получение данных Trakt'),
+        ('importing', 'Загрузка в библиотеку'),
+    ]
 
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     task_id = models.CharField(max_length=100, unique=True)
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='pending')
+    mode = models.CharField(max_length=20, choices=MODE_CHOICES, default='full')
+    phase = models.CharField(max_length=20, choices=PHASE_CHOICES, blank=True)
     progress = models.IntegerField(default=0)
     total_items = models.IntegerField(default=0)
     imported_count = models.IntegerField(default=0)
@@ -113,15 +235,62 @@ class ImportTask(models.Model):
 class PlexWebhookEvent(models.Model):
     user = models.ForeignKey(User, on_delete=models.CASCADE)
     event_type = models.CharField(max_length=50, verbose_name="Event Type")
+    # Only the fields processing needs; the full payload is kept compressed when enabled
     payload = models.JSONField(verbose_name="Payload")
+    raw_payload = models.BinaryField(null=True, blank=True, verbose_name="Raw Payload")
     processed = models.BooleanField(default=False, verbose_name="Processed")
+    processed_at = models.DateTimeField(null=True, blank=True, verbose_name="Processed At")
     error_message = models.TextField(blank=True, verbose_name="Error Message")
+    # Repeats of the same event for the same item are collapsed into one row
+    dedup_key = models.CharField(max_length=255, blank=True, verbose_name="Dedup Key")
+    repeat_count = models.PositiveIntegerField(default=1, verbose_name="Repeat Count")
     created_at = models.DateTimeField(default=timezone.now, verbose_name="Created At")
+    last_seen_at = models.DateTimeField(default=timezone.now, verbose_name="Last Seen At")
 
     class Meta:
         ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['user', 'processed_at'], name='plexevent_user_pending_idx'),
+            models.Index(fields=['user', 'dedup_key', 'last_seen_at'], name='plexevent_dedup_idx'),
+        ]
         verbose_name = "Plex Webhook Event"
         verbose_name_plural = "Plex Webhook Events"
 
     def __str__(self):
         return f"{self.user.username} - {self.event_type} - {self.created_at}"
+
+    def set_raw_payload(self, payload):
+        self.raw_payload = zlib.compress(json.dumps(payload, separators=(',', ':')).encode('utf-8'))
+
+    def get_raw_payload(self):
+        if not self.raw_payload:
+            return None
+        return json.loads(zlib.decompress(bytes(self.raw_payload)).decode('utf-8'))
+
+class PlexGuidMapping(models.Model):
+    """TMDB ID learned for a Plex GUID that does not carry one (e.g. plex://movie/...)"""
+    plex_guid = models.CharField(max_length=255, unique=True, verbose_name="Plex GUID")
+    media_type = models.CharField(max_length=10, verbose_name="Media Type")  # 'movie' or 'tv'
+    tmdb_id = models.IntegerField(verbose_name="TMDB ID")
+    created_at = models.DateTimeField(default=timezone.now, verbose_name="Created At")
+
+    class Meta:
+        verbose_name = "Plex GUID Mapping"
+        verbose_name_plural = "Plex GUID Mappings"
+
+    def __str__(self):
+        return f"{self.plex_guid} -> {self.media_type}/{self.tmdb_id}"
+
+class StatCounter(models.Model):
+    """Runtime counter summed over every process, see counters.SharedCounters"""
+    name = models.CharField(max_length=100, unique=True, verbose_name="Name")
+    value = models.BigIntegerField(default=0, verbose_name="Value")
+    updated_at = models.DateTimeField(auto_now=True, verbose_name="Updated At")
+
+    class Meta:
+        verbose_name = "Stat Counter"
+        verbose_name_plural = "Stat Counters"
+        ordering = ['name']
+
+    def __str__(self):
+        return f"{self.name} = {self.value}"
@@ -1,54 +1,154 @@
 import re
+import threading
+import time
+from collections import namedtuple
+from contextlib import nullcontext
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings as django_settings
+from django.contrib.auth.models import User
+from django.db import connection, transaction
+from django.core.files.uploadhandler import FileUploadHandler, SkipFile
+from django.db.models import Count, F, Q
 from django.utils import timezone
-from .models import Movie, UserRating, UserSettings, PlexWebhookEvent
-from .tmdb_client import get_movie_details, get_tmdb_language
+from .models import Movie, UserRating, UserSettings, PlexWebhookEvent, PlexGuidMapping, WatchEvent
+from .tmdb_client import find_show_by_episode, get_movie_details, get_tmdb_language
 from .logger import logger
+from .cache_utils import LRUCache
+from .counters import SharedCounters
+from .watch_history import record_episode_watches, record_watches
 
+SUPPORTED_PLEX_EVENTS = ('media.scrobble', 'media.play', 'media.rate')
 
-def extract_tmdb_id_from_plex_guid(guid, guid_list=None):
+# Metadata fields process_plex_event and deduplication read; everything else is dropped before storage
+COMPACT_METADATA_FIELDS = (
+    'type', 'ratingKey', 'guid', 'Guid', 'title', 'grandparentGuid', 'grandparentTitle', 'userRating',
+    'parentIndex', 'index',
+)
+
+_TMDB_GUID_RE = re.compile(r'(?:^tmdb|themoviedb)://(\d+)')
+
+# Episode IDs in a Plex Guid array that TMDB /find maps to the episode's show
+_EPISODE_FIND_SOURCES = {'tvdb': 'tvdb_id', 'imdb': 'imdb_id'}
+
+# Token -> owner of an enabled webhook; entries are dropped when UserSettings change
+WebhookAuth = namedtuple('WebhookAuth', ['user_id', 'username'])
+_webhook_auth_cache = LRUCache(maxsize=1024, ttl=getattr(django_settings, 'PLEX_WEBHOOK_AUTH_CACHE_TTL', 60))
+_webhook_auth_tokens = {}
+_webhook_auth_lock = threading.Lock()
+
+_webhook_stats = SharedCounters('plex_webhooks', ['received', 'queued', 'ignored', 'suppressed'])
+
+# Unfinished events claimed longer ago than this are treated as failed by replay_webhook_events
+REPLAY_CLAIM_GRACE = timedelta(minutes=10)
+
+
+def _parse_tmdb_guid(guid):
+    match = _TMDB_GUID_RE.search(guid or '')
+    return int(match.group(1)) if match else None
+
+
+def _parse_guid_list(guid_list):
+    for guid_obj in guid_list or []:
+        tmdb_id = _parse_tmdb_guid(guid_obj.get('id', ''))
+        if tmdb_id:
+            return tmdb_id
+    return None
+
+
+def get_webhook_auth(token):
     """
-    Extract TMDB ID from Plex GUID
-    
-    Supported formats:
-    - tmdb://123456
-    - com.plexapp.agents.themoviedb://123456?lang=en
-    - plex://movie/5d776825880197001ec90e31 (not supported, returns None)
-    
-    If guid_list is provided, also search in Guid array from Plex metadata
+    Owner of an enabled Plex webhook token, or None
+
+    Served from an in-process cache; a miss costs one query. Entries are
+    invalidated when the user's settings are saved, and expire after
+    PLEX_WEBHOOK_AUTH_CACHE_TTL seconds to bound staleness in other processes.
     """
-    if not guid:
+    auth = _webhook_auth_cache.get(token)
+    if auth is not None:
+        return auth
+
+    row = (
+        UserSettings.objects.filter(plex_webhook_token=token, plex_webhook_enabled=True)
+        .values_list('user_id', 'user__username')
+        .first()
+    )
+    if row is None:
         return None
-    
-    if guid.startswith('tmdb://'):
-        match = re.search(r'tmdb://(\d+)', guid)
-        if match:
-            return int(match.group(1))
-    
-    if 'themoviedb' in guid:
-        match = re.search(r'themoviedb://(\d+)', guid)
-        if match:
-            return int(match.group(1))
-    
-    # Try to extract from Guid array
-    if guid_list:
-        for guid_obj in guid_list:
-            guid_id = guid_obj.get('id', '')
-            if guid_id.startswith('tmdb://'):
-                match = re.search(r'tmdb://(\d+)', guid_id)
-                if match:
-                    logger.debug(f"Found TMDB ID in Guid array: {match.group(1)}")
-                    return int(match.group(1))
-            if 'themoviedb' in guid_id:
-                match = re.search(r'themoviedb://(\d+)', guid_id)
-                if match:
-                    logger.debug(f"Found TMDB ID in Guid array: {match.group(1)}")
-                    return int(match.group(1))
-    
-    logger.warning(f"Could not parse TMDB ID from Plex GUID: {guid}")
+
+    auth = WebhookAuth(*row)
+    with _webhook_auth_lock:
+        _webhook_auth_tokens[auth.user_id] = token
+        _webhook_auth_cache.set(token, auth)
+    return auth
+
+
+def invalidate_webhook_auth(user_id):
+    """Forget the cached webhook token of a user"""
+    with _webhook_auth_lock:
+        token = _webhook_auth_tokens.pop(user_id, None)
+        if token is not None:
+            _webhook_auth_cache.delete(token)
+
+
+def clear_webhook_auth_cache():
+    with _webhook_auth_lock:
+        _webhook_auth_tokens.clear()
+        _webhook_auth_cache.clear()
+
+
+def _find_show_for_episode(guid_list, api_key):
+    """
+    TMDB ID of an episode's show, looked up on TMDB by the episode's TVDB
+    or IMDb ID. The tmdb:// entry of an episode's Guid array is the
+    episode's own ID and never identifies the show.
+    """
+    for guid_obj in guid_list or []:
+        scheme, _, external_id = guid_obj.get('id', '').partition('://')
+        source = _EPISODE_FIND_SOURCES.get(scheme)
+        if source and external_id:
+            show_id = find_show_by_episode(external_id, source, api_key)
+            if show_id:
+                return show_id
     return None
 
 
-def process_plex_event(user, event, payload):
+def remember_plex_guid(guid, media_type, tmdb_id):
+    """Store the TMDB ID resolved for a Plex GUID that does not carry one"""
+    PlexGuidMapping.objects.update_or_create(
+        plex_guid=guid[:255],
+        defaults={'media_type': media_type, 'tmdb_id': tmdb_id}
+    )
+    logger.debug(f"Learned Plex GUID mapping {guid} -> {media_type}/{tmdb_id}")
+
+
+def resolve_plex_guid(guid, media_type, guid_list=None):
+    """
+    Resolve a Plex GUID to a TMDB ID
+
+    TMDB GUIDs are parsed directly, other GUIDs are looked up in the
+    learned mappings, and only then is the Guid array searched. A GUID
+    resolved through the Guid array is remembered for later events.
+    """
+    if not guid:
+        return None
+
+    tmdb_id = _parse_tmdb_guid(guid)
+    if tmdb_id:
+        return tmdb_id
+
+    tmdb_id = PlexGuidMapping.objects.filter(plex_guid=guid).values_list('tmdb_id', flat=True).first()
+    if tmdb_id:
+        logger.debug(f"Resolved Plex GUID {guid} from learned mapping: {tmdb_id}")
+        return tmdb_id
+
+    tmdb_id = _parse_guid_list(guid_list)
+    if tmdb_id:
+        remember_plex_guid(guid, media_type, tmdb_id)
+    return tmdb_id
+
+
+def process_plex_event(user, event, payload, settings=None, received_at=None):
     """
     Process Plex webhook event and update database
     
@@ -56,13 +156,32 @@ def process_plex_event(user, event, payload):
     - media.scrobble: Mark as watched
     - media.play: Add to collection
     - media.rate: Update rating
+    
+    settings is the user's UserSettings when the caller already has it;
+    received_at is when Plex sent the event (defaults to now) and is used
+    as the watch date of scrobbles.
+
+    Episodes are recorded on their show. The show is resolved from
+    grandparentGuid, directly or through a mapping learned earlier, and
+    otherwise through TMDB by the episode's TVDB or IMDb ID; only that
+    show-level result is remembered for the show GUID.
     """
     metadata = payload.get('Metadata', {})
     
-    if event not in ['media.scrobble', 'media.play', 'media.rate']:
+    if event not in SUPPORTED_PLEX_EVENTS:
         logger.debug(f"Ignoring Plex event: {event}")
         return False
     
+    if settings is None:
+        settings = UserSettings.objects.filter(user=user).first()
+    if settings is None:
+        logger.error(f"UserSettings not found for user {user.username}")
+        return False
+    
+    if not settings.tmdb_api_key:
+        logger.warning(f"User {user.username} has no TMDB API key configured")
+        return False
+    
     guid = metadata.get('guid', '')
     guid_list = metadata.get('Guid', [])
     
@@ -75,12 +194,14 @@ def process_plex_event(user, event, payload):
         # For episodes, TMDB ID should be extracted from show (grandparent)
         show_guid = metadata.get('grandparentGuid', '')
         
-        # Try to extract TMDB ID from show GUID first
-        tmdb_id = extract_tmdb_id_from_plex_guid(show_guid)
+        # Try the show GUID first, directly or through a learned mapping
+        tmdb_id = resolve_plex_guid(show_guid, 'tv')
         
-        # If show GUID is plex:// format, check if episode has Guid array with TMDB
+        # If show GUID is plex:// format, ask TMDB which show the episode belongs to
         if not tmdb_id and guid_list:
-            tmdb_id = extract_tmdb_id_from_plex_guid(guid, guid_list)
+            tmdb_id = _find_show_for_episode(guid_list, settings.tmdb_api_key)
+            if tmdb_id and show_guid:
+                remember_plex_guid(show_guid, 'tv', tmdb_id)
         
         if not tmdb_id:
             logger.warning(f"Could not extract TMDB ID from episode guid: {guid}, show guid: {show_guid}, Guid array: {guid_list}")
@@ -88,55 +209,47 @@ def process_plex_event(user, event, payload):
             
         title_from_plex = metadata.get('grandparentTitle', title_from_plex)
         
-    elif media_type == 'movie':
-        media_type = 'movie'
+    elif media_type in ('movie', 'show'):
+        # Shows carry their own show-level Guid array, e.g. when rated as a whole
+        media_type = 'movie' if media_type == 'movie' else 'tv'
         
-        # Try to extract from movie GUID
-        tmdb_id = extract_tmdb_id_from_plex_guid(guid, guid_list)
+        # Try to extract from the GUID, a learned mapping or the Guid array
+        tmdb_id = resolve_plex_guid(guid, media_type, guid_list)
         
         if not tmdb_id:
-            logger.warning(f"Could not extract TMDB ID from movie guid: {guid}, Guid array: {guid_list}")
+            logger.warning(f"Could not extract TMDB ID from {media_type} guid: {guid}, Guid array: {guid_list}")
             return False
     else:
         logger.warning(f"Unknown Plex media type: {media_type}")
         return False
     
-    try:
-        settings = UserSettings.objects.get(user=user)
-    except UserSettings.DoesNotExist:
-        logger.error(f"UserSettings not found for user {user.username}")
-        return False
-    
-    if not settings.tmdb_api_key:
-        logger.warning(f"User {user.username} has no TMDB API key configured")
-        return False
-    
     user_language = get_tmdb_language(settings.language)
-    logger.debug(f"Fetching TMDB data for {media_type}/{tmdb_id} with language: {user_language}")
-    
-    movie_data = get_movie_details(media_type, tmdb_id, settings.tmdb_api_key, user_language)
-    if not movie_data:
-        logger.error(f"Could not fetch TMDB data for {media_type}/{tmdb_id}")
-        return False
-    
-    title = movie_data.get('title') or movie_data.get('name') or title_from_plex
-    
-    movie, created = Movie.objects.get_or_create(
-        tmdb_id=tmdb_id,
-        media_type=media_type,
-        defaults={
-            'title': title,
-            'data': movie_data
-        }
-    )
+    movie = Movie.objects.filter(tmdb_id=tmdb_id, media_type=media_type).first()
     
-    if not created:
-        movie.data = movie_data
-        movie.title = title
-        movie.save()
-        logger.debug(f"Updated movie data: {title}")
+    if movie and movie.is_data_fresh(user_language):
+        title = movie.title
+        logger.debug(f"TMDB data for {media_type}/{tmdb_id} is fresh, skipping fetch")
     else:
-        logger.info(f"Created new movie: {title}")
+        logger.debug(f"Fetching TMDB data for {media_type}/{tmdb_id} with language: {user_language}")
+        movie_data = get_movie_details(media_type, tmdb_id, settings.tmdb_api_key, user_language)
+        if not movie_data:
+            logger.error(f"Could not fetch TMDB data for {media_type}/{tmdb_id}")
+            return False
+        
+        title = movie_data.get('title') or movie_data.get('name') or title_from_plex
+        
+        if movie is None:
+            movie = Movie(tmdb_id=tmdb_id, media_type=media_type, title=title)
+            movie.set_data(movie_data, user_language)
+            movie.save(force_insert=True)
+            logger.info(f"Created new movie: {title}")
+        elif movie.set_data(movie_data, user_language) or movie.title != title:
+            movie.title = title
+            movie.save()
+            logger.debug(f"Updated movie data: {title}")
+        else:
+            movie.save(update_fields=['data_fetched_at', 'data_language'])
+            logger.debug(f"TMDB data unchanged for {title}")
     
     # Schedule poster caching in background
     if movie.needs_poster_refresh():
@@ -145,24 +258,15 @@ def process_plex_event(user, event, payload):
         logger.debug(f"Scheduled poster caching for {title}")
     
     if event == 'media.scrobble':
-        user_rating, rating_created = UserRating.objects.get_or_create(
-            user=user,
-            movie=movie,
-            defaults={'watched_at': timezone.now()}
-        )
-        
-        if not rating_created:
-            # Update watched_at date on every scrobble event
-            old_watched_at = user_rating.watched_at
-            user_rating.watched_at = timezone.now()
-            user_rating.save()
-            
-            if old_watched_at:
-                logger.info(f"Updated watched date for '{title}' for {user.username} (previous: {old_watched_at.strftime('%Y-%m-%d %H:%M')})")
-            else:
-                logger.info(f"Marked '{title}' as watched for {user.username}")
+        watched_at = received_at or timezone.now()
+        season, episode = metadata.get('parentIndex'), metadata.get('index')
+        if media_type == 'tv' and season is not None and episode is not None:
+            record_episode_watches(user.id, {movie.tmdb_id: [(int(season), int(episode), watched_at)]})
+            logger.info(f"Recorded S{int(season):02d}E{int(episode):02d} of '{title}' for {user.username}")
+        if record_watches(user.id, {movie.tmdb_id: [watched_at]}, WatchEvent.SOURCE_PLEX):
+            logger.info(f"Recorded watch of '{title}' for {user.username}")
         else:
-            logger.info(f"Added '{title}' as watched for {user.username}")
+            logger.debug(f"Watch of '{title}' at {watched_at:%Y-%m-%d %H:%M} already recorded for {user.username}")
             
     elif event == 'media.play':
         user_rating, rating_created = UserRating.objects.get_or_create(
@@ -205,18 +309,480 @@ def process_plex_event(user, event, payload):
     return True
 
 
+def compact_plex_payload(payload):
+    """
+    Reduce a Plex webhook payload to the fields NestFlix uses
+
+    Account, Server and Player blocks and most of Metadata (media parts,
+    genres, cast, images) are dropped; the result is still a valid input
+    for process_plex_event.
+    """
+    metadata = payload.get('Metadata') or {}
+    compact = {'event': payload.get('event', 'unknown')}
+    compact_metadata = {field: metadata[field] for field in COMPACT_METADATA_FIELDS if field in metadata}
+    if compact_metadata:
+        compact['Metadata'] = compact_metadata
+    return compact
+
+
+def _new_webhook_event(user, event_type, payload, **fields):
+    event = PlexWebhookEvent(user=user, event_type=event_type, payload=compact_plex_payload(payload), **fields)
+    if getattr(django_settings, 'PLEX_EVENT_KEEP_RAW_PAYLOAD', False):
+        event.set_raw_payload(payload)
+    event.save(force_insert=True)
+    return event
+
+
 def log_webhook_event(user, event_type, payload, processed=False, error_message=''):
     """
     Log Plex webhook event for audit purposes
     """
     try:
-        PlexWebhookEvent.objects.create(
-            user=user,
-            event_type=event_type,
-            payload=payload,
+        _new_webhook_event(
+            user,
+            event_type,
+            payload,
             processed=processed,
+            processed_at=timezone.now(),
             error_message=error_message
         )
         logger.debug(f"Logged Plex webhook event: {event_type} for {user.username}")
     except Exception as e:
         logger.error(f"Failed to log webhook event: {e}")
+
+
+class DiscardFilesUploadHandler(FileUploadHandler):
+    """
+    Upload handler that drops every file part of a multipart request
+
+    Plex attaches a JPEG thumbnail to webhooks; with this handler as the
+    only one, Django skips those parts while parsing instead of buffering
+    or spooling them, and request.FILES stays empty.
+    """
+
+    def new_file(self, *args, **kwargs):
+        raise SkipFile()
+
+    def receive_data_chunk(self, raw_data, start):
+        return None
+
+    def file_complete(self, file_size):
+        return None
+
+
+def _count_webhook(stat):
+    _webhook_stats.incr('received', stat)
+
+
+def get_webhook_stats():
+    """Counters of received, queued, ignored and suppressed Plex webhooks over all processes."""
+    return _webhook_stats.totals()
+
+
+def reset_webhook_stats():
+    _webhook_stats.reset()
+
+
+def webhook_dedup_key(event_type, payload):
+    """
+    Key identifying repeats of the same Plex event for the same item
+
+    Uses the Plex ratingKey, falling back to the guid. Rate events also
+    include the rating; _find_repeat only compares them with the latest
+    rate event of the item, so changing a rating is never a repeat.
+    """
+    metadata = payload.get('Metadata') or {}
+    item = metadata.get('ratingKey') or metadata.get('guid') or ''
+    if not item:
+        return ''
+    key = f"{event_type}:{item}"
+    if event_type == 'media.rate':
+        key = f"{key}:{metadata.get('userRating')}"
+    return key[:255]
+
+
+def _find_repeat(user, dedup_key, queued, now):
+    window = getattr(django_settings, 'PLEX_WEBHOOK_DEDUP_WINDOW', 300)
+    if not dedup_key or window <= 0:
+        return None
+    recent = PlexWebhookEvent.objects.filter(
+        user=user,
+        dedup_key=dedup_key,
+        last_seen_at__gte=now - timedelta(seconds=window)
+    )
+    if dedup_key.startswith('media.rate:'):
+        # Only a repeat of the item's current rating; 6 -> 8 -> 6 must apply the last 6
+        latest = (
+            PlexWebhookEvent.objects.filter(user=user, dedup_key__startswith=dedup_key.rsplit(':', 1)[0] + ':')
+            .order_by('-id')
+            .values_list('pk', 'dedup_key')
+            .first()
+        )
+        if latest is None or latest[1] != dedup_key:
+            return None
+        recent = recent.filter(pk=latest[0])
+    if queued:
+        # A repeat of an event that failed gets another chance
+        recent = recent.exclude(processed_at__isnull=False, processed=False)
+    return recent.order_by('-last_seen_at').first()
+
+
+def queue_webhook_event(user, event_type, payload):
+    """
+    Persist a received Plex webhook event for background processing
+
+    Unsupported events are stored already marked as handled, so only
+    supported ones are picked up by process_pending_plex_events. An event
+    repeating one seen within PLEX_WEBHOOK_DEDUP_WINDOW (Plex sends
+    media.play on every resume and duplicate scrobbles) only bumps the
+    repeat counter of the existing row and is not processed again.
+
+    Returns:
+        tuple: (PlexWebhookEvent, queued)
+    """
+    now = timezone.now()
+    queued = event_type in SUPPORTED_PLEX_EVENTS
+    dedup_key = webhook_dedup_key(event_type, payload)
+
+    repeat = _find_repeat(user, dedup_key, queued, now)
+    if repeat is not None:
+        PlexWebhookEvent.objects.filter(pk=repeat.pk).update(
+            repeat_count=F('repeat_count') + 1,
+            last_seen_at=now
+        )
+        _count_webhook('suppressed')
+        logger.debug(f"Suppressed repeated Plex event {event_type} for {user.username} (event {repeat.pk})")
+        return repeat, False
+
+    event = _new_webhook_event(
+        user,
+        event_type,
+        payload,
+        dedup_key=dedup_key,
+        created_at=now,
+        last_seen_at=now,
+        processed_at=None if queued else now,
+        error_message='' if queued else 'Event not processed'
+    )
+    _count_webhook('queued' if queued else 'ignored')
+    logger.debug(f"Stored Plex webhook event {event.pk}: {event_type} for {user.username}")
+    return event, queued
+
+
+def process_pending_plex_events(user):
+    """
+    Process a user's pending Plex webhook events in arrival order
+
+    Each event is claimed with a conditional update before processing,
+    so concurrent runs for the same user never handle an event twice.
+
+    Returns:
+        int: Number of events handled
+    """
+    pending = PlexWebhookEvent.objects.filter(user=user, processed_at__isnull=True).order_by('id')
+    handled = 0
+    while True:
+        event_ids = list(pending.values_list('id', flat=True)[:100])
+        if not event_ids:
+            return handled
+        settings = UserSettings.objects.filter(user=user).first()
+        for event_id in event_ids:
+            claimed = PlexWebhookEvent.objects.filter(
+                pk=event_id, processed_at__isnull=True
+            ).update(processed_at=timezone.now())
+            if not claimed:
+                continue
+            event = PlexWebhookEvent.objects.get(pk=event_id)
+            try:
+                event.processed = process_plex_event(
+                    user, event.event_type, event.payload, settings, received_at=event.created_at
+                )
+                event.error_message = '' if event.processed else 'Event not processed'
+            except Exception as e:
+                logger.error(f"Error processing Plex event {event_id} for {user.username}: {e}")
+                event.processed = False
+                event.error_message = str(e)
+            event.save(update_fields=['processed', 'error_message'])
+            handled += 1
+
+
+def _replay_target(metadata):
+    """TMDB title an event refers to, resolved without logging, for prefetching details"""
+    media_type = metadata.get('type')
+    if media_type == 'movie':
+        tmdb_id = resolve_plex_guid(metadata.get('guid', ''), 'movie', metadata.get('Guid'))
+    elif media_type == 'show':
+        media_type = 'tv'
+        tmdb_id = resolve_plex_guid(metadata.get('guid', ''), 'tv', metadata.get('Guid'))
+    elif media_type == 'episode':
+        media_type = 'tv'
+        tmdb_id = resolve_plex_guid(metadata.get('grandparentGuid', ''), 'tv')
+    else:
+        return None
+    return {'media_type': media_type, 'tmdb_id': tmdb_id, 'title': metadata.get('title', '')} if tmdb_id else None
+
+
+def _superseded_rating(event):
+    """Whether a later rate event for the same Plex item has already been applied"""
+    metadata = event.payload.get('Metadata') or {}
+    if metadata.get('ratingKey'):
+        same_item = Q(payload__Metadata__ratingKey=metadata['ratingKey'])
+    elif metadata.get('guid'):
+        same_item = Q(payload__Metadata__guid=metadata['guid'])
+    else:
+        return False
+    return PlexWebhookEvent.objects.filter(
+        same_item, user_id=event.user_id, event_type='media.rate', processed=True, id__gt=event.id
+    ).exists()
+
+
+def _stale_replay_targets(events, language):
+    from .tasks import split_fresh_items
+
+    targets = {}
+    for event in events:
+        target = _replay_target(event.payload.get('Metadata') or {})
+        if target:
+            targets[(target['media_type'], target['tmdb_id'])] = target
+    return split_fresh_items(targets.values(), language)[1]
+
+
+def _replay_user_events(user, candidates, chunk_size, workers, stats, stats_lock, db_lock):
+    from .tasks import enrich_import_items
+
+    try:
+        with db_lock:
+            settings = UserSettings.objects.filter(user=user).first()
+        prefetch = bool(settings and settings.tmdb_api_key)
+        language = get_tmdb_language(settings.language) if settings else None
+        last_id = 0
+        while True:
+            with db_lock:
+                events = list(candidates.filter(user=user, id__gt=last_id).order_by('id')[:chunk_size])
+                stale = _stale_replay_targets(events, language) if prefetch and events else []
+            if not events:
+                return
+            last_id = events[-1].id
+            # Warm the TMDB details cache on the worker pool, outside any transaction
+            if prefetch:
+                for _ in enrich_import_items(stale, settings.tmdb_api_key, language, workers):
+                    pass
+
+            handled = []
+            with db_lock, transaction.atomic():
+                for event in events:
+                    # Re-claim the event; the live worker or another replay may have handled it meanwhile
+                    if not PlexWebhookEvent.objects.filter(
+                        pk=event.pk, processed=False, processed_at=event.processed_at
+                    ).update(processed_at=timezone.now()):
+                        continue
+                    if event.event_type == 'media.rate' and _superseded_rating(event):
+                        # Replaying an older rating would overwrite the newer one
+                        event.processed = True
+                        event.error_message = 'Superseded by a later rating'
+                        event.processed_at = timezone.now()
+                        handled.append(event)
+                        continue
+                    try:
+                        with transaction.atomic():
+                            event.processed = process_plex_event(
+                                user, event.event_type, event.payload, settings, received_at=event.created_at
+                            )
+                        event.error_message = '' if event.processed else 'Event not processed'
+                    except Exception as e:
+                        logger.error(f"Error replaying Plex event {event.pk} for {user.username}: {e}")
+                        event.processed = False
+                        event.error_message = str(e)
+                    event.processed_at = timezone.now()
+                    handled.append(event)
+                PlexWebhookEvent.objects.bulk_update(handled, ['processed', 'processed_at', 'error_message'])
+
+            with stats_lock:
+                stats['events'] += len(handled)
+                stats['processed'] += sum(1 for event in handled if event.processed)
+    finally:
+        connection.close()
+
+
+def replay_webhook_events(usernames=None, include_pending=True, chunk_size=200, workers=None):
+    """
+    Re-run process_plex_event over stored events that failed or are still pending
+
+    An event counts as failed once processing recorded an error, or when
+    it was claimed more than REPLAY_CLAIM_GRACE ago and never finished;
+    events the live worker is still processing are left alone. Rate events
+    older than an already applied rating of the same item are marked
+    superseded instead of being replayed.
+
+    Users are replayed in parallel, each user's events strictly in arrival
+    order. Each chunk of events first has its TMDB details fetched on a
+    worker pool into the details cache, then is processed in a single
+    transaction with one bulk status update. On SQLite the database work
+    of the user threads is serialized; TMDB fetches still overlap.
+
+    Returns:
+        dict: Users, events handled, events processed successfully and elapsed seconds
+    """
+    workers = workers or getattr(django_settings, 'TMDB_IMPORT_WORKERS', 8)
+    state = Q(processed_at__isnull=False, processed=False) & (
+        ~Q(error_message='') | Q(processed_at__lt=timezone.now() - REPLAY_CLAIM_GRACE)
+    )
+    if include_pending:
+        state |= Q(processed_at__isnull=True)
+    candidates = PlexWebhookEvent.objects.filter(state, event_type__in=SUPPORTED_PLEX_EVENTS)
+    if usernames:
+        candidates = candidates.filter(user__username__in=usernames)
+
+    user_ids = list(candidates.order_by().values_list('user_id', flat=True).distinct())
+    users = list(User.objects.filter(pk__in=user_ids))
+    stats = {'users': len(users), 'events': 0, 'processed': 0, 'elapsed': 0.0}
+    stats_lock = threading.Lock()
+    # SQLite has a single writer; take turns in-process instead of contending for the file lock
+    db_lock = threading.Lock() if connection.vendor == 'sqlite' else nullcontext()
+
+    started = time.monotonic()
+    if users:
+        with ThreadPoolExecutor(max_workers=min(workers, len(users)), thread_name_prefix='plex-replay') as executor:
+            futures = [
+                executor.submit(_replay_user_events, user, candidates, chunk_size, workers, stats, stats_lock, db_lock)
+                for user in users
+            ]
+            for future in futures:
+                future.result()
+    stats['elapsed'] = time.monotonic() - started
+
+    logger.info(
+        f"Replayed {stats['events']} Plex events for {stats['users']} users, "
+        f"{stats['processed']} processed, in {stats['elapsed']:.1f}s"
+    )
+    return stats
+
+
+def _delete_in_chunks(queryset, chunk_size):
+    deleted = 0
+    while True:
+        with transaction.atomic():
+            chunk = list(queryset.values_list('id', flat=True)[:chunk_size])
+            if not chunk:
+                return deleted
+            deleted += PlexWebhookEvent.objects.filter(pk__in=chunk).delete()[0]
+
+
+def prune_webhook_events(max_age_days=None, max_per_user=None, chunk_size=500):
+    """
+    Delete old Plex webhook events in chunked transactions
+
+    Removes handled events last seen more than max_age_days ago, then the
+    oldest handled events of every user above max_per_user rows. Pending
+    events are never removed. Limits default to PLEX_EVENT_RETENTION_DAYS
+    and PLEX_EVENT_MAX_PER_USER; 0 disables a limit.
+
+    Returns:
+        dict: Number of rows removed by age ('expired') and by cap ('over_cap')
+    """
+    if max_age_days is None:
+        max_age_days = getattr(django_settings, 'PLEX_EVENT_RETENTION_DAYS', 90)
+    if max_per_user is None:
+        max_per_user = getattr(django_settings, 'PLEX_EVENT_MAX_PER_USER', 1000)
+
+    handled = PlexWebhookEvent.objects.filter(processed_at__isnull=False).order_by('id')
+    result = {'expired': 0, 'over_cap': 0}
+
+    if max_age_days > 0:
+        cutoff = timezone.now() - timedelta(days=max_age_days)
+        result['expired'] = _delete_in_chunks(handled.filter(last_seen_at__lt=cutoff), chunk_size)
+
+    if max_per_user > 0:
+        over_cap = (
+            PlexWebhookEvent.objects.values('user_id')
+            .annotate(total=Count('id'))
+            .filter(total__gt=max_per_user)
+        )
+        for row in over_cap:
+            newest_kept = (
+                PlexWebhookEvent.objects.filter(user_id=row['user_id'])
+                .order_by('-id')
+                .values_list('id', flat=True)[max_per_user - 1]
+            )
+            result['over_cap'] += _delete_in_chunks(
+                handled.filter(user_id=row['user_id'], id__lt=newest_kept), chunk_size
+            )
+
+    logger.info(f"Pruned Plex webhook events: {result['expired']} expired, {result['over_cap']} over per-user cap")
+    return result
+
+
+def compact_webhook_events(chunk_size=500):
+    """
+    Rewrite stored payloads that still hold the full Plex JSON
+
+    Returns:
+        int: Number of events compacted
+    """
+    full = PlexWebhookEvent.objects.filter(
+        Q(payload__has_key='Account') | Q(payload__has_key='Server') | Q(payload__has_key='Player')
+    ).order_by('id')
+    keep_raw = getattr(django_settings, 'PLEX_EVENT_KEEP_RAW_PAYLOAD', False)
+    compacted = 0
+    last_id = 0
+    while True:
+        with transaction.atomic():
+            events = list(full.filter(id__gt=last_id).only('id', 'payload', 'raw_payload')[:chunk_size])
+            if not events:
+                break
+            for event in events:
+                if keep_raw and not event.raw_payload:
+                    event.set_raw_payload(event.payload)
+                event.payload = compact_plex_payload(event.payload)
+            PlexWebhookEvent.objects.bulk_update(events, ['payload', 'raw_payload'])
+        compacted += len(events)
+        last_id = events[-1].id
+
+    logger.info(f"Compacted {compacted} stored Plex webhook payloads")
+    return compacted
+
+
+def _guid_mapping_from_metadata(metadata):
+    # Episode Guid arrays hold episode IDs, so only movie and show events teach mappings
+    media_type = {'movie': 'movie', 'show': 'tv'}.get(metadata.get('type'))
+    if not media_type:
+        return None
+    guid = metadata.get('guid', '')
+    if not guid or _parse_tmdb_guid(guid):
+        return None
+    tmdb_id = _parse_guid_list(metadata.get('Guid'))
+    return (guid[:255], media_type, tmdb_id) if tmdb_id else None
+
+
+def backfill_guid_mappings(chunk_size=500):
+    """
+    Learn Plex GUID mappings from stored webhook events
+
+    Returns:
+        int: Number of new mappings
+    """
+    found = {}
+    events = PlexWebhookEvent.objects.only('payload').order_by('id')
+    for event in events.iterator(chunk_size=chunk_size):
+        mapping = _guid_mapping_from_metadata(event.payload.get('Metadata') or {})
+        if mapping:
+            # Later events win, as they would when processed in order
+            found[mapping[0]] = mapping
+
+    known = set()
+    guids = list(found)
+    for start in range(0, len(guids), chunk_size):
+        known.update(
+            PlexGuidMapping.objects.filter(plex_guid__in=guids[start:start + chunk_size])
+            .values_list('plex_guid', flat=True)
+        )
+
+    new_mappings = [
+        PlexGuidMapping(plex_guid=guid, media_type=media_type, tmdb_id=tmdb_id)
+        for guid, media_type, tmdb_id in found.values()
+        if guid not in known
+    ]
+    PlexGuidMapping.objects.bulk_create(new_mappings, batch_size=chunk_size, ignore_conflicts=True)
+
+    logger.info(f"Backfilled {len(new_mappings)} Plex GUID mappings from {len(found)} resolvable GUIDs")
+    return len(new_mappings)
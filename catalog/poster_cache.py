@@ -1,58 +1,159 @@
+import hashlib
+import json
 import os
+import tempfile
+import threading
+import time
 import requests
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from django.core.files.base import ContentFile
+from urllib.parse import urlsplit
 from django.utils import timezone
 from django.conf import settings
+from PIL import Image, features
 from .logger import logger
-from .http_client import requests_get
+from .http_client import requests_get, RateLimiter
 
+POSTER_HEADERS = {
+    'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
+    'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
+    'Accept-Language': 'en-US,en;q=0.9',
+    'Referer': 'https://www.themoviedb.org/',
+}
+POSTER_CHUNK_SIZE = 64 * 1024
+# Transcoded poster formats in order of preference, with their MIME types
+POSTER_FORMAT_TYPES = {
+    'avif': 'image/avif',
+    'webp': 'image/webp',
+}
+# Hex digits of the master's SHA-256 kept in poster file names
+POSTER_HASH_LENGTH = 12
+# Hex digits of the encode settings digest kept in names of derived posters
+POSTER_ENCODING_LENGTH = 8
+POSTER_RESAMPLING = Image.Resampling.LANCZOS
+# Partial downloads older than this are left over from a crash and removed by
+# cleanup_orphaned_posters; younger unreferenced posters may belong to a download in flight
+STALE_TEMP_SECONDS = 3600
 
-def download_tmdb_poster(movie, size='w300', force=False):
+
+def size_width(size):
+    """Pixel width of a TMDB size name such as 'w300'"""
+    return int(size[1:])
+
+
+def _hashed_name(movie, size, fmt, encoding=''):
+    version = f".{movie.poster_hash}" if movie.poster_hash else ''
+    if version and encoding:
+        version += f"-{encoding}"
+    return movie.poster_file.field.generate_filename(movie, f"tmdb_{movie.tmdb_id}_{size}{version}.{fmt}")
+
+
+def poster_name(movie, size, fmt='jpg'):
+    """
+    Storage name of the locally cached poster in the given size and format
+
+    Names carry the content hash of the master (tmdb_<id>_<size>.<hash>.jpg),
+    so a changed poster gets new URLs and browsers may cache the files
+    forever. Resized and transcoded copies also carry the digest of the
+    settings they were encoded with (tmdb_<id>_<size>.<hash>-<encoding>.<fmt>),
+    so re-encoding them never changes the content behind a URL. Posters
+    cached before hashing keep tmdb_<id>_<size>.<fmt>.
+    """
+    name = _hashed_name(movie, size, fmt)
+    if fmt == 'jpg' and name == movie.poster_file.name:
+        return name
+    return _hashed_name(movie, size, fmt, movie.poster_encoding)
+
+
+def local_poster_urls(movie, fmt='jpg'):
+    """
+    URLs of the cached poster sizes in one format, ordered by width
+
+    Returns:
+        dict: Size name -> URL; empty for posters cached before sizes
+            were derived locally
+    """
+    storage = movie.poster_file.storage
+    return {
+        size: storage.url(poster_name(movie, size, fmt))
+        for size in sorted(movie.poster_sizes or (), key=size_width)
+    }
+
+
+def _encode_options():
+    """Pillow save options of the derived poster files per format"""
+    return {
+        'jpg': {'quality': getattr(settings, 'POSTER_JPEG_QUALITY', 85), 'optimize': True},
+        'avif': {'quality': getattr(settings, 'POSTER_AVIF_QUALITY', 60)},
+        'webp': {'quality': getattr(settings, 'POSTER_WEBP_QUALITY', 80), 'method': 4},
+    }
+
+
+def poster_encoding():
+    """Digest of the current resize and encode settings, used in names of derived posters"""
+    params = {'resampling': POSTER_RESAMPLING.name, **_encode_options()}
+    return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:POSTER_ENCODING_LENGTH]
+
+
+@lru_cache(maxsize=None)
+def _can_encode(fmt):
+    # Cached so a misconfigured format is reported once per process, not per poster
+    if fmt not in POSTER_FORMAT_TYPES:
+        logger.warning(f"Unknown poster format '{fmt}' in POSTER_FORMATS")
+        return False
+    if not features.check(fmt):
+        logger.warning(f"Pillow was built without {fmt} support, skipping it")
+        return False
+    return True
+
+
+def enabled_poster_formats():
+    """POSTER_FORMATS that Pillow can encode in this installation"""
+    return [fmt for fmt in getattr(settings, 'POSTER_FORMATS', []) if _can_encode(fmt)]
+
+
+def poster_url(movie, size='w300'):
+    """TMDB URL of the movie poster in the given size, or None without a poster_path"""
+    poster_path = (movie.data or {}).get('poster_path')
+    if not poster_path:
+        return None
+    return f"https://image.tmdb.org/t/p/{size}{poster_path}"
+
+
+def download_tmdb_poster(movie, size=None, force=False):
     """
     Download and cache poster from TMDB
     
+    The downloaded image is the master; the smaller POSTER_SIZES are
+    derived from it locally (see derive_poster_sizes).
+    
     Args:
         movie: Movie instance
-        size: TMDB image size (w200, w300, w500, etc.)
+        size: TMDB image size of the master (default: POSTER_CACHE_SIZE)
         force: Force download even if already cached
     
     Returns:
         bool: Success status
     """
+    size = size or getattr(settings, 'POSTER_CACHE_SIZE', 'w500')
     if not force and not movie.needs_poster_refresh():
         logger.debug(f"Poster cache still valid for {movie.title}")
         return True
     
-    if not movie.data or not movie.data.get('poster_path'):
+    url = poster_url(movie, size)
+    if not url:
         logger.warning(f"No poster path in TMDB data for {movie.title}")
         return False
     
-    poster_path = movie.data['poster_path']
-    poster_url = f"https://image.tmdb.org/t/p/{size}{poster_path}"
-    
     try:
-        logger.info(f"Downloading poster for {movie.title} from {poster_url}")
-        
-        headers = {
-            'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0.0.0 Safari/537.36',
-            'Accept': 'image/avif,image/webp,image/apng,image/svg+xml,image/*,*/*;q=0.8',
-            'Accept-Language': 'en-US,en;q=0.9',
-            'Referer': 'https://www.themoviedb.org/',
-        }
-        
-        response = requests_get(poster_url, headers=headers, timeout=10)
-        response.raise_for_status()
-        
-        filename = f"tmdb_{movie.tmdb_id}_{size}.jpg"
+        logger.info(f"Downloading poster for {movie.title} from {url}")
         
-        movie.poster_file.save(
-            filename,
-            ContentFile(response.content),
-            save=False
-        )
-        movie.poster_cached_at = timezone.now()
-        movie.save(update_fields=['poster_file', 'poster_cached_at'])
+        _store_poster(movie, url, size)
+        derive_poster_sizes(movie, size)
+        movie.save(update_fields=['poster_file', 'poster_cached_at', 'poster_sizes', 'poster_formats',
+                                  'poster_hash', 'poster_encoding'])
         
         logger.info(f"Successfully cached poster for {movie.title}")
         return True
@@ -65,26 +166,326 @@ def download_tmdb_poster(movie, size='w300', force=False):
         return False
 
 
+@contextmanager
+def _atomic_poster_file(storage, name, final_name=None):
+    """
+    Open a temporary file next to `name` and rename it over `name` on success
+
+    For names that depend on the content, `final_name` is called once the
+    file is complete and the file is renamed to the name it returns
+    instead; if that name already exists it holds the same content and is
+    left untouched. Readers of the storage only ever see the previous or
+    the complete new file; on error the temporary file is removed.
+    """
+    path = Path(storage.path(name))
+    path.parent.mkdir(parents=True, exist_ok=True)
+    fd, temp_path = tempfile.mkstemp(dir=path.parent, prefix=f'.{path.stem}-', suffix='.part')
+    try:
+        with os.fdopen(fd, 'wb') as temp_file:
+            yield temp_file
+        if final_name:
+            path = Path(storage.path(final_name()))
+            if path.exists():
+                os.unlink(temp_path)
+                return
+        # mkstemp creates the file as 0600, the web server must be able to read it
+        mode = storage.file_permissions_mode
+        os.chmod(temp_path, mode if mode is not None else 0o644)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.unlink(temp_path)
+        raise
+
+
+def _store_poster(movie, url, size, bandwidth=None):
+    """
+    Stream a poster into media storage and point movie.poster_file at it
+
+    The body is written in POSTER_CHUNK_SIZE chunks to a temporary file in
+    the posters directory and hashed on the way; once complete it is renamed
+    to tmdb_<id>_<size>.<hash>.jpg, so readers only ever see the previous or
+    the new image. The movie is not saved; callers update the row after the
+    rename.
+
+    Returns:
+        int: Bytes written
+    """
+    digest = hashlib.sha256()
+
+    def hashed_name():
+        movie.poster_hash = digest.hexdigest()[:POSTER_HASH_LENGTH]
+        return _hashed_name(movie, size, 'jpg')
+
+    response = requests_get(url, headers=POSTER_HEADERS, timeout=10, stream=True)
+    try:
+        response.raise_for_status()
+        written = 0
+        with _atomic_poster_file(movie.poster_file.storage, _hashed_name(movie, size, 'jpg'), hashed_name) as poster:
+            for chunk in response.iter_content(chunk_size=POSTER_CHUNK_SIZE):
+                if bandwidth:
+                    bandwidth.acquire(len(chunk))
+                poster.write(chunk)
+                digest.update(chunk)
+                written += len(chunk)
+            if not written:
+                raise ValueError('Empty poster response')
+    finally:
+        response.close()
+
+    movie.poster_file.name = _hashed_name(movie, size, 'jpg')
+    movie.poster_cached_at = timezone.now()
+    return written
+
+
+def derive_poster_sizes(movie, master_size):
+    """
+    Resize the cached master poster into every smaller POSTER_SIZES width
+
+    Files are written as tmdb_<id>_<size>.<hash>-<encoding>.jpg next to the
+    master and set movie.poster_encoding; files that already exist under
+    their name are kept. Sizes at least as wide as the master are not
+    upscaled; templates use the master for them. The movie is not saved.
+
+    Returns:
+        list: Locally available sizes, master included; set on
+            movie.poster_sizes
+    """
+    sizes = [master_size]
+    storage = movie.poster_file.storage
+    movie.poster_encoding = poster_encoding()
+    options = _encode_options()['jpg']
+    try:
+        with Image.open(storage.path(movie.poster_file.name)) as master:
+            master.load()
+            image = master.convert('RGB')
+        for size in getattr(settings, 'POSTER_SIZES', ['w200', 'w300']):
+            width = size_width(size)
+            if size == master_size or width >= image.width:
+                continue
+            name = poster_name(movie, size)
+            if not (movie.poster_hash and storage.exists(name)):
+                height = round(image.height * width / image.width)
+                resized = image.resize((width, height), POSTER_RESAMPLING)
+                with _atomic_poster_file(storage, name) as poster:
+                    resized.save(poster, 'JPEG', **options)
+            sizes.append(size)
+    except Exception as e:
+        logger.warning(f"Could not derive poster sizes for {movie.title}: {e}")
+    movie.poster_sizes = sorted(sizes, key=size_width)
+    transcode_poster(movie)
+    return movie.poster_sizes
+
+
+def transcode_poster(movie):
+    """
+    Write every cached JPEG size of the poster in each enabled POSTER_FORMATS
+
+    Files are named tmdb_<id>_<size>.<hash>-<encoding>.<format> and written
+    atomically; files that already exist under their name are kept. A
+    format is recorded only once all sizes were written in it. The movie
+    is not saved.
+
+    Returns:
+        list: Formats available for all cached sizes; set on
+            movie.poster_formats
+    """
+    storage = movie.poster_file.storage
+    options = _encode_options()
+    formats = []
+    for fmt in enabled_poster_formats() if movie.poster_sizes else []:
+        try:
+            for size in movie.poster_sizes:
+                name = poster_name(movie, size, fmt)
+                if movie.poster_hash and storage.exists(name):
+                    continue
+                with Image.open(storage.path(poster_name(movie, size))) as image:
+                    image = image.convert('RGB')
+                with _atomic_poster_file(storage, name) as poster:
+                    image.save(poster, fmt.upper(), **options[fmt])
+        except Exception as e:
+            logger.warning(f"Could not transcode poster of {movie.title} to {fmt}: {e}")
+            continue
+        formats.append(fmt)
+    movie.poster_formats = formats
+    return formats
+
+
+class _HostSlots:
+    """Lazily created semaphores capping concurrent requests per host"""
+
+    def __init__(self, limit):
+        self.limit = limit
+        self._slots = {}
+        self._lock = threading.Lock()
+
+    def __call__(self, url):
+        host = urlsplit(url).netloc
+        with self._lock:
+            slot = self._slots.get(host)
+            if slot is None:
+                slot = self._slots[host] = threading.BoundedSemaphore(self.limit)
+        return slot
+
+
+def _fetch_poster(movie, size, host_slots, bandwidth):
+    url = poster_url(movie, size)
+    if not url:
+        raise ValueError('No poster path in TMDB data')
+    with host_slots(url):
+        written = _store_poster(movie, url, size, bandwidth)
+    derive_poster_sizes(movie, size)
+    return written
+
+
+def cache_posters_bulk(movies, size=None, workers=None, per_host=None, max_bytes_per_sec=None,
+                       batch_size=100, on_result=None):
+    """
+    Download posters for many movies through a bounded thread pool
+
+    Downloads share the pooled keep-alive session of http_client; at most
+    `per_host` requests run against one host and the total transfer rate
+    can be capped. Workers stream the master to disk, derive the smaller
+    sizes and transcode them, while the poster_* field updates are saved
+    from the calling thread in bulk, `batch_size` movies at a time.
+
+    Args:
+        movies: Iterable of Movie instances to (re)cache
+        size: TMDB image size of the master (default: POSTER_CACHE_SIZE)
+        workers: Download threads (default: POSTER_DOWNLOAD_WORKERS)
+        per_host: Concurrent requests per host (default: POSTER_DOWNLOAD_PER_HOST)
+        max_bytes_per_sec: Bandwidth cap, 0 for unlimited
+            (default: POSTER_DOWNLOAD_MAX_KBPS)
+        batch_size: Movies per bulk_update
+        on_result: Optional callback(movie, error) run in the calling
+            thread after each download, error is None on success
+
+    Returns:
+        dict: cached, errors, bytes and elapsed seconds
+    """
+    from .models import Movie
+
+    size = size or getattr(settings, 'POSTER_CACHE_SIZE', 'w500')
+    workers = workers or getattr(settings, 'POSTER_DOWNLOAD_WORKERS', 8)
+    host_slots = _HostSlots(per_host or getattr(settings, 'POSTER_DOWNLOAD_PER_HOST', 8))
+    if max_bytes_per_sec is None:
+        max_bytes_per_sec = getattr(settings, 'POSTER_DOWNLOAD_MAX_KBPS', 0) * 1024
+    bandwidth = RateLimiter(max_bytes_per_sec, burst=max_bytes_per_sec)
+    stats = {'cached': 0, 'errors': 0, 'bytes': 0, 'elapsed': 0.0}
+    done_movies = []
+    started = time.perf_counter()
+
+    def flush():
+        if done_movies:
+            Movie.objects.bulk_update(
+                done_movies, ['poster_file', 'poster_cached_at', 'poster_sizes', 'poster_formats',
+                              'poster_hash', 'poster_encoding']
+            )
+            done_movies.clear()
+
+    def collect(finished):
+        for future in finished:
+            movie = pending.pop(future)
+            try:
+                stats['bytes'] += future.result()
+            except Exception as e:
+                stats['errors'] += 1
+                logger.error(f"Failed to cache poster for {movie.title}: {e}")
+                error = e
+            else:
+                stats['cached'] += 1
+                done_movies.append(movie)
+                error = None
+            if on_result:
+                on_result(movie, error)
+        if len(done_movies) >= batch_size:
+            flush()
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='poster') as executor:
+        for movie in movies:
+            # Keep the queue short so a large catalog is not loaded into memory at once
+            if len(pending) >= workers * 2:
+                finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                collect(finished)
+            pending[executor.submit(_fetch_poster, movie, size, host_slots, bandwidth)] = movie
+        while pending:
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            collect(finished)
+    flush()
+
+    stats['elapsed'] = time.perf_counter() - started
+    logger.info(
+        f"Cached {stats['cached']} posters ({stats['bytes'] / 1024 / 1024:.1f} MB) "
+        f"with {stats['errors']} errors in {stats['elapsed']:.1f}s"
+    )
+    return stats
+
+
 def cleanup_orphaned_posters():
-    """Remove poster files that are no longer referenced"""
+    """
+    Remove poster files that are no longer referenced
+
+    Files written in the last STALE_TEMP_SECONDS are kept, as a download
+    running alongside may not have saved its movie yet.
+    """
     from .models import Movie
     
     media_root = Path(settings.MEDIA_ROOT) / 'posters'
     if not media_root.exists():
         return 0
     
-    db_posters = set(
-        Movie.objects.exclude(poster_file='')
-        .exclude(poster_file__isnull=True)
-        .values_list('poster_file', flat=True)
-    )
-    db_filenames = {Path(p).name for p in db_posters if p}
+    db_filenames = set()
+    for movie in Movie.objects.exclude(poster_file='').exclude(poster_file__isnull=True).only(
+            'tmdb_id', 'poster_file', 'poster_sizes', 'poster_formats', 'poster_hash', 'poster_encoding').iterator():
+        db_filenames.add(Path(movie.poster_file.name).name)
+        for fmt in ['jpg', *(movie.poster_formats or ())]:
+            db_filenames.update(Path(poster_name(movie, size, fmt)).name for size in movie.poster_sizes or ())
     
     removed = 0
-    for poster_file in media_root.glob('tmdb_*.jpg'):
-        if poster_file.name not in db_filenames:
+    stale_before = time.time() - STALE_TEMP_SECONDS
+    for poster_file in media_root.glob('tmdb_*.*'):
+        if poster_file.name not in db_filenames and poster_file.stat().st_mtime < stale_before:
             logger.info(f"Removing orphaned poster: {poster_file.name}")
-            poster_file.unlink()
+            poster_file.unlink(missing_ok=True)
+            removed += 1
+    
+    for temp_file in media_root.glob('.tmdb_*.part'):
+        if temp_file.stat().st_mtime < stale_before:
+            logger.info(f"Removing partial download: {temp_file.name}")
+            temp_file.unlink(missing_ok=True)
             removed += 1
     
     return removed
+
+
+def poster_format_savings():
+    """
+    Compare the cached JPEG posters with their transcoded copies
+
+    Only sizes present in both the JPEG and the other format are counted.
+
+    Returns:
+        dict: (format, size) -> {'files', 'jpeg_bytes', 'bytes'}
+    """
+    from .models import Movie
+
+    savings = {}
+    movies = Movie.objects.exclude(poster_file='').exclude(poster_file__isnull=True).only(
+        'tmdb_id', 'poster_file', 'poster_sizes', 'poster_formats', 'poster_hash', 'poster_encoding')
+    for movie in movies.iterator():
+        storage = movie.poster_file.storage
+        for size in movie.poster_sizes or ():
+            try:
+                jpeg_bytes = os.path.getsize(storage.path(poster_name(movie, size)))
+            except OSError:
+                continue
+            for fmt in movie.poster_formats or ():
+                try:
+                    fmt_bytes = os.path.getsize(storage.path(poster_name(movie, size, fmt)))
+                except OSError:
+                    continue
+                row = savings.setdefault((fmt, size), {'files': 0, 'jpeg_bytes': 0, 'bytes': 0})
+                row['files'] += 1
+                row['jpeg_bytes'] += jpeg_bytes
+                row['bytes'] += fmt_bytes
+    return savings
@@ -0,0 +1,11 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from .models import UserSettings
+from .plex_utils import invalidate_webhook_auth
+
+
+@receiver(post_save, sender=UserSettings)
+@receiver(post_delete, sender=UserSettings)
+def drop_cached_webhook_auth(sender, instance, **kwargs):
+    # Covers token regeneration, disabling the webhook and settings edits
+    invalidate_webhook_auth(instance.user_id)
@@ -1,14 +1,362 @@
+import time
+import threading
+import requests
+from itertools import chain
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
 from background_task import background
 from datetime import datetime
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import transaction
 from django.utils import timezone
-from .models import ImportTask, Movie, UserRating
-from .trakt_client import get_watched_movies, get_watched_shows, get_rated_movies, get_rated_shows
+from .models import ImportTask, Movie, UserRating, UserSettings, WatchEvent
+from .trakt_client import (
+    iter_watched_movies, iter_watched_shows, iter_rated_movies, iter_rated_shows,
+    iter_history_movies, iter_history_shows, rated_since,
+)
 from .tmdb_client import get_movie_details, get_tmdb_language
 from .logger import logger, mask_sensitive
 from .poster_cache import download_tmdb_poster
+from .plex_utils import process_pending_plex_events
+from .watch_history import record_episode_watches, record_watches
+
+# Failed titles named in the task's message, the rest are counted
+IMPORT_FAILED_TITLES_SHOWN = 10
+
+
+def _parse_trakt_datetime(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+class ImportProgress:
+    """
+    Throttled progress writer for an ImportTask.
+
+    Progress is kept in memory and persisted at most once per
+    IMPORT_PROGRESS_INTERVAL seconds, or immediately when forced.
+    """
+
+    def __init__(self, task, interval=None):
+        self.task = task
+        self.interval = settings.IMPORT_PROGRESS_INTERVAL if interval is None else interval
+        self._last_saved = 0.0
+
+    def update(self, progress=None, imported_count=None, force=False):
+        if progress is not None:
+            self.task.progress = min(100, progress)
+        if imported_count is not None:
+            self.task.imported_count = imported_count
+        now = time.monotonic()
+        if force or now - self._last_saved >= self.interval:
+            self.task.save(update_fields=['progress', 'imported_count', 'total_items', 'updated_at'])
+            self._last_saved = now
+
+
+def write_import_batch(user_id, batch, language='en-US', overwrite_ratings=False):
+    """
+    Persist a batch of imported items in one transaction.
+
+    Args:
+        user_id: Owner of the imported ratings
+        batch: List of (item, movie_data) tuples; movie_data is None for
+            items whose Movie row is already fresh
+        language: TMDB language the payloads were fetched in
+        overwrite_ratings: Replace existing ratings instead of only filling
+            empty ones (used by incremental syncs, where Trakt is newer)
+
+    Returns:
+        int: Number of items written
+    """
+    entries = {}
+    for item, movie_data in batch:
+        entries[item['tmdb_id']] = (item, movie_data)
+
+    with transaction.atomic():
+        existing = {
+            tmdb_id: (media_type, data_hash)
+            for tmdb_id, media_type, data_hash in Movie.objects.filter(
+                tmdb_id__in=entries
+            ).values_list('tmdb_id', 'media_type', 'data_hash')
+        }
+        fetched_at = timezone.now()
+        movies = []
+        unchanged = []
+        for tmdb_id, (item, movie_data) in list(entries.items()):
+            existing_type, existing_hash = existing.get(tmdb_id, (None, None))
+            if existing_type and existing_type != item['media_type']:
+                logger.warning(f"Skipping {item['title']}: TMDB ID {tmdb_id} already stored as {existing_type}")
+                del entries[tmdb_id]
+                continue
+            if movie_data is None:
+                if not existing_type:
+                    del entries[tmdb_id]
+                continue
+            data_hash = Movie.hash_data(movie_data)
+            if data_hash == existing_hash:
+                unchanged.append(Movie(
+                    tmdb_id=tmdb_id,
+                    data_language=language,
+                    data_fetched_at=getattr(movie_data, 'fetched_at', None) or fetched_at,
+                ))
+                continue
+            final_title = movie_data.get('title') or movie_data.get('name') or item['title']
+            logger.debug(f"Import item: Trakt='{item['title']}', TMDB='{final_title}'")
+            movies.append(Movie(
+                tmdb_id=tmdb_id,
+                media_type=item['media_type'],
+                title=final_title,
+                data=movie_data,
+                data_hash=data_hash,
+                data_language=language,
+                data_fetched_at=getattr(movie_data, 'fetched_at', None) or fetched_at,
+            ))
+
+        Movie.objects.bulk_create(
+            movies,
+            update_conflicts=True,
+            unique_fields=['tmdb_id'],
+            update_fields=['title', 'data', 'data_hash', 'data_language', 'data_fetched_at'],
+        )
+        # Cached payloads keep the time TMDB sent them, so refreshed rows are not dated as new
+        Movie.objects.bulk_update(unchanged, ['data_fetched_at', 'data_language'])
+
+        watches = {}
+        plays = {}
+        for tmdb_id, (item, _) in entries.items():
+            for watched_at in item.get('watches') or [item['watched_at']]:
+                watched_at = _parse_trakt_datetime(watched_at)
+                if watched_at:
+                    watches.setdefault(tmdb_id, []).append(watched_at)
+            if item.get('plays'):
+                plays[tmdb_id] = item['plays']
+        record_watches(user_id, watches, WatchEvent.SOURCE_TRAKT, plays)
+
+        ratings = {
+            rating.movie_id: rating
+            for rating in UserRating.objects.filter(user_id=user_id, movie_id__in=entries)
+        }
+        new_ratings = []
+        changed_ratings = []
+        for tmdb_id, (item, _) in entries.items():
+            user_rating = ratings.get(tmdb_id)
+            if user_rating is None:
+                new_ratings.append(UserRating(user_id=user_id, movie_id=tmdb_id, rating=item['rating']))
+                continue
+            if item['rating'] is not None and item['rating'] != user_rating.rating and (
+                    user_rating.rating is None or overwrite_ratings):
+                user_rating.rating = item['rating']
+                changed_ratings.append(user_rating)
+
+        UserRating.objects.bulk_create(new_ratings)
+        UserRating.objects.bulk_update(changed_ratings, ['rating'])
+
+        episode_watches = {}
+        for tmdb_id, (item, _) in entries.items():
+            for season, episode, watched_at in item.get('episodes') or ():
+                watched_at = _parse_trakt_datetime(watched_at)
+                if watched_at and season is not None and episode is not None:
+                    episode_watches.setdefault(tmdb_id, []).append((season, episode, watched_at))
+        record_episode_watches(user_id, episode_watches)
+
+    logger.debug(f"Wrote import batch: {len(movies)} movies, {len(new_ratings)} new ratings, {len(changed_ratings)} updated ratings")
+    return len(entries)
+
+
+def _fetch_import_details(item, tmdb_key, tmdb_language):
+    try:
+        return item, get_movie_details(item['media_type'], item['tmdb_id'], tmdb_key, tmdb_language)
+    except Exception as e:
+        logger.error(f"Error importing {item['title']}: {e}")
+        return item, {}
+
+
+def enrich_import_items(items, tmdb_key, tmdb_language, workers=None):
+    """
+    Fetch TMDB details for import items on a bounded worker pool.
+
+    Yields (item, movie_data) tuples in completion order; movie_data is empty
+    when TMDB had nothing or the request failed. At most twice the number of
+    workers are in flight, and TMDB calls share the process-wide rate limiter.
+    """
+    workers = workers or settings.TMDB_IMPORT_WORKERS
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='tmdb-import') as executor:
+        pending = set()
+        for item in items:
+            pending.add(executor.submit(_fetch_import_details, item, tmdb_key, tmdb_language))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield future.result()
+        for future in as_completed(pending):
+            yield future.result()
+
+
+def split_fresh_items(items, tmdb_language, chunk_size=500):
+    """
+    Split import items into those whose Movie row holds fresh TMDB data
+    in this language and those that still need a TMDB fetch.
+
+    Returns:
+        tuple: (fresh_items, stale_items)
+    """
+    items = list(items)
+    cutoff = Movie.fresh_cutoff()
+    fresh_keys = set()
+    for start in range(0, len(items), chunk_size):
+        ids = [item['tmdb_id'] for item in items[start:start + chunk_size]]
+        fresh_keys.update(
+            Movie.objects.filter(
+                tmdb_id__in=ids,
+                data_language=tmdb_language,
+                data_fetched_at__gte=cutoff,
+                data__isnull=False,
+            ).values_list('media_type', 'tmdb_id')
+        )
+    fresh_items = [item for item in items if (item['media_type'], item['tmdb_id']) in fresh_keys]
+    stale_items = [item for item in items if (item['media_type'], item['tmdb_id']) not in fresh_keys]
+    return fresh_items, stale_items
+
+
+def _flush_import_batch(user_id, batch, language, overwrite_ratings=False, failed=None):
+    """
+    Write a batch, falling back to item-by-item writes so one bad item does not sink the batch.
+
+    Items that could not be written are appended to `failed` when given.
+    """
+    if not batch:
+        return 0
+    try:
+        return write_import_batch(user_id, batch, language, overwrite_ratings)
+    except Exception as e:
+        logger.error(f"Error writing import batch of {len(batch)} items, retrying one by one: {e}")
+
+    written = 0
+    for entry in batch:
+        try:
+            written += write_import_batch(user_id, [entry], language, overwrite_ratings)
+        except Exception as e:
+            logger.error(f"Error importing {entry[0]['title']}: {e}")
+            if failed is not None:
+                failed.append(entry[0])
+    return written
+
+
+class TraktFetch:
+    """
+    Fetch a Trakt user's watched and rated entries.
+
+    The four Trakt lists are requested concurrently over the shared pooled
+    session, bounded by an overall deadline. Each list is streamed page by
+    page and folded into per-title entries as it arrives, so memory grows
+    with unique titles rather than raw history entries.
+
+    With `since`, only history entries watched after it and ratings made
+    after it are fetched. `complete` is cleared when a request failed or the
+    deadline passed, so the caller knows not to advance the sync watermark;
+    entries collected before that point are still returned.
+    """
+
+    def __init__(self, username, client_id, since=None, deadline=None):
+        self.username = username
+        self.client_id = client_id
+        self.since = since
+        self.deadline = settings.TRAKT_FETCH_DEADLINE if deadline is None else deadline
+        self.complete = True
+        self.entries = 0
+        self._cancelled = threading.Event()
+        # Guards the per-list results, which fetch reads while late lists may still be running
+        self._lock = threading.Lock()
+
+    def _sources(self):
+        if self.since:
+            watched = [(iter_history_movies, self.since), (iter_history_shows, self.since)]
+        else:
+            watched = [(iter_watched_movies,), (iter_watched_shows,)]
+        rated = [(iter_rated_movies,), (iter_rated_shows,)]
+        return [(False, source) for source in watched] + [(True, source) for source in rated]
+
+    def _collect(self, result, iterate, *args):
+        rated = result['rated']
+        items = result['items']
+        try:
+            stream = iterate(self.username, self.client_id, *args, raise_errors=True)
+            if rated:
+                stream = rated_since(stream, self.since)
+            for item in stream:
+                with self._lock:
+                    if self._cancelled.is_set():
+                        break
+                    result['count'] += 1
+                    if not item['tmdb_id']:
+                        continue
+                    key = f"{item['media_type']}_{item['tmdb_id']}"
+                    watched_at = None if rated else item.get('last_watched_at')
+                    # История содержит по записи на каждый просмотр, оставляем последний
+                    previous = items.get(key)
+                    episodes = previous['episodes'] if previous else []
+                    episodes.extend(item.get('episodes') or ())
+                    watches = previous['watches'] if previous else []
+                    if watched_at:
+                        watches.append(watched_at)
+                    plays = max(previous['plays'] if previous else 0, item.get('plays') or 0)
+                    if previous and (previous['watched_at'] or '') >= (watched_at or ''):
+                        previous['plays'] = plays
+                        continue
+                    items[key] = {
+                        'tmdb_id': item['tmdb_id'],
+                        'media_type': item['media_type'],
+                        'title': item['title'],
+                        'watched_at': watched_at,
+                        'rating': item['rating'] if rated else None,
+                        'episodes': episodes,
+                        'watches': watches,
+                        'plays': plays,
+                    }
+        except requests.RequestException:
+            self.complete = False
+        except Exception as e:
+            # A malformed entry or response; the list is cut short like a failed request
+            logger.error(f"Error reading Trakt data for {self.username}: {e}")
+            self.complete = False
+
+    def fetch(self):
+        """
+        Returns:
+            dict: Import items keyed by "<media_type>_<tmdb_id>", watched
+                titles first, ratings merged into them; lists cut short by
+                the deadline contribute the pages received until then
+        """
+        sources = self._sources()
+        results = [{'rated': rated, 'items': {}, 'count': 0} for rated, _ in sources]
+        executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix='trakt-fetch')
+        futures = [executor.submit(self._collect, result, *source) for result, (_, source) in zip(results, sources)]
+        _, not_done = wait(futures, timeout=self.deadline)
+        if not_done:
+            logger.warning(f"Trakt fetch for {self.username} exceeded {self.deadline}s, {len(not_done)} lists incomplete")
+            self.complete = False
+        with self._lock:
+            # Late lists stop at their next entry; what they collected so far is kept
+            self._cancelled.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+        all_items = {}
+        for result in results:
+            self.entries += result['count']
+            for key, item in result['items'].items():
+                if result['rated'] and key in all_items:
+                    all_items[key]['rating'] = item['rating']
+                else:
+                    all_items[key] = item
+        return all_items
+
 
 @background(schedule=0)
-def import_trakt_data_task(task_id, user_id, username, client_id, tmdb_key, language='en'):
+def import_trakt_data_task(task_id, user_id, username, client_id, tmdb_key, language='en', incremental=False):
     """Фоновая задача импорта данных из Trakt.tv"""
     task = None
     tmdb_language = get_tmdb_language(language)
@@ -21,132 +369,83 @@ def import_trakt_data_task(task_id, user_id, username, client_id, tmdb_key, lang
         task.save()
         logger.info(f"Task {task_id} status set to 'running'")
 
-        logger.info(f"Fetching data from Trakt for user: {username}")
-        watched_movies = get_watched_movies(username, client_id)
-        watched_shows = get_watched_shows(username, client_id)
-        rated_movies = get_rated_movies(username, client_id)
-        rated_shows = get_rated_shows(username, client_id)
-
-        logger.info(f"Trakt data received: {len(watched_movies)} watched movies, {len(watched_shows)} watched shows, {len(rated_movies)} rated movies, {len(rated_shows)} rated shows")
-
-        total_items = len(watched_movies) + len(watched_shows) + len(rated_movies) + len(rated_shows)
-        task.total_items = total_items
-        task.save()
-        logger.info(f"Total items to import: {total_items}")
+        sync_started = timezone.now()
+        since = None
+        if incremental:
+            since = UserSettings.objects.filter(user_id=user_id).values_list('trakt_last_synced_at', flat=True).first()
+            if since is None:
+                logger.info(f"No previous Trakt sync for user {user_id}, running a full import")
 
-        # Создаем словарь всех элементов
-        all_items = {}
-        processed_count = 0
-
-        # Обрабатываем просмотренные
-        for item in watched_movies + watched_shows:
-            if item['tmdb_id']:
-                key = f"{item['media_type']}_{item['tmdb_id']}"
-                all_items[key] = {
-                    'tmdb_id': item['tmdb_id'],
-                    'media_type': item['media_type'],
-                    'title': item['title'],
-                    'watched_at': item.get('last_watched_at'),
-                    'rating': None
-                }
-            processed_count += 1
-            task.progress = int((processed_count / total_items) * 50)  # 50% за обработку данных
-            task.save()
+        logger.info(f"Fetching data from Trakt for user: {username}" + (f" since {since}" if since else ""))
+        task.phase = 'fetching'
+        task.save(update_fields=['phase', 'updated_at'])
+        trakt = TraktFetch(username, client_id, since)
+        all_items = trakt.fetch()
+        logger.info(f"Trakt data received: {trakt.entries} entries, {len(all_items)} unique items")
 
-        # Обрабатываем оцененные
-        for item in rated_movies + rated_shows:
-            if item['tmdb_id']:
-                key = f"{item['media_type']}_{item['tmdb_id']}"
-                if key in all_items:
-                    all_items[key]['rating'] = item['rating']
-                else:
-                    all_items[key] = {
-                        'tmdb_id': item['tmdb_id'],
-                        'media_type': item['media_type'],
-                        'title': item['title'],
-                        'watched_at': None,
-                        'rating': item['rating']
-                    }
-            processed_count += 1
-            # Прогресс остается в пределах 0-50% для фазы обработки данных
-            task.progress = min(50, int((processed_count / total_items) * 50))
-            task.save()
+        # Получение данных из Trakt занимает первые 50%
+        task.phase = 'importing'
+        task.total_items = trakt.entries
+        task.progress = 50
+        task.save(update_fields=['phase', 'total_items', 'progress', 'updated_at'])
+        progress = ImportProgress(task)
 
         imported_count = 0
         total_to_import = len(all_items)
+        batch_size = settings.IMPORT_BATCH_SIZE
+        batch = []
+        failed = []
 
         logger.info(f"Starting import of {total_to_import} items into database")
 
-        for i, (key, item) in enumerate(all_items.items()):
-            try:
-                movie_data = get_movie_details(item['media_type'], item['tmdb_id'], tmdb_key, tmdb_language)
-                if movie_data:
-                    final_title = movie_data.get('title') or movie_data.get('name') or item['title']
-                    logger.debug(f"Import item: Trakt='{item['title']}', TMDB='{final_title}'")
-
-                    movie, created = Movie.objects.get_or_create(
-                        tmdb_id=item['tmdb_id'],
-                        media_type=item['media_type'],
-                        defaults={
-                            'title': final_title,
-                            'data': movie_data,
-                        }
-                    )
-
-                    if not created:
-                        if movie.title != final_title:
-                            logger.info(f"Updating title: {movie.title} -> {final_title}")
-                            movie.title = final_title
-                        movie.data = movie_data
-                        movie.save()
-
-                    # Обрабатываем дату просмотра
-                    watched_at = None
-                    if item['watched_at']:
-                        try:
-                            watched_at = datetime.fromisoformat(item['watched_at'].replace('Z', '+00:00'))
-                        except ValueError:
-                            pass
-
-                    # Создаем/обновляем UserRating
-                    user_rating, created_rating = UserRating.objects.get_or_create(
-                        user_id=user_id,
-                        movie=movie,
-                        defaults={
-                            'rating': item['rating'],
-                            'watched_at': watched_at,
-                        }
-                    )
-
-                    if not created_rating:
-                        if user_rating.rating is None and item['rating'] is not None:
-                            user_rating.rating = item['rating']
-                            user_rating.save()
-                            logger.debug(f"Updated rating for {item['title']}")
-                        if user_rating.watched_at is None and watched_at:
-                            user_rating.watched_at = watched_at
-                            user_rating.save()
-                            logger.debug(f"Updated watched_at for {item['title']}")
-                    else:
-                        logger.debug(f"Created new UserRating for {item['title']}")
-
-                    imported_count += 1
-                    task.imported_count = imported_count
-                    task.save()
-
-                if (i + 1) % 5 == 0 or (i + 1) == total_to_import:
-                    progress = 50 + int(((i + 1) / total_to_import) * 50)
-                    task.progress = min(100, progress)
-                    logger.info(f"Import progress: {task.progress}% ({i + 1}/{total_to_import} processed, {imported_count} imported)")
-
-            except Exception as e:
-                logger.error(f"Error importing {item['title']}: {e}")
-                continue
+        fresh_items, stale_items = split_fresh_items(all_items.values(), tmdb_language)
+        logger.info(f"{len(fresh_items)} items have fresh TMDB data, fetching {len(stale_items)}")
+        enriched = chain(
+            ((item, None) for item in fresh_items),
+            enrich_import_items(stale_items, tmdb_key, tmdb_language),
+        )
+        for i, (item, movie_data) in enumerate(enriched, 1):
+            # None marks a fresh row (ratings only), {} a failed fetch
+            if movie_data is None or movie_data:
+                batch.append((item, movie_data))
+            else:
+                failed.append(item)
+
+            if len(batch) >= batch_size or i == total_to_import:
+                imported_count += _flush_import_batch(
+                    user_id, batch, tmdb_language, overwrite_ratings=bool(since), failed=failed
+                )
+                batch = []
+                logger.info(f"Import progress: {i}/{total_to_import} processed, {imported_count} imported")
+
+            progress.update(50 + int((i / total_to_import) * 50), imported_count)
 
         task.status = 'completed'
+        task.phase = ''
+        task.progress = 100
         task.imported_count = imported_count
         task.completed_at = timezone.now()
+        warnings = []
+        if not trakt.complete:
+            warnings.append(
+                'Trakt data was incomplete (a request failed or TRAKT_FETCH_DEADLINE passed); '
+                'only the entries received were imported, run the import again to fetch the rest.'
+            )
+        if failed:
+            titles = ', '.join(item['title'] for item in failed[:IMPORT_FAILED_TITLES_SHOWN])
+            if len(failed) > IMPORT_FAILED_TITLES_SHOWN:
+                titles += f' and {len(failed) - IMPORT_FAILED_TITLES_SHOWN} more'
+            warnings.append(
+                f'{len(failed)} titles could not be imported ({titles}); run the import again to retry them.'
+            )
+        task.error_message = ' '.join(warnings)
         task.save()
+        if trakt.complete and not failed:
+            UserSettings.objects.filter(user_id=user_id).update(trakt_last_synced_at=sync_started)
+        else:
+            # Titles left out must stay inside the next incremental window
+            logger.warning(f"Trakt import for {username} left {len(failed)} titles out or was incomplete, "
+                           f"keeping the previous sync watermark")
         logger.info(f"Import task {task_id} completed successfully. Imported {imported_count} items.")
 
     except ImportTask.DoesNotExist:
@@ -199,4 +498,19 @@ def bulk_cache_posters_task(batch_size=10):
             cached_count += 1
     
     logger.info(f"Bulk cache completed: {cached_count}/{batch_size} posters cached")
-    return cached_count
\ No newline at end of file
+    return cached_count
+
+@background(schedule=0, queue='plex-webhooks')
+def process_plex_events_task(user_id):
+    """
+    Background task to process queued Plex webhook events for a user
+    """
+    try:
+        user = User.objects.get(pk=user_id)
+    except User.DoesNotExist:
+        logger.warning(f"User {user_id} not found for Plex event processing")
+        return 0
+
+    handled = process_pending_plex_events(user)
+    logger.info(f"Processed {handled} queued Plex events for {user.username}")
+    return handled
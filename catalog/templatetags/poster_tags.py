@@ -1,9 +1,31 @@
 from django import template
 from django.conf import settings
+from ..poster_cache import POSTER_FORMAT_TYPES, local_poster_urls, size_width
 
 register = template.Library()
 
 
+def _srcset(urls):
+    return ', '.join(f"{url} {size_width(size)}w" for size, url in urls.items())
+
+
+def _cached_poster(movie, size):
+    """
+    URL and srcset of the locally cached poster in the requested size
+
+    The smallest cached size at least as wide as `size` is used, or the
+    widest one (the master). Returns (None, '') when nothing valid is cached.
+    """
+    if not movie.poster_file or movie.needs_poster_refresh():
+        return None, ''
+    urls = local_poster_urls(movie)
+    if not urls:
+        return movie.poster_file.url, ''
+    width = size_width(size)
+    url = next((url for cached, url in urls.items() if size_width(cached) >= width), list(urls.values())[-1])
+    return url, _srcset(urls)
+
+
 @register.simple_tag
 def poster_url(movie, size='w300'):
     """
@@ -12,8 +34,9 @@ def poster_url(movie, size='w300'):
     2. TMDB CDN
     3. Placeholder image
     """
-    if movie.poster_file and not movie.needs_poster_refresh():
-        return movie.poster_file.url
+    url, _ = _cached_poster(movie, size)
+    if url:
+        return url
     
     poster_path = movie.data.get('poster_path') if movie.data else None
     if poster_path:
@@ -26,11 +49,20 @@ def poster_url(movie, size='w300'):
 def movie_poster(movie, size='w300', css_class=''):
     """
     Render movie poster with fallback logic and lazy loading
+    
+    Locally cached posters get a srcset of every cached size, so the
+    browser can pick a wider one on high-density screens, and a <picture>
+    source per transcoded format for browsers that accept it.
     """
-    url = None
+    url, srcset = _cached_poster(movie, size)
+    sources = []
+    if srcset:
+        sources = [
+            {'type': POSTER_FORMAT_TYPES[fmt], 'srcset': _srcset(local_poster_urls(movie, fmt))}
+            for fmt in movie.poster_formats or () if fmt in POSTER_FORMAT_TYPES
+        ]
     
-    if movie.poster_file and not movie.needs_poster_refresh():
-        url = movie.poster_file.url
+    if url:
         source = 'cached'
     else:
         poster_path = movie.data.get('poster_path') if movie.data else None
@@ -45,6 +77,9 @@ def movie_poster(movie, size='w300', css_class=''):
     
     return {
         'url': url,
+        'srcset': srcset,
+        'sources': sources,
+        'sizes': f"{size_width(size)}px",
         'title': title,
         'css_class': css_class,
         'source': source,
@@ -0,0 +1,84 @@
+from io import StringIO
+from unittest.mock import patch
+from django.core.management import call_command
+from django.db import DatabaseError
+from django.test import TestCase, override_settings
+from ..counters import SharedCounters
+from ..models import StatCounter
+from ..plex_utils import _count_webhook, reset_webhook_stats
+from ..tmdb_client import clear_details_cache, get_movie_details
+from .test_tmdb_client import TEST_CACHES, _details_response
+
+
+class SharedCountersTest(TestCase):
+    @override_settings(STATS_FLUSH_INTERVAL=0)
+    def test_processes_add_up(self):
+        # Two instances with one prefix stand in for two worker processes
+        web, worker = SharedCounters('test', ['hits', 'misses']), SharedCounters('test', ['hits', 'misses'])
+
+        web.incr('hits')
+        web.incr('hits', 'misses')
+        worker.incr('hits')
+
+        self.assertEqual(web.totals(), {'hits': 3, 'misses': 1})
+        self.assertEqual(worker.totals(), {'hits': 3, 'misses': 1})
+
+    @override_settings(STATS_FLUSH_INTERVAL=3600)
+    def test_increments_are_flushed_in_batches(self):
+        counters = SharedCounters('test', ['hits'])
+
+        with self.assertNumQueries(0):
+            for _ in range(100):
+                counters.incr('hits')
+        self.assertFalse(StatCounter.objects.exists())
+
+        self.assertEqual(counters.totals(), {'hits': 100})
+        self.assertEqual(StatCounter.objects.get(name='test.hits').value, 100)
+
+    @override_settings(STATS_FLUSH_INTERVAL=0)
+    def test_failed_flush_keeps_counts(self):
+        counters = SharedCounters('test', ['hits'])
+
+        with patch('catalog.models.StatCounter.objects.filter', side_effect=DatabaseError('database is locked')):
+            counters.incr('hits')
+
+        self.assertEqual(counters.totals(), {'hits': 1})
+
+    def test_reset(self):
+        counters = SharedCounters('test', ['hits'])
+        counters.incr('hits')
+        counters.flush()
+        counters.incr('hits')
+
+        counters.reset()
+
+        self.assertEqual(counters.totals(), {'hits': 0})
+
+
+class RuntimeStatsCommandTest(TestCase):
+    def test_shows_and_resets_webhook_counters(self):
+        reset_webhook_stats()
+        for stat in ('queued', 'suppressed', 'suppressed', 'ignored'):
+            _count_webhook(stat)
+        out = StringIO()
+
+        call_command('runtime_stats', '--reset', stdout=out)
+
+        self.assertIn('Received    4', out.getvalue())
+        self.assertIn('Suppressed  2 (50.0%)', out.getvalue())
+        self.assertFalse(StatCounter.objects.exists())
+
+    @override_settings(CACHES=TEST_CACHES)
+    @patch('catalog.tmdb_client.requests_get')
+    def test_shows_tmdb_details_cache_counters(self, mock_get):
+        clear_details_cache()
+        mock_get.return_value = _details_response('Cached Movie')
+        for _ in range(4):
+            get_movie_details('movie', 123, 'fake_api_key')
+        out = StringIO()
+
+        call_command('runtime_stats', stdout=out)
+
+        self.assertIn('Memory hits  3', out.getvalue())
+        self.assertIn('Misses       1', out.getvalue())
+        self.assertIn('Hit rate     75.0%', out.getvalue())
@@ -0,0 +1,84 @@
+import time
+from django.test import TestCase, override_settings
+from unittest.mock import patch, Mock
+from .. import http_client
+from ..http_client import get_session, close_sessions, requests_get, RateLimiter
+
+
+class HTTPClientTest(TestCase):
+    def setUp(self):
+        close_sessions()
+
+    def tearDown(self):
+        close_sessions()
+
+    def test_session_reused_for_same_host(self):
+        first = get_session('https://api.themoviedb.org/3/search/movie')
+        second = get_session('https://api.themoviedb.org/3/movie/123')
+
+        self.assertIs(first, second)
+
+    def test_session_per_host(self):
+        tmdb = get_session('https://api.themoviedb.org/3/movie/123')
+        trakt = get_session('https://api.trakt.tv/users/test/watched/movies')
+
+        self.assertIsNot(tmdb, trakt)
+
+    @override_settings(HTTP_POOL_MAXSIZE=7, HTTP_MAX_RETRIES=5)
+    def test_session_adapter_configuration(self):
+        session = get_session('https://image.tmdb.org/t/p/w300/test.jpg')
+        adapter = session.get_adapter('https://image.tmdb.org/')
+
+        self.assertEqual(adapter._pool_maxsize, 7)
+        self.assertEqual(adapter.max_retries.total, 5)
+        self.assertIn(503, adapter.max_retries.status_forcelist)
+
+    @override_settings(PROXY_ENABLED=True, PROXIES={'https': 'socks5://127.0.0.1:1080'})
+    def test_session_uses_proxies(self):
+        session = get_session('https://api.trakt.tv/')
+
+        self.assertEqual(session.proxies['https'], 'socks5://127.0.0.1:1080')
+
+    @override_settings(HTTP_TIMEOUT=3)
+    def test_requests_get_applies_default_timeout(self):
+        session = get_session('https://api.themoviedb.org/')
+        with patch.object(session, 'get', return_value=Mock()) as mock_get:
+            requests_get('https://api.themoviedb.org/3/movie/1', params={'a': 1})
+            requests_get('https://api.themoviedb.org/3/movie/2', timeout=30)
+
+        self.assertEqual(mock_get.call_args_list[0].kwargs['timeout'], 3)
+        self.assertEqual(mock_get.call_args_list[1].kwargs['timeout'], 30)
+
+    def test_reset_after_fork_drops_sessions(self):
+        get_session('https://api.themoviedb.org/')
+
+        http_client._reset_after_fork()
+
+        self.assertEqual(http_client._sessions, {})
+
+
+class RateLimiterTest(TestCase):
+    def test_disabled_limiter_never_waits(self):
+        limiter = RateLimiter(0)
+        with patch('catalog.http_client.time.sleep') as mock_sleep:
+            for _ in range(100):
+                limiter.acquire()
+        mock_sleep.assert_not_called()
+
+    def test_limiter_throttles_after_burst(self):
+        limiter = RateLimiter(50, burst=2)
+        started = time.monotonic()
+        for _ in range(7):
+            limiter.acquire()
+        elapsed = time.monotonic() - started
+
+        self.assertGreaterEqual(elapsed, 0.09)
+
+    def test_limiter_charges_amount(self):
+        limiter = RateLimiter(1000, burst=1000)
+        started = time.monotonic()
+        limiter.acquire(1000)
+        limiter.acquire(100)
+        elapsed = time.monotonic() - started
+
+        self.assertGreaterEqual(elapsed, 0.09)
@@ -0,0 +1,127 @@
+import os
+import shutil
+import tempfile
+from pathlib import Path
+from django.core.exceptions import ImproperlyConfigured
+from django.http import HttpResponse
+from django.test import RequestFactory, SimpleTestCase, override_settings
+from django.utils.http import http_date
+from ..middleware import PosterServingMiddleware
+
+POSTER = bytes(range(256)) * 4
+HASHED = 'tmdb_7_w300.0123456789ab.jpg'
+LEGACY = 'tmdb_7_w300.jpg'
+DERIVED = 'tmdb_7_w300.0123456789ab-89abcdef.webp'
+
+
+class PosterServingMiddlewareTest(SimpleTestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        posters = Path(self.media_root) / 'posters'
+        posters.mkdir()
+        for name in (HASHED, LEGACY, DERIVED):
+            (posters / name).write_bytes(POSTER)
+            os.utime(posters / name, (1700000000, 1700000000))
+        self.etag = f'"{1700000000:x}-{len(POSTER):x}"'
+        self.factory = RequestFactory()
+
+    def get(self, name, method='get', **headers):
+        with override_settings(MEDIA_ROOT=self.media_root, MEDIA_URL='/media/', POSTER_MAX_AGE=600):
+            middleware = PosterServingMiddleware(lambda request: HttpResponse('app', status=404))
+        return middleware(getattr(self.factory, method)(f'/media/posters/{name}', headers=headers))
+
+    def test_hashed_poster_is_immutable(self):
+        response = self.get(HASHED)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(b''.join(response.streaming_content), POSTER)
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+        self.assertEqual(response['Content-Length'], str(len(POSTER)))
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['ETag'], self.etag)
+        self.assertEqual(response['Last-Modified'], http_date(1700000000))
+        self.assertEqual(response['Accept-Ranges'], 'bytes')
+        response.close()
+
+    def test_legacy_poster_uses_max_age(self):
+        response = self.get(LEGACY)
+        response.close()
+
+        self.assertEqual(response['Cache-Control'], 'public, max-age=600')
+
+    def test_transcoded_poster_is_immutable(self):
+        response = self.get(DERIVED)
+        response.close()
+
+        self.assertEqual(response['Content-Type'], 'image/webp')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_conditional_requests(self):
+        self.assertEqual(self.get(HASHED, if_none_match=self.etag).status_code, 304)
+        self.assertEqual(self.get(HASHED, if_none_match=f'"other", W/{self.etag}').status_code, 304)
+        self.assertEqual(self.get(HASHED, if_modified_since=http_date(1700000000)).status_code, 304)
+        response = self.get(HASHED, if_none_match='"other"', if_modified_since=http_date(1700000000))
+        response.close()
+        self.assertEqual(response.status_code, 200)
+
+        not_modified = self.get(HASHED, if_none_match=self.etag)
+        self.assertEqual(not_modified['ETag'], self.etag)
+        self.assertEqual(not_modified['Cache-Control'], 'public, max-age=31536000, immutable')
+
+    def test_range_requests(self):
+        response = self.get(HASHED, range='bytes=10-19')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(response.content, POSTER[10:20])
+        self.assertEqual(response['Content-Range'], f'bytes 10-19/{len(POSTER)}')
+        self.assertEqual(response['Content-Length'], '10')
+
+        self.assertEqual(self.get(HASHED, range='bytes=-5').content, POSTER[-5:])
+        self.assertEqual(self.get(HASHED, range='bytes=1000-').content, POSTER[1000:])
+        self.assertEqual(self.get(HASHED, range='bytes=1000-5000')['Content-Range'], f'bytes 1000-1023/{len(POSTER)}')
+
+        unsatisfiable = self.get(HASHED, range='bytes=5000-')
+        self.assertEqual(unsatisfiable.status_code, 416)
+        self.assertEqual(unsatisfiable['Content-Range'], f'bytes */{len(POSTER)}')
+
+    def test_ignored_ranges_return_full_file(self):
+        for headers in ({'range': 'bytes=0-1,5-6'}, {'range': 'items=0-1'},
+                        {'range': 'bytes=0-1', 'if_range': '"stale"'}):
+            response = self.get(HASHED, **headers)
+            response.close()
+            self.assertEqual(response.status_code, 200, headers)
+        self.assertEqual(self.get(HASHED, range='bytes=0-1', if_range=self.etag).status_code, 206)
+
+    def test_head_has_no_body(self):
+        response = self.get(HASHED, method='head')
+
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['Content-Length'], str(len(POSTER)))
+
+    def test_other_paths_fall_through(self):
+        for name in ('tmdb_8_w300.jpg', '../settings.py', 'tmdb_7_w300.0123456789ab.png', 'nested/tmdb_7_w300.jpg',
+                     'tmdb_7_w300.0123456789ab-xyz.jpg'):
+            response = self.get(name)
+            self.assertEqual(response.content, b'app', name)
+        self.assertEqual(self.get(HASHED, method='post').content, b'app')
+
+    @override_settings(POSTER_SENDFILE='x-accel-redirect', POSTER_SENDFILE_PREFIX='/internal/posters/')
+    def test_x_accel_redirect(self):
+        response = self.get(HASHED, range='bytes=0-1')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.content, b'')
+        self.assertEqual(response['X-Accel-Redirect'], f'/internal/posters/{HASHED}')
+        self.assertEqual(response['Cache-Control'], 'public, max-age=31536000, immutable')
+        self.assertEqual(response['Content-Type'], 'image/jpeg')
+
+    @override_settings(POSTER_SENDFILE='x-sendfile')
+    def test_x_sendfile(self):
+        response = self.get(HASHED)
+
+        self.assertEqual(response['X-Sendfile'], str(Path(self.media_root) / 'posters' / HASHED))
+
+    @override_settings(POSTER_SENDFILE='sendfile')
+    def test_unknown_sendfile_mode(self):
+        with self.assertRaises(ImproperlyConfigured):
+            self.get(HASHED)
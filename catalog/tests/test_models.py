@@ -26,6 +26,34 @@ class MovieModelTest(TestCase):
         except Exception:
             pass  # Expected behavior
 
+    def test_set_data_reports_changes(self):
+        self.assertTrue(self.movie.set_data({'title': 'Test Movie'}, 'en-US'))
+        self.assertFalse(self.movie.set_data({'title': 'Test Movie'}, 'en-US'))
+        self.assertTrue(self.movie.set_data({'title': 'Changed'}, 'en-US'))
+        self.assertEqual(self.movie.data_language, 'en-US')
+        self.assertIsNotNone(self.movie.data_fetched_at)
+
+    def test_set_data_keeps_fetch_time_of_cached_details(self):
+        from datetime import timedelta
+        from ..tmdb_client import MovieDetails
+        fetched_at = timezone.now() - timedelta(days=10)
+
+        self.movie.set_data(MovieDetails({'title': 'Test Movie'}, fetched_at.timestamp()), 'en-US')
+
+        self.assertEqual(self.movie.data_fetched_at, fetched_at)
+        self.assertFalse(self.movie.is_data_fresh('en-US'))
+
+    def test_is_data_fresh(self):
+        from datetime import timedelta
+        self.assertFalse(self.movie.is_data_fresh('en-US'))
+
+        self.movie.set_data({'title': 'Test Movie'}, 'en-US')
+        self.assertTrue(self.movie.is_data_fresh('en-US'))
+        self.assertFalse(self.movie.is_data_fresh('ru-RU'))
+
+        self.movie.data_fetched_at = timezone.now() - timedelta(days=30)
+        self.assertFalse(self.movie.is_data_fresh('en-US'))
+
 class UserRatingModelTest(TestCase):
     def setUp(self):
         self.user = User(username='testuser', email='test@example.com')
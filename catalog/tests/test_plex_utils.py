@@ -1,8 +1,16 @@
-from django.test import TestCase
+from datetime import timedelta
+from io import StringIO
+from django.core.management import call_command
+from django.test import TestCase, TransactionTestCase, override_settings
 from django.contrib.auth.models import User
+from django.utils import timezone
 from unittest.mock import patch, MagicMock
-from ..models import Movie, UserRating, UserSettings
-from ..plex_utils import extract_tmdb_id_from_plex_guid, process_plex_event
+from ..models import Movie, UserRating, UserSettings, PlexWebhookEvent, PlexGuidMapping, ShowProgress, WatchEvent
+from ..plex_utils import (
+    process_plex_event, queue_webhook_event, process_pending_plex_events,
+    get_webhook_stats, reset_webhook_stats, compact_plex_payload, prune_webhook_events, compact_webhook_events,
+    resolve_plex_guid, backfill_guid_mappings, replay_webhook_events,
+)
 
 
 class PlexUtilsTest(TestCase):
@@ -14,52 +22,52 @@ class PlexUtilsTest(TestCase):
             language='en'
         )
 
-    def test_extract_tmdb_id_simple_tmdb_format(self):
+    def test_resolve_plex_guid_simple_tmdb_format(self):
         guid = 'tmdb://12345'
-        tmdb_id = extract_tmdb_id_from_plex_guid(guid)
+        tmdb_id = resolve_plex_guid(guid, 'movie')
         self.assertEqual(tmdb_id, 12345)
 
-    def test_extract_tmdb_id_themoviedb_format(self):
+    def test_resolve_plex_guid_themoviedb_format(self):
         guid = 'com.plexapp.agents.themoviedb://67890?lang=en'
-        tmdb_id = extract_tmdb_id_from_plex_guid(guid)
+        tmdb_id = resolve_plex_guid(guid, 'movie')
         self.assertEqual(tmdb_id, 67890)
 
-    def test_extract_tmdb_id_from_guid_array(self):
+    def test_resolve_plex_guid_from_guid_array(self):
         guid = 'plex://movie/5d776825880197001ec90e31'
         guid_list = [
             {'id': 'imdb://tt1234567'},
             {'id': 'tmdb://99999'},
             {'id': 'tvdb://111111'}
         ]
-        tmdb_id = extract_tmdb_id_from_plex_guid(guid, guid_list)
+        tmdb_id = resolve_plex_guid(guid, 'movie', guid_list)
         self.assertEqual(tmdb_id, 99999)
 
-    def test_extract_tmdb_id_no_match(self):
+    def test_resolve_plex_guid_no_match(self):
         guid = 'plex://movie/5d776825880197001ec90e31'
-        tmdb_id = extract_tmdb_id_from_plex_guid(guid)
+        tmdb_id = resolve_plex_guid(guid, 'movie')
         self.assertIsNone(tmdb_id)
 
-    def test_extract_tmdb_id_empty_guid(self):
-        tmdb_id = extract_tmdb_id_from_plex_guid('')
+    def test_resolve_plex_guid_empty_guid(self):
+        tmdb_id = resolve_plex_guid('', 'movie')
         self.assertIsNone(tmdb_id)
 
-    def test_extract_tmdb_id_ignores_tvdb(self):
+    def test_resolve_plex_guid_ignores_tvdb(self):
         guid = 'plex://show/5fd2a1b82de5fd002dd4c7b1'
         guid_list = [
             {'id': 'tvdb://5127547'},
             {'id': 'imdb://tt1234567'}
         ]
-        tmdb_id = extract_tmdb_id_from_plex_guid(guid, guid_list)
+        tmdb_id = resolve_plex_guid(guid, 'tv', guid_list)
         self.assertIsNone(tmdb_id)
 
-    def test_extract_tmdb_id_prefers_tmdb_over_others(self):
+    def test_resolve_plex_guid_prefers_tmdb_over_others(self):
         guid = 'plex://show/5fd2a1b82de5fd002dd4c7b1'
         guid_list = [
             {'id': 'tvdb://5127547'},
             {'id': 'tmdb://88888'},
             {'id': 'imdb://tt1234567'}
         ]
-        tmdb_id = extract_tmdb_id_from_plex_guid(guid, guid_list)
+        tmdb_id = resolve_plex_guid(guid, 'tv', guid_list)
         self.assertEqual(tmdb_id, 88888)
 
     @patch('catalog.plex_utils.get_movie_details')
@@ -90,8 +98,9 @@ class PlexUtilsTest(TestCase):
         user_rating = UserRating.objects.get(user=self.user, movie=movie)
         self.assertIsNotNone(user_rating.watched_at)
 
+    @patch('catalog.plex_utils.find_show_by_episode', return_value=77777)
     @patch('catalog.plex_utils.get_movie_details')
-    def test_process_plex_event_episode_with_guid_array(self, mock_get_details):
+    def test_process_plex_event_episode_with_guid_array(self, mock_get_details, mock_find_show):
         mock_get_details.return_value = {
             'name': 'Test Show',
             'overview': 'Test overview',
@@ -117,7 +126,10 @@ class PlexUtilsTest(TestCase):
         result = process_plex_event(self.user, 'media.scrobble', payload)
         self.assertTrue(result)
 
-        movie = Movie.objects.get(tmdb_id=88888)
+        # tmdb://88888 is the episode's own ID; the show comes from TMDB's lookup of the IMDb ID
+        mock_find_show.assert_called_once_with('tt1234567', 'imdb_id', 'test_tmdb_key_32_characters_long_')
+        self.assertFalse(Movie.objects.filter(tmdb_id=88888).exists())
+        movie = Movie.objects.get(tmdb_id=77777)
         self.assertEqual(movie.title, 'Test Show')
         self.assertEqual(movie.media_type, 'tv')
 
@@ -218,6 +230,12 @@ class PlexUtilsTest(TestCase):
         second_watched_at = user_rating.watched_at
         self.assertIsNotNone(second_watched_at)
         self.assertGreater(second_watched_at, first_watched_at)
+        self.assertEqual(user_rating.play_count, 2)
+        self.assertEqual(user_rating.first_watched_at, first_watched_at)
+        self.assertEqual(
+            list(WatchEvent.objects.filter(user=self.user, movie=movie).order_by('watched_at').values_list('watched_at', 'source')),
+            [(first_watched_at, 'plex'), (second_watched_at, 'plex')],
+        )
 
     @patch('catalog.plex_utils.get_movie_details')
     def test_process_plex_event_uses_user_language(self, mock_get_details):
@@ -268,3 +286,475 @@ class PlexUtilsTest(TestCase):
         result = process_plex_event(self.user, 'media.scrobble', payload)
         self.assertFalse(result)
         mock_get_details.assert_not_called()
+
+
+class PlexFreshnessTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='freshuser', password='password')
+        UserSettings.objects.create(user=self.user, tmdb_api_key='test_tmdb_key_32_characters_long_', language='en')
+        self.payload = {
+            'event': 'media.play',
+            'Metadata': {'type': 'movie', 'guid': 'tmdb://777', 'title': 'Plex Title', 'Guid': []},
+        }
+
+    @patch('catalog.plex_utils.get_movie_details')
+    def test_fresh_movie_skips_tmdb(self, mock_get_details):
+        movie = Movie(tmdb_id=777, media_type='movie', title='Stored Title')
+        movie.set_data({'title': 'Stored Title'}, 'en-US')
+        movie.save()
+
+        result = process_plex_event(self.user, 'media.play', self.payload)
+
+        self.assertTrue(result)
+        mock_get_details.assert_not_called()
+        self.assertTrue(UserRating.objects.filter(user=self.user, movie=movie).exists())
+
+    @patch('catalog.plex_utils.get_movie_details')
+    def test_stale_movie_with_unchanged_payload_keeps_data(self, mock_get_details):
+        from datetime import timedelta
+        from django.utils import timezone
+        mock_get_details.return_value = {'title': 'Stored Title'}
+        movie = Movie(tmdb_id=777, media_type='movie', title='Stored Title')
+        movie.set_data({'title': 'Stored Title'}, 'en-US')
+        movie.data_fetched_at = timezone.now() - timedelta(days=30)
+        movie.save()
+
+        with patch.object(Movie, 'save', autospec=True, side_effect=Movie.save) as mock_save:
+            process_plex_event(self.user, 'media.play', self.payload)
+
+        mock_get_details.assert_called_once()
+        self.assertEqual(mock_save.call_args.kwargs['update_fields'], ['data_fetched_at', 'data_language'])
+        movie.refresh_from_db()
+        self.assertTrue(movie.is_data_fresh('en-US'))
+
+    @patch('catalog.plex_utils.get_movie_details')
+    def test_language_change_refetches(self, mock_get_details):
+        mock_get_details.return_value = {'title': 'Русское название'}
+        movie = Movie(tmdb_id=777, media_type='movie', title='Stored Title')
+        movie.set_data({'title': 'Stored Title'}, 'ru-RU')
+        movie.save()
+
+        process_plex_event(self.user, 'media.play', self.payload)
+
+        movie.refresh_from_db()
+        self.assertEqual(movie.title, 'Русское название')
+        self.assertEqual(movie.data_language, 'en-US')
+
+
+class PlexEventQueueTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='queueuser', password='password')
+        UserSettings.objects.create(user=self.user, tmdb_api_key='test_tmdb_key_32_characters_long_', language='en')
+        movie = Movie(tmdb_id=555, media_type='movie', title='Queued Movie')
+        movie.set_data({'title': 'Queued Movie'}, 'en-US')
+        movie.save()
+
+    def _rate_payload(self, rating):
+        return {
+            'event': 'media.rate',
+            'Metadata': {'type': 'movie', 'guid': 'tmdb://555', 'title': 'Queued Movie', 'userRating': rating, 'Guid': []},
+        }
+
+    def test_unsupported_events_are_not_queued(self):
+        event, queued = queue_webhook_event(self.user, 'media.pause', {'event': 'media.pause'})
+
+        self.assertFalse(queued)
+        self.assertIsNotNone(event.processed_at)
+        self.assertEqual(process_pending_plex_events(self.user), 0)
+
+    def test_pending_events_processed_in_arrival_order(self):
+        for rating in (4, 6, 9):
+            queue_webhook_event(self.user, 'media.rate', self._rate_payload(rating))
+
+        handled = process_pending_plex_events(self.user)
+
+        self.assertEqual(handled, 3)
+        self.assertEqual(UserRating.objects.get(user=self.user, movie_id=555).rating, 9)
+        self.assertFalse(PlexWebhookEvent.objects.filter(processed_at__isnull=True).exists())
+        self.assertEqual(PlexWebhookEvent.objects.filter(processed=True).count(), 3)
+        self.assertEqual(process_pending_plex_events(self.user), 0)
+
+    def test_rating_changed_back_within_window_is_applied(self):
+        for rating in (6, 8, 6):
+            queue_webhook_event(self.user, 'media.rate', self._rate_payload(rating))
+
+        self.assertEqual(process_pending_plex_events(self.user), 3)
+        self.assertEqual(UserRating.objects.get(user=self.user, movie_id=555).rating, 6)
+
+    def test_processing_error_is_recorded(self):
+        event, _ = queue_webhook_event(self.user, 'media.rate', self._rate_payload(7))
+
+        with patch('catalog.plex_utils.process_plex_event', side_effect=Exception('boom')):
+            process_pending_plex_events(self.user)
+
+        event.refresh_from_db()
+        self.assertFalse(event.processed)
+        self.assertEqual(event.error_message, 'boom')
+        self.assertIsNotNone(event.processed_at)
+
+
+class PlexEventDedupTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='dedupuser', password='password')
+        reset_webhook_stats()
+
+    def _payload(self, event, rating_key='101', **metadata):
+        return {'event': event, 'Metadata': {'type': 'movie', 'guid': 'tmdb://101', 'ratingKey': rating_key, **metadata}}
+
+    def test_repeated_play_is_collapsed(self):
+        first, queued = queue_webhook_event(self.user, 'media.play', self._payload('media.play'))
+        self.assertTrue(queued)
+
+        for _ in range(3):
+            event, queued = queue_webhook_event(self.user, 'media.play', self._payload('media.play'))
+            self.assertFalse(queued)
+            self.assertEqual(event.pk, first.pk)
+
+        first.refresh_from_db()
+        self.assertEqual(PlexWebhookEvent.objects.count(), 1)
+        self.assertEqual(first.repeat_count, 4)
+        self.assertEqual(get_webhook_stats(), {'received': 4, 'queued': 1, 'ignored': 0, 'suppressed': 3})
+
+    def test_different_event_or_item_is_not_collapsed(self):
+        queue_webhook_event(self.user, 'media.play', self._payload('media.play'))
+        _, scrobble_queued = queue_webhook_event(self.user, 'media.scrobble', self._payload('media.scrobble'))
+        _, other_queued = queue_webhook_event(self.user, 'media.play', self._payload('media.play', rating_key='202'))
+
+        self.assertTrue(scrobble_queued)
+        self.assertTrue(other_queued)
+        self.assertEqual(PlexWebhookEvent.objects.count(), 3)
+
+    def test_changed_rating_is_not_collapsed(self):
+        queue_webhook_event(self.user, 'media.rate', self._payload('media.rate', userRating=6))
+        _, queued = queue_webhook_event(self.user, 'media.rate', self._payload('media.rate', userRating=8))
+
+        self.assertTrue(queued)
+
+    def test_rating_changed_back_is_not_collapsed(self):
+        for rating in (6, 8):
+            queue_webhook_event(self.user, 'media.rate', self._payload('media.rate', userRating=rating))
+        _, queued = queue_webhook_event(self.user, 'media.rate', self._payload('media.rate', userRating=6))
+        _, repeat_queued = queue_webhook_event(self.user, 'media.rate', self._payload('media.rate', userRating=6))
+
+        self.assertTrue(queued)
+        self.assertFalse(repeat_queued)
+        self.assertEqual(PlexWebhookEvent.objects.count(), 3)
+
+    def test_repeat_after_failure_is_queued(self):
+        event, _ = queue_webhook_event(self.user, 'media.scrobble', self._payload('media.scrobble'))
+        PlexWebhookEvent.objects.filter(pk=event.pk).update(processed_at=event.created_at, error_message='boom')
+
+        _, queued = queue_webhook_event(self.user, 'media.scrobble', self._payload('media.scrobble'))
+
+        self.assertTrue(queued)
+
+    @override_settings(PLEX_WEBHOOK_DEDUP_WINDOW=0)
+    def test_dedup_can_be_disabled(self):
+        queue_webhook_event(self.user, 'media.play', self._payload('media.play'))
+        _, queued = queue_webhook_event(self.user, 'media.play', self._payload('media.play'))
+
+        self.assertTrue(queued)
+        self.assertEqual(PlexWebhookEvent.objects.count(), 2)
+
+
+PLEX_FULL_PAYLOAD = {
+    'event': 'media.scrobble',
+    'Account': {'id': 1, 'title': 'owner', 'thumb': 'https://plex.tv/users/1/avatar'},
+    'Server': {'title': 'server', 'uuid': 'abc'},
+    'Player': {'local': True, 'publicAddress': '10.0.0.1', 'title': 'TV', 'uuid': 'def'},
+    'Metadata': {
+        'type': 'movie', 'ratingKey': '42', 'guid': 'plex://movie/5d776', 'title': 'Movie',
+        'Guid': [{'id': 'tmdb://42'}], 'summary': 'x' * 500, 'Genre': [{'tag': 'Drama'}], 'thumb': '/thumb',
+    },
+}
+
+
+class PlexEventStorageTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='storageuser', password='password')
+
+    def _event(self, age_days=0, pending=False):
+        seen = timezone.now() - timedelta(days=age_days)
+        return PlexWebhookEvent.objects.create(
+            user=self.user, event_type='media.play', payload={'event': 'media.play'},
+            created_at=seen, last_seen_at=seen, processed_at=None if pending else seen,
+        )
+
+    def test_compact_payload_keeps_processing_fields(self):
+        compact = compact_plex_payload(PLEX_FULL_PAYLOAD)
+
+        self.assertEqual(compact, {
+            'event': 'media.scrobble',
+            'Metadata': {
+                'type': 'movie', 'ratingKey': '42', 'guid': 'plex://movie/5d776', 'title': 'Movie',
+                'Guid': [{'id': 'tmdb://42'}],
+            },
+        })
+
+    def test_queued_event_stores_compact_payload(self):
+        event, _ = queue_webhook_event(self.user, 'media.scrobble', PLEX_FULL_PAYLOAD)
+
+        self.assertNotIn('Player', event.payload)
+        self.assertIsNone(event.get_raw_payload())
+
+    @override_settings(PLEX_EVENT_KEEP_RAW_PAYLOAD=True)
+    def test_raw_payload_kept_compressed(self):
+        event, _ = queue_webhook_event(self.user, 'media.scrobble', PLEX_FULL_PAYLOAD)
+
+        event.refresh_from_db()
+        self.assertEqual(event.get_raw_payload(), PLEX_FULL_PAYLOAD)
+
+    def test_prune_by_age_keeps_pending(self):
+        old = self._event(age_days=100)
+        old_pending = self._event(age_days=100, pending=True)
+        recent = self._event(age_days=1)
+
+        result = prune_webhook_events(max_age_days=90, max_per_user=0, chunk_size=1)
+
+        self.assertEqual(result, {'expired': 1, 'over_cap': 0})
+        remaining = set(PlexWebhookEvent.objects.values_list('id', flat=True))
+        self.assertEqual(remaining, {old_pending.id, recent.id})
+        self.assertNotIn(old.id, remaining)
+
+    def test_prune_per_user_cap_keeps_newest(self):
+        events = [self._event() for _ in range(5)]
+
+        result = prune_webhook_events(max_age_days=0, max_per_user=2, chunk_size=2)
+
+        self.assertEqual(result['over_cap'], 3)
+        self.assertEqual(set(PlexWebhookEvent.objects.values_list('id', flat=True)), {events[3].id, events[4].id})
+
+    def test_compact_existing_events(self):
+        PlexWebhookEvent.objects.create(user=self.user, event_type='media.scrobble', payload=PLEX_FULL_PAYLOAD)
+        self._event()
+
+        self.assertEqual(compact_webhook_events(), 1)
+        self.assertEqual(PlexWebhookEvent.objects.filter(payload__has_key='Player').count(), 0)
+
+    def test_prune_command(self):
+        self._event(age_days=100)
+        out = StringIO()
+
+        call_command('prune_plex_events', '--days', '90', '--compact', stdout=out)
+
+        self.assertIn('Removed 1 expired events', out.getvalue())
+        self.assertFalse(PlexWebhookEvent.objects.exists())
+
+
+class PlexGuidMappingTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='guiduser', password='password')
+        UserSettings.objects.create(user=self.user, tmdb_api_key='test_tmdb_key_32_characters_long_', language='en')
+
+    def _episode_payload(self, guid_list):
+        return {
+            'event': 'media.scrobble',
+            'Metadata': {
+                'type': 'episode',
+                'guid': 'plex://episode/65c2577ab267ed59cc12c5b3',
+                'grandparentGuid': 'plex://show/5d9c081c46115600200aa7d6',
+                'grandparentTitle': 'Test Show',
+                'Guid': guid_list,
+            },
+        }
+
+    def test_guid_array_resolution_is_learned(self):
+        tmdb_id = resolve_plex_guid('plex://movie/5d776', 'movie', [{'id': 'tmdb://603'}])
+
+        self.assertEqual(tmdb_id, 603)
+        mapping = PlexGuidMapping.objects.get(plex_guid='plex://movie/5d776')
+        self.assertEqual((mapping.media_type, mapping.tmdb_id), ('movie', 603))
+        self.assertEqual(resolve_plex_guid('plex://movie/5d776', 'movie'), 603)
+
+    def test_tmdb_guid_is_not_stored(self):
+        self.assertEqual(resolve_plex_guid('tmdb://603', 'movie'), 603)
+        self.assertFalse(PlexGuidMapping.objects.exists())
+
+    def test_unknown_plex_guid_resolves_to_none(self):
+        self.assertIsNone(resolve_plex_guid('plex://movie/unknown', 'movie'))
+
+    @patch('catalog.plex_utils.find_show_by_episode', return_value=1396)
+    @patch('catalog.plex_utils.get_movie_details')
+    def test_episode_show_guid_learned_from_tmdb_lookup(self, mock_get_details, mock_find_show):
+        mock_get_details.return_value = {'name': 'Test Show'}
+
+        self.assertTrue(process_plex_event(self.user, 'media.scrobble', self._episode_payload([
+            {'id': 'tvdb://349232'}, {'id': 'tmdb://62085'},
+        ])))
+        self.assertTrue(process_plex_event(self.user, 'media.scrobble', self._episode_payload([])))
+
+        mock_find_show.assert_called_once_with('349232', 'tvdb_id', 'test_tmdb_key_32_characters_long_')
+        mapping = PlexGuidMapping.objects.get(plex_guid='plex://show/5d9c081c46115600200aa7d6')
+        self.assertEqual((mapping.media_type, mapping.tmdb_id), ('tv', 1396))
+        self.assertEqual(UserRating.objects.get(user=self.user).movie_id, 1396)
+
+    @patch('catalog.plex_utils.get_movie_details')
+    def test_episode_tmdb_id_is_not_taken_for_the_show(self, mock_get_details):
+        self.assertFalse(process_plex_event(self.user, 'media.scrobble', self._episode_payload([{'id': 'tmdb://62085'}])))
+
+        mock_get_details.assert_not_called()
+        self.assertFalse(PlexGuidMapping.objects.exists())
+
+    @patch('catalog.plex_utils.get_movie_details')
+    def test_show_event_teaches_show_guid(self, mock_get_details):
+        mock_get_details.return_value = {'name': 'Test Show'}
+        payload = {
+            'event': 'media.rate',
+            'Metadata': {'type': 'show', 'guid': 'plex://show/5d9c081c46115600200aa7d6', 'title': 'Test Show',
+                         'Guid': [{'id': 'tmdb://1396'}], 'userRating': 9},
+        }
+
+        self.assertTrue(process_plex_event(self.user, 'media.rate', payload))
+        self.assertEqual(resolve_plex_guid('plex://show/5d9c081c46115600200aa7d6', 'tv'), 1396)
+        self.assertEqual(UserRating.objects.get(user=self.user, movie_id=1396).rating, 9)
+
+    def test_backfill_from_stored_events(self):
+        PlexWebhookEvent.objects.create(user=self.user, event_type='media.scrobble', payload=PLEX_FULL_PAYLOAD)
+        PlexWebhookEvent.objects.create(
+            user=self.user, event_type='media.scrobble', payload=self._episode_payload([{'id': 'tmdb://62085'}])
+        )
+        PlexWebhookEvent.objects.create(user=self.user, event_type='media.rate', payload={'Metadata': {
+            'type': 'show', 'guid': 'plex://show/5d9c081c46115600200aa7d6', 'Guid': [{'id': 'tmdb://1396'}],
+        }})
+        PlexWebhookEvent.objects.create(
+            user=self.user, event_type='media.play', payload={'Metadata': {'type': 'movie', 'guid': 'tmdb://1'}}
+        )
+
+        self.assertEqual(backfill_guid_mappings(chunk_size=1), 2)
+        self.assertEqual(backfill_guid_mappings(), 0)
+        self.assertEqual(
+            set(PlexGuidMapping.objects.values_list('plex_guid', 'tmdb_id')),
+            {('plex://movie/5d776', 42), ('plex://show/5d9c081c46115600200aa7d6', 1396)},
+        )
+
+
+class PlexEventReplayTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='replayuser', password='password')
+        UserSettings.objects.create(user=self.user, tmdb_api_key='test_tmdb_key_32_characters_long_', language='en')
+        self.other = User.objects.create_user(username='otheruser', password='password')
+        UserSettings.objects.create(user=self.other, tmdb_api_key='test_tmdb_key_32_characters_long_', language='en')
+
+    def _event(self, user, event_type, tmdb_id, failed=False, **metadata):
+        received = timezone.now() - timedelta(days=30)
+        return PlexWebhookEvent.objects.create(
+            user=user, event_type=event_type,
+            payload={'event': event_type, 'Metadata': {'type': 'movie', 'guid': f'tmdb://{tmdb_id}', **metadata}},
+            created_at=received, last_seen_at=received,
+            processed_at=received if failed else None, error_message='boom' if failed else '',
+        )
+
+    @patch('catalog.plex_utils.get_movie_details')
+    def test_replays_failed_and_pending_in_order(self, mock_get_details):
+        mock_get_details.side_effect = lambda media_type, tmdb_id, *args: {'title': f'Movie {tmdb_id}'}
+        failed = self._event(self.user, 'media.scrobble', 10, failed=True)
+        self._event(self.user, 'media.rate', 10, userRating=4)
+        self._event(self.user, 'media.rate', 10, userRating=8)
+        self._event(self.other, 'media.play', 20)
+
+        stats = replay_webhook_events(chunk_size=2, workers=2)
+
+        self.assertEqual((stats['users'], stats['events'], stats['processed']), (2, 4, 4))
+        rating = UserRating.objects.get(user=self.user, movie_id=10)
+        self.assertEqual(rating.rating, 8)
+        self.assertEqual(rating.watched_at, failed.created_at)
+        self.assertTrue(UserRating.objects.filter(user=self.other, movie_id=20).exists())
+        self.assertFalse(PlexWebhookEvent.objects.filter(processed=False).exists())
+        self.assertEqual(replay_webhook_events()['events'], 0)
+
+    @patch('catalog.plex_utils.get_movie_details')
+    def test_failed_only_and_user_filter(self, mock_get_details):
+        mock_get_details.return_value = {'title': 'Movie'}
+        self._event(self.user, 'media.play', 10, failed=True)
+        self._event(self.user, 'media.play', 11)
+        self._event(self.other, 'media.play', 20, failed=True)
+
+        stats = replay_webhook_events(usernames=['replayuser'], include_pending=False)
+
+        self.assertEqual(stats['events'], 1)
+        self.assertEqual(PlexWebhookEvent.objects.filter(processed=True).count(), 1)
+
+    @patch('catalog.plex_utils.get_movie_details')
+    def test_older_failed_rating_does_not_overwrite_newer(self, mock_get_details):
+        mock_get_details.return_value = {'title': 'Movie 10'}
+        older = self._event(self.user, 'media.rate', 10, failed=True, userRating=6)
+        newer = self._event(self.user, 'media.rate', 10, userRating=8)
+        process_pending_plex_events(self.user)
+
+        replay_webhook_events()
+
+        self.assertEqual(UserRating.objects.get(user=self.user, movie_id=10).rating, 8)
+        older.refresh_from_db()
+        self.assertEqual(older.error_message, 'Superseded by a later rating')
+        newer.refresh_from_db()
+        self.assertTrue(newer.processed)
+
+    @patch('catalog.plex_utils.get_movie_details')
+    def test_in_flight_events_are_left_to_the_worker(self, mock_get_details):
+        mock_get_details.return_value = {'title': 'Movie'}
+        in_flight = self._event(self.user, 'media.play', 10)
+        abandoned = self._event(self.user, 'media.play', 11)
+        PlexWebhookEvent.objects.filter(pk=in_flight.pk).update(processed_at=timezone.now())
+        PlexWebhookEvent.objects.filter(pk=abandoned.pk).update(processed_at=timezone.now() - timedelta(hours=1))
+
+        stats = replay_webhook_events()
+
+        self.assertEqual(stats['events'], 1)
+        self.assertTrue(PlexWebhookEvent.objects.get(pk=abandoned.pk).processed)
+        self.assertFalse(PlexWebhookEvent.objects.get(pk=in_flight.pk).processed)
+
+    def test_user_without_settings_does_not_abort_replay(self):
+        nosettings = User.objects.create_user(username='nosettings', password='password')
+        event = self._event(nosettings, 'media.play', 10, failed=True)
+
+        stats = replay_webhook_events()
+
+        self.assertEqual(stats['events'], 1)
+        event.refresh_from_db()
+        self.assertEqual(event.error_message, 'Event not processed')
+
+    @patch('catalog.plex_utils.get_movie_details')
+    def test_replay_command_reports_throughput(self, mock_get_details):
+        mock_get_details.return_value = {'title': 'Movie'}
+        self._event(self.user, 'media.play', 10, failed=True)
+        out = StringIO()
+
+        call_command('replay_plex_events', stdout=out)
+
+        self.assertIn('Replayed 1 events for 1 users', out.getvalue())
+        self.assertIn('events/s', out.getvalue())
+
+
+class PlexEpisodeWatchTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='episodeuser', password='password')
+        UserSettings.objects.create(user=self.user, tmdb_api_key='test_tmdb_key_32_characters_long_', language='en')
+
+    def _scrobble(self, season, episode, received_at):
+        payload = {
+            'event': 'media.scrobble',
+            'Metadata': {
+                'type': 'episode', 'grandparentGuid': 'tmdb://77', 'grandparentTitle': 'Show',
+                'parentIndex': season, 'index': episode,
+            },
+        }
+        return process_plex_event(self.user, 'media.scrobble', payload, received_at=received_at)
+
+    @patch('catalog.plex_utils.get_movie_details')
+    def test_episode_scrobbles_are_tracked_per_episode(self, mock_get_details):
+        mock_get_details.return_value = {'name': 'Show'}
+        first = timezone.now() - timedelta(days=2)
+        second = timezone.now() - timedelta(days=1)
+
+        self.assertTrue(self._scrobble(1, 1, first))
+        self.assertTrue(self._scrobble(1, 2, second))
+
+        progress = ShowProgress.objects.get(user=self.user, show_id=77)
+        self.assertEqual(progress.episodes_watched, 2)
+        self.assertEqual((progress.last_season, progress.last_episode, progress.last_watched_at), (1, 2, second))
+        self.assertEqual(UserRating.objects.get(user=self.user, movie_id=77).watched_at, second)
+
+    def test_compact_payload_keeps_episode_numbers(self):
+        metadata = compact_plex_payload({'Metadata': {'type': 'episode', 'parentIndex': 2, 'index': 5}})['Metadata']
+
+        self.assertEqual((metadata['parentIndex'], metadata['index']), (2, 5))
@@ -0,0 +1,388 @@
+import hashlib
+import os
+import shutil
+import tempfile
+import threading
+import time
+from io import BytesIO, StringIO
+from pathlib import Path
+from unittest import skipUnless
+from unittest.mock import ANY, patch, MagicMock
+import requests
+from django.core.management import call_command
+from django.template import Context, Template
+from django.test import TestCase, override_settings
+from PIL import Image, features
+from ..models import Movie
+from ..poster_cache import (
+    cache_posters_bulk, cleanup_orphaned_posters, derive_poster_sizes, download_tmdb_poster, poster_encoding,
+)
+
+
+def poster_response(content=b'\xff\xd8poster', chunks=None):
+    response = MagicMock()
+    response.iter_content.return_value = chunks if chunks is not None else [content]
+    response.raise_for_status.return_value = None
+    return response
+
+
+def jpeg_bytes(width=500, height=750):
+    buffer = BytesIO()
+    Image.new('RGB', (width, height), (200, 40, 40)).save(buffer, 'JPEG')
+    return buffer.getvalue()
+
+
+def content_hash(content):
+    return hashlib.sha256(content).hexdigest()[:12]
+
+
+def derived_version(content):
+    return f'{content_hash(content)}-{poster_encoding()}'
+
+
+def age(path, seconds=7200):
+    os.utime(path, (time.time() - seconds, time.time() - seconds))
+
+
+def broken_stream(*chunks):
+    yield from chunks
+    raise requests.ConnectionError('connection reset mid-body')
+
+
+class PosterDownloadTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.movie = Movie.objects.create(tmdb_id=7, media_type='movie', title='Movie 7',
+                                          data={'poster_path': '/poster7.jpg'})
+        self.posters = Path(self.media_root) / 'posters'
+
+    @patch('catalog.poster_cache.requests_get')
+    def test_poster_streamed_in_chunks(self, mock_get):
+        mock_get.return_value = poster_response(chunks=[b'\xff\xd8', b'part1', b'part2'])
+
+        self.assertTrue(download_tmdb_poster(self.movie, force=True))
+
+        self.assertTrue(mock_get.call_args.kwargs['stream'])
+        version = content_hash(b'\xff\xd8part1part2')
+        name = f'tmdb_7_w500.{version}.jpg'
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.poster_hash, version)
+        self.assertEqual(self.movie.poster_file.name, f'posters/{name}')
+        self.assertEqual((self.posters / name).read_bytes(), b'\xff\xd8part1part2')
+        self.assertEqual(os.stat(self.posters / name).st_mode & 0o777, 0o644)
+        mock_get.return_value.close.assert_called_once()
+
+    @patch('catalog.poster_cache.requests_get')
+    def test_unchanged_poster_keeps_its_name(self, mock_get):
+        mock_get.return_value = poster_response(b'same')
+        download_tmdb_poster(self.movie, force=True)
+        mock_get.return_value = poster_response(b'same')
+        download_tmdb_poster(self.movie, force=True)
+
+        self.assertEqual(sorted(p.name for p in self.posters.iterdir()), [f"tmdb_7_w500.{content_hash(b'same')}.jpg"])
+
+    @patch('catalog.poster_cache.requests_get')
+    def test_changed_poster_gets_new_name(self, mock_get):
+        mock_get.return_value = poster_response(b'old')
+        download_tmdb_poster(self.movie, force=True)
+        old = self.posters / f"tmdb_7_w500.{content_hash(b'old')}.jpg"
+        mock_get.return_value = poster_response(b'new')
+        download_tmdb_poster(self.movie, force=True)
+
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.poster_file.name, f"posters/tmdb_7_w500.{content_hash(b'new')}.jpg")
+        # Pages rendered before the refresh may still reference the old file until cleanup
+        self.assertEqual(old.read_bytes(), b'old')
+        self.assertEqual(cleanup_orphaned_posters(), 0)
+        age(old)
+        self.assertEqual(cleanup_orphaned_posters(), 1)
+        self.assertFalse(old.exists())
+
+    @patch('catalog.poster_cache.requests_get')
+    def test_interrupted_download_keeps_previous_poster(self, mock_get):
+        mock_get.return_value = poster_response(b'old')
+        download_tmdb_poster(self.movie, force=True)
+        self.movie.refresh_from_db()
+        cached_at = self.movie.poster_cached_at
+
+        mock_get.return_value = poster_response(chunks=broken_stream(b'ne'))
+        self.assertFalse(download_tmdb_poster(self.movie, force=True))
+
+        name = f"tmdb_7_w500.{content_hash(b'old')}.jpg"
+        self.assertEqual(sorted(p.name for p in self.posters.iterdir()), [name])
+        self.assertEqual((self.posters / name).read_bytes(), b'old')
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.poster_cached_at, cached_at)
+
+    def test_cleanup_removes_stale_partial_downloads(self):
+        self.posters.mkdir()
+        stale = self.posters / '.tmdb_7_w300-abc.part'
+        fresh = self.posters / '.tmdb_8_w300-def.part'
+        stale.write_bytes(b'x')
+        fresh.write_bytes(b'x')
+        age(stale)
+
+        self.assertEqual(cleanup_orphaned_posters(), 1)
+        self.assertFalse(stale.exists())
+        self.assertTrue(fresh.exists())
+
+
+@override_settings(POSTER_CACHE_SIZE='w500', POSTER_SIZES=['w200', 'w300', 'w780'])
+class PosterSizesTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_URL='/media/')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.movie = Movie.objects.create(tmdb_id=9, media_type='movie', title='Movie 9',
+                                          data={'poster_path': '/poster9.jpg'})
+        self.posters = Path(self.media_root) / 'posters'
+
+    @patch('catalog.poster_cache.requests_get')
+    def test_smaller_sizes_derived_from_master(self, mock_get):
+        mock_get.return_value = poster_response(jpeg_bytes())
+
+        self.assertTrue(download_tmdb_poster(self.movie, force=True))
+
+        mock_get.assert_called_once_with('https://image.tmdb.org/t/p/w500/poster9.jpg', headers=ANY, timeout=10, stream=True)
+        self.movie.refresh_from_db()
+        version = content_hash(jpeg_bytes())
+        self.assertEqual(self.movie.poster_file.name, f'posters/tmdb_9_w500.{version}.jpg')
+        self.assertEqual(self.movie.poster_sizes, ['w200', 'w300', 'w500'])
+        derived = derived_version(jpeg_bytes())
+        with Image.open(self.posters / f'tmdb_9_w200.{derived}.jpg') as small:
+            self.assertEqual(small.size, (200, 300))
+        with Image.open(self.posters / f'tmdb_9_w300.{derived}.jpg') as medium:
+            self.assertEqual(medium.size, (300, 450))
+        self.assertFalse((self.posters / f'tmdb_9_w780.{derived}.jpg').exists())
+
+    @patch('catalog.poster_cache.requests_get')
+    def test_movie_poster_renders_local_srcset(self, mock_get):
+        mock_get.return_value = poster_response(jpeg_bytes())
+        download_tmdb_poster(self.movie, force=True)
+
+        html = Template("{% load poster_tags %}{% movie_poster movie size='w300' %}|{% poster_url movie 'w780' %}").render(
+            Context({'movie': self.movie}))
+
+        version = content_hash(jpeg_bytes())
+        derived = derived_version(jpeg_bytes())
+        self.assertIn(f'src="/media/posters/tmdb_9_w300.{derived}.jpg"', html)
+        self.assertIn(
+            f'srcset="/media/posters/tmdb_9_w200.{derived}.jpg 200w, /media/posters/tmdb_9_w300.{derived}.jpg 300w, '
+            f'/media/posters/tmdb_9_w500.{version}.jpg 500w" sizes="300px"',
+            html,
+        )
+        self.assertTrue(html.endswith(f'|/media/posters/tmdb_9_w500.{version}.jpg'))
+        self.assertNotIn('image.tmdb.org', html)
+
+    @patch('catalog.poster_cache.requests_get')
+    def test_cleanup_keeps_derived_sizes(self, mock_get):
+        mock_get.return_value = poster_response(jpeg_bytes())
+        download_tmdb_poster(self.movie, force=True)
+        for old_name in ('tmdb_9_w300_AbCdEf.jpg', 'tmdb_9_w300.jpg'):
+            (self.posters / old_name).write_bytes(b'old upload')
+            age(self.posters / old_name)
+
+        self.assertEqual(cleanup_orphaned_posters(), 2)
+        version = content_hash(jpeg_bytes())
+        derived = derived_version(jpeg_bytes())
+        self.assertEqual(
+            sorted(p.name for p in self.posters.iterdir()),
+            [f'tmdb_9_w200.{derived}.jpg', f'tmdb_9_w300.{derived}.jpg', f'tmdb_9_w500.{version}.jpg'],
+        )
+
+    @patch('catalog.poster_cache.requests_get')
+    def test_new_encode_settings_get_new_names(self, mock_get):
+        mock_get.return_value = poster_response(jpeg_bytes())
+        download_tmdb_poster(self.movie, force=True)
+        old_name = f'tmdb_9_w200.{derived_version(jpeg_bytes())}.jpg'
+        old_content = (self.posters / old_name).read_bytes()
+
+        with override_settings(POSTER_JPEG_QUALITY=40):
+            derive_poster_sizes(self.movie, 'w500')
+            new_name = f'tmdb_9_w200.{derived_version(jpeg_bytes())}.jpg'
+
+        self.assertNotEqual(new_name, old_name)
+        self.assertEqual((self.posters / old_name).read_bytes(), old_content)
+        self.assertTrue((self.posters / new_name).exists())
+        self.assertEqual(self.movie.poster_file.name, f'posters/tmdb_9_w500.{content_hash(jpeg_bytes())}.jpg')
+
+    @patch('catalog.poster_cache.requests_get')
+    def test_existing_hashed_files_are_not_rewritten(self, mock_get):
+        mock_get.return_value = poster_response(jpeg_bytes())
+        download_tmdb_poster(self.movie, force=True)
+        for poster in self.posters.iterdir():
+            age(poster)
+        mtimes = {poster.name: poster.stat().st_mtime for poster in self.posters.iterdir()}
+
+        mock_get.return_value = poster_response(jpeg_bytes())
+        self.assertTrue(download_tmdb_poster(self.movie, force=True))
+
+        self.assertEqual({poster.name: poster.stat().st_mtime for poster in self.posters.iterdir()}, mtimes)
+
+
+@override_settings(POSTER_CACHE_SIZE='w500', POSTER_SIZES=['w200'], POSTER_FORMATS=['webp'])
+class PosterFormatsTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media_root, MEDIA_URL='/media/')
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        self.movie = Movie.objects.create(tmdb_id=11, media_type='movie', title='Movie 11',
+                                          data={'poster_path': '/poster11.jpg'})
+        self.posters = Path(self.media_root) / 'posters'
+        patcher = patch('catalog.poster_cache.requests_get', return_value=poster_response(jpeg_bytes()))
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_every_size_is_transcoded(self):
+        download_tmdb_poster(self.movie, force=True)
+
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.poster_formats, ['webp'])
+        for size in ('w200', 'w500'):
+            with Image.open(self.posters / f'tmdb_11_{size}.{self.movie.poster_hash}-{poster_encoding()}.webp') as image:
+                self.assertEqual(image.format, 'WEBP')
+
+    @override_settings(POSTER_FORMATS=['jxl', 'webp'])
+    def test_unknown_formats_are_skipped(self):
+        download_tmdb_poster(self.movie, force=True)
+
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.poster_formats, ['webp'])
+
+    @skipUnless(features.check('avif'), 'Pillow built without AVIF')
+    @override_settings(POSTER_FORMATS=['avif', 'webp'])
+    def test_picture_sources_in_preference_order(self):
+        download_tmdb_poster(self.movie, force=True)
+
+        html = Template("{% load poster_tags %}{% movie_poster movie size='w200' %}").render(Context({'movie': self.movie}))
+
+        self.assertIn('<picture>', html)
+        self.assertLess(html.index('type="image/avif"'), html.index('type="image/webp"'))
+        derived = derived_version(jpeg_bytes())
+        self.assertIn(
+            f'srcset="/media/posters/tmdb_11_w200.{derived}.avif 200w, /media/posters/tmdb_11_w500.{derived}.avif 500w" '
+            'sizes="200px"', html)
+        self.assertIn(f'src="/media/posters/tmdb_11_w200.{derived}.jpg"', html)
+
+    def test_no_picture_without_formats(self):
+        with override_settings(POSTER_FORMATS=[]):
+            download_tmdb_poster(self.movie, force=True)
+
+        html = Template("{% load poster_tags %}{% movie_poster movie %}").render(Context({'movie': self.movie}))
+
+        self.assertNotIn('<picture>', html)
+
+    def test_transcode_existing_cache_and_report(self):
+        with override_settings(POSTER_FORMATS=[]):
+            download_tmdb_poster(self.movie, force=True)
+        out = StringIO()
+
+        call_command('cache_posters', '--transcode', stdout=out)
+        call_command('poster_savings', stdout=out)
+
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.poster_formats, ['webp'])
+        self.assertIn('Completed: 1 transcoded', out.getvalue())
+        self.assertIn('webp  w200       1 files', out.getvalue())
+        self.assertEqual(cleanup_orphaned_posters(), 0)
+
+    def test_transcode_rederives_sizes_of_old_encoding(self):
+        with override_settings(POSTER_FORMATS=[], POSTER_JPEG_QUALITY=40):
+            download_tmdb_poster(self.movie, force=True)
+            old_encoding = poster_encoding()
+
+        call_command('cache_posters', '--transcode', stdout=StringIO())
+
+        self.movie.refresh_from_db()
+        self.assertEqual(self.movie.poster_encoding, poster_encoding())
+        self.assertNotEqual(self.movie.poster_encoding, old_encoding)
+        derived = derived_version(jpeg_bytes())
+        for name in (f'tmdb_11_w200.{derived}.jpg', f'tmdb_11_w200.{derived}.webp', f'tmdb_11_w500.{derived}.webp'):
+            self.assertTrue((self.posters / name).exists(), name)
+
+
+class CachePostersBulkTest(TestCase):
+    def setUp(self):
+        self.media_root = tempfile.mkdtemp()
+        override = override_settings(MEDIA_ROOT=self.media_root)
+        override.enable()
+        self.addCleanup(override.disable)
+        self.addCleanup(shutil.rmtree, self.media_root, ignore_errors=True)
+        for tmdb_id in range(1, 6):
+            Movie.objects.create(tmdb_id=tmdb_id, media_type='movie', title=f'Movie {tmdb_id}',
+                                 data={'poster_path': f'/poster{tmdb_id}.jpg'})
+
+    @patch('catalog.poster_cache.requests_get')
+    def test_posters_saved_in_batches(self, mock_get):
+        mock_get.return_value = poster_response()
+
+        with self.assertNumQueries(3):
+            stats = cache_posters_bulk(list(Movie.objects.all()), workers=3, batch_size=2)
+
+        self.assertEqual((stats['cached'], stats['errors'], stats['bytes']), (5, 0, 5 * len(b'\xff\xd8poster')))
+        self.assertFalse(Movie.objects.filter(poster_cached_at__isnull=True).exists())
+        movie = Movie.objects.get(tmdb_id=3)
+        version = content_hash(b'\xff\xd8poster')
+        self.assertEqual(movie.poster_file.name, f'posters/tmdb_3_w500.{version}.jpg')
+        mock_get.assert_any_call('https://image.tmdb.org/t/p/w500/poster3.jpg', headers=ANY, timeout=10, stream=True)
+
+    @patch('catalog.poster_cache.requests_get')
+    def test_failures_are_reported_and_not_saved(self, mock_get):
+        def fetch(url, **kwargs):
+            if url.endswith('/poster2.jpg'):
+                raise requests.ConnectionError('reset')
+            return poster_response()
+        mock_get.side_effect = fetch
+        Movie.objects.filter(tmdb_id=4).update(data={})
+        results = []
+
+        stats = cache_posters_bulk(list(Movie.objects.all()), workers=2,
+                                   on_result=lambda movie, error: results.append((movie.tmdb_id, error is None)))
+
+        self.assertEqual((stats['cached'], stats['errors']), (3, 2))
+        self.assertEqual(sorted(results), [(1, True), (2, False), (3, True), (4, False), (5, True)])
+        self.assertEqual(
+            set(Movie.objects.filter(poster_cached_at__isnull=True).values_list('tmdb_id', flat=True)),
+            {2, 4},
+        )
+
+    @patch('catalog.poster_cache.requests_get')
+    def test_per_host_limit_caps_concurrency(self, mock_get):
+        active = 0
+        peak = 0
+        lock = threading.Lock()
+
+        def fetch(url, **kwargs):
+            nonlocal active, peak
+            with lock:
+                active += 1
+                peak = max(peak, active)
+            time.sleep(0.02)
+            with lock:
+                active -= 1
+            return poster_response()
+        mock_get.side_effect = fetch
+
+        cache_posters_bulk(list(Movie.objects.all()), workers=5, per_host=2)
+
+        self.assertEqual(peak, 2)
+
+    @patch('catalog.poster_cache.requests_get')
+    def test_command_workers_mode(self, mock_get):
+        mock_get.return_value = poster_response()
+        out = StringIO()
+
+        call_command('cache_posters', '--workers', '2', stdout=out)
+
+        self.assertIn('Completed: 5 cached, 0 errors, 0 skipped', out.getvalue())
+        self.assertIn('posters/s', out.getvalue())
+        self.assertEqual(Movie.objects.filter(poster_cached_at__isnull=False).count(), 5)
+
@@ -1,7 +1,12 @@
-from django.test import TestCase
+import threading
+import time
+import requests
+from datetime import datetime, timedelta, timezone as dt_timezone
+from django.test import TestCase, override_settings
+from django.utils import timezone
 from django.contrib.auth.models import User
 from unittest.mock import patch, Mock
-from ..models import Movie, UserRating, UserSettings, ImportTask
+from ..models import Movie, UserRating, UserSettings, ImportTask, EpisodeWatch, ShowProgress, WatchEvent
 
 class TasksTest(TestCase):
     def setUp(self):
@@ -428,4 +433,416 @@ class TasksTest(TestCase):
         # Проверяем, что задача завершилась с ошибкой
         task.refresh_from_db()
         self.assertEqual(task.status, 'failed')
-        self.assertIn('Test error during processing', task.error_message)
\ No newline at end of file
+        self.assertIn('Test error during processing', task.error_message)
+
+class ImportTraktTaskTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='importer', password='password')
+        self.task = ImportTask.objects.create(user=self.user, task_id='bulk-task', status='pending')
+
+    def _run_import(self, watched_movies=(), watched_shows=(), rated_movies=(), rated_shows=(), details=None):
+        details = details or (lambda media_type, tmdb_id, *args: {'title': f'TMDB {tmdb_id}', 'name': f'TMDB {tmdb_id}'})
+        with patch('catalog.tasks.iter_watched_movies', return_value=list(watched_movies)), \
+                patch('catalog.tasks.iter_watched_shows', return_value=list(watched_shows)), \
+                patch('catalog.tasks.iter_rated_movies', return_value=list(rated_movies)), \
+                patch('catalog.tasks.iter_rated_shows', return_value=list(rated_shows)), \
+                patch('catalog.tasks.get_movie_details', side_effect=details):
+            from ..tasks import import_trakt_data_task
+            import_trakt_data_task.now('bulk-task', self.user.id, 'trakt_user', 'client', 'tmdb_key')
+        self.task.refresh_from_db()
+
+    @override_settings(IMPORT_BATCH_SIZE=2)
+    def test_import_writes_movies_and_ratings_in_batches(self):
+        watched = [
+            {'tmdb_id': i, 'media_type': 'movie', 'title': f'Movie {i}', 'last_watched_at': '2023-01-01T12:00:00Z'}
+            for i in range(1, 6)
+        ]
+        rated = [{'tmdb_id': 1, 'media_type': 'movie', 'title': 'Movie 1', 'rating': 9}]
+
+        self._run_import(watched_movies=watched, rated_movies=rated)
+
+        self.assertEqual(self.task.status, 'completed')
+        self.assertEqual(self.task.progress, 100)
+        self.assertEqual(self.task.imported_count, 5)
+        self.assertEqual(self.task.total_items, 6)
+        self.assertEqual(Movie.objects.count(), 5)
+        self.assertEqual(Movie.objects.get(tmdb_id=3).title, 'TMDB 3')
+        self.assertEqual(UserRating.objects.filter(user=self.user).count(), 5)
+        self.assertEqual(UserRating.objects.get(user=self.user, movie_id=1).rating, 9)
+
+    def test_import_records_episode_watches(self):
+        watched_shows = [{
+            'tmdb_id': 70, 'media_type': 'tv', 'title': 'Show', 'last_watched_at': '2023-02-01T12:00:00Z',
+            'episodes': [(1, 1, '2023-01-01T12:00:00Z'), (1, 2, '2023-02-01T12:00:00Z')],
+        }]
+
+        self._run_import(watched_shows=watched_shows)
+
+        self.assertEqual(EpisodeWatch.objects.filter(user=self.user, show_id=70).count(), 2)
+        progress = ShowProgress.objects.get(user=self.user, show_id=70)
+        self.assertEqual((progress.episodes_watched, progress.last_season, progress.last_episode), (2, 1, 2))
+
+    def test_import_updates_existing_rows_without_overwriting(self):
+        Movie.objects.create(tmdb_id=10, media_type='movie', title='Old Title', data={'old': 'data'})
+        existing = UserRating.objects.create(user=self.user, movie_id=10, rating=7)
+        rated = [{'tmdb_id': 10, 'media_type': 'movie', 'title': 'Old Title', 'rating': 3}]
+        watched = [{'tmdb_id': 10, 'media_type': 'movie', 'title': 'Old Title', 'last_watched_at': '2023-05-01T10:00:00Z'}]
+
+        self._run_import(watched_movies=watched, rated_movies=rated)
+
+        movie = Movie.objects.get(tmdb_id=10)
+        self.assertEqual(movie.title, 'TMDB 10')
+        self.assertEqual(movie.data['title'], 'TMDB 10')
+        existing.refresh_from_db()
+        self.assertEqual(existing.rating, 7)
+        self.assertIsNotNone(existing.watched_at)
+
+    def test_import_keeps_trakt_play_counts(self):
+        watched = [{'tmdb_id': 10, 'media_type': 'movie', 'title': 'Rewatched', 'plays': 5,
+                    'last_watched_at': '2023-05-01T10:00:00Z'}]
+
+        self._run_import(watched_movies=watched)
+        self._run_import(watched_movies=watched)
+
+        rating = UserRating.objects.get(user=self.user, movie_id=10)
+        self.assertEqual(rating.play_count, 5)
+        self.assertEqual(WatchEvent.objects.filter(user=self.user, movie_id=10).count(), 1)
+
+    def test_import_skips_items_without_tmdb_data(self):
+        watched = [
+            {'tmdb_id': 1, 'media_type': 'movie', 'title': 'Found', 'last_watched_at': None},
+            {'tmdb_id': 2, 'media_type': 'movie', 'title': 'Missing', 'last_watched_at': None},
+            {'tmdb_id': None, 'media_type': 'movie', 'title': 'No TMDB ID', 'last_watched_at': None},
+        ]
+
+        def details(media_type, tmdb_id, *args):
+            if tmdb_id == 2:
+                raise Exception('TMDB error')
+            return {'title': 'Found'}
+
+        self._run_import(watched_movies=watched, details=details)
+
+        self.assertEqual(self.task.status, 'completed')
+        self.assertEqual(self.task.imported_count, 1)
+        self.assertEqual(list(Movie.objects.values_list('tmdb_id', flat=True)), [1])
+
+    def test_write_import_batch_skips_media_type_conflicts(self):
+        Movie.objects.create(tmdb_id=20, media_type='movie', title='A Movie')
+        batch = [
+            ({'tmdb_id': 20, 'media_type': 'tv', 'title': 'A Show', 'watched_at': None, 'rating': None}, {'name': 'A Show'}),
+            ({'tmdb_id': 21, 'media_type': 'tv', 'title': 'Other Show', 'watched_at': None, 'rating': 5}, {'name': 'Other Show'}),
+        ]
+
+        from ..tasks import write_import_batch
+        written = write_import_batch(self.user.id, batch)
+
+        self.assertEqual(written, 1)
+        self.assertEqual(Movie.objects.get(tmdb_id=20).title, 'A Movie')
+        self.assertEqual(UserRating.objects.get(user=self.user, movie_id=21).rating, 5)
+
+    def test_import_progress_is_throttled(self):
+        from ..tasks import ImportProgress
+        progress = ImportProgress(self.task, interval=60)
+
+        with self.assertNumQueries(1):
+            progress.update(10)
+            progress.update(20)
+            progress.update(30)
+        self.task.refresh_from_db()
+        self.assertEqual(self.task.progress, 10)
+
+        with self.assertNumQueries(1):
+            progress.update(40, force=True)
+
+    def test_enrichment_runs_with_bounded_concurrency(self):
+        import threading
+        import time
+        from ..tasks import enrich_import_items
+
+        lock = threading.Lock()
+        state = {'active': 0, 'peak': 0}
+
+        def details(media_type, tmdb_id, *args):
+            with lock:
+                state['active'] += 1
+                state['peak'] = max(state['peak'], state['active'])
+            time.sleep(0.02)
+            with lock:
+                state['active'] -= 1
+            if tmdb_id == 5:
+                raise Exception('TMDB error')
+            return {'title': f'TMDB {tmdb_id}'}
+
+        items = [{'tmdb_id': i, 'media_type': 'movie', 'title': f'Movie {i}'} for i in range(1, 21)]
+        with patch('catalog.tasks.get_movie_details', side_effect=details):
+            results = list(enrich_import_items(items, 'tmdb_key', 'en-US', workers=4))
+
+        self.assertEqual(sorted(item['tmdb_id'] for item, _ in results), list(range(1, 21)))
+        self.assertEqual([item['tmdb_id'] for item, data in results if not data], [5])
+        self.assertGreater(state['peak'], 1)
+        self.assertLessEqual(state['peak'], 4)
+
+    def test_import_skips_tmdb_for_fresh_movies(self):
+        fresh = Movie(tmdb_id=30, media_type='movie', title='Fresh Movie')
+        fresh.set_data({'title': 'Fresh Movie'}, 'en-US')
+        fresh.save()
+        watched = [
+            {'tmdb_id': 30, 'media_type': 'movie', 'title': 'Fresh Movie', 'last_watched_at': None},
+            {'tmdb_id': 31, 'media_type': 'movie', 'title': 'New Movie', 'last_watched_at': None},
+        ]
+        fetched = []
+
+        def details(media_type, tmdb_id, *args):
+            fetched.append(tmdb_id)
+            return {'title': f'TMDB {tmdb_id}'}
+
+        self._run_import(watched_movies=watched, details=details)
+
+        self.assertEqual(fetched, [31])
+        self.assertEqual(self.task.imported_count, 2)
+        self.assertEqual(UserRating.objects.filter(user=self.user).count(), 2)
+        new_movie = Movie.objects.get(tmdb_id=31)
+        self.assertEqual(new_movie.data_language, 'en-US')
+        self.assertEqual(new_movie.data_hash, Movie.hash_data({'title': 'TMDB 31'}))
+
+    def test_write_import_batch_skips_unchanged_payload(self):
+        from ..tasks import write_import_batch
+        movie = Movie(tmdb_id=40, media_type='movie', title='Same')
+        movie.set_data({'title': 'Same'}, 'en-US')
+        movie.save()
+        item = {'tmdb_id': 40, 'media_type': 'movie', 'title': 'Same', 'watched_at': None, 'rating': None}
+
+        with patch('catalog.tasks.Movie.objects.bulk_create') as mock_bulk_create:
+            write_import_batch(self.user.id, [(item, {'title': 'Same'})], 'en-US')
+
+        self.assertEqual(mock_bulk_create.call_args.args[0], [])
+
+    def test_write_import_batch_keeps_fetch_time_of_cached_details(self):
+        from ..tasks import write_import_batch
+        from ..tmdb_client import MovieDetails
+        movie = Movie(tmdb_id=40, media_type='movie', title='Same')
+        movie.set_data({'title': 'Same'}, 'en-US')
+        movie.save()
+        fetched_at = timezone.now() - timedelta(days=10)
+        batch = [
+            ({'tmdb_id': tmdb_id, 'media_type': 'movie', 'title': title, 'watched_at': None, 'rating': None},
+             MovieDetails({'title': title}, fetched_at.timestamp()))
+            for tmdb_id, title in ((40, 'Same'), (41, 'New'))
+        ]
+
+        write_import_batch(self.user.id, batch, 'en-US')
+
+        self.assertEqual(
+            dict(Movie.objects.filter(tmdb_id__in=[40, 41]).values_list('tmdb_id', 'data_fetched_at')),
+            {40: fetched_at, 41: fetched_at},
+        )
+
+
+class IncrementalTraktImportTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='incremental', password='password')
+        self.settings = UserSettings.objects.create(user=self.user, trakt_username='trakt_user')
+        self.task = ImportTask.objects.create(user=self.user, task_id='inc-task', status='pending', mode='incremental')
+
+    def _run_import(self, history_movies=(), rated_movies=(), watched_movies=(), history_error=None, details=None):
+        history = Mock(return_value=list(history_movies), side_effect=history_error)
+        watched = Mock(return_value=list(watched_movies))
+        details = details or (lambda media_type, tmdb_id, *args: {'title': f'TMDB {tmdb_id}'})
+        with patch('catalog.tasks.iter_history_movies', history), \
+                patch('catalog.tasks.iter_history_shows', return_value=[]), \
+                patch('catalog.tasks.iter_watched_movies', watched), \
+                patch('catalog.tasks.iter_watched_shows', return_value=[]), \
+                patch('catalog.tasks.iter_rated_movies', return_value=list(rated_movies)), \
+                patch('catalog.tasks.iter_rated_shows', return_value=[]), \
+                patch('catalog.tasks.get_movie_details', side_effect=details):
+            from ..tasks import import_trakt_data_task
+            import_trakt_data_task.now('inc-task', self.user.id, 'trakt_user', 'client', 'tmdb_key', incremental=True)
+        self.task.refresh_from_db()
+        self.settings.refresh_from_db()
+        return history, watched
+
+    def test_incremental_import_uses_history_since_watermark(self):
+        watermark = timezone.now() - timedelta(days=1)
+        UserSettings.objects.filter(pk=self.settings.pk).update(trakt_last_synced_at=watermark)
+        Movie.objects.create(tmdb_id=1, media_type='movie', title='Movie 1', data={'title': 'Movie 1'})
+        UserRating.objects.create(user=self.user, movie_id=1, rating=5,
+                                  watched_at=datetime(2020, 1, 1, tzinfo=dt_timezone.utc))
+        history_movies = [
+            {'tmdb_id': 1, 'media_type': 'movie', 'title': 'Movie 1', 'last_watched_at': '2030-01-02T00:00:00Z'},
+            {'tmdb_id': 1, 'media_type': 'movie', 'title': 'Movie 1', 'last_watched_at': '2030-01-01T00:00:00Z'},
+        ]
+        rated_movies = [
+            {'tmdb_id': 1, 'media_type': 'movie', 'title': 'Movie 1', 'rating': 9,
+             'rated_at': '2030-01-02T00:00:00Z'},
+            {'tmdb_id': 2, 'media_type': 'movie', 'title': 'Movie 2', 'rating': 4,
+             'rated_at': '2000-01-01T00:00:00Z'},
+        ]
+
+        history, watched = self._run_import(history_movies, rated_movies)
+
+        self.assertEqual(history.call_args.args[2], watermark)
+        watched.assert_not_called()
+        self.assertEqual(self.task.status, 'completed')
+        self.assertFalse(Movie.objects.filter(tmdb_id=2).exists())
+        rating = UserRating.objects.get(user=self.user, movie_id=1)
+        self.assertEqual(rating.rating, 9)
+        self.assertEqual(rating.watched_at, datetime(2030, 1, 2, tzinfo=dt_timezone.utc))
+        self.assertEqual(rating.play_count, 2)
+        self.assertEqual(WatchEvent.objects.filter(user=self.user, movie_id=1, source='trakt').count(), 2)
+        self.assertGreater(self.settings.trakt_last_synced_at, watermark)
+
+    def test_watermark_kept_when_trakt_request_fails(self):
+        watermark = timezone.now() - timedelta(days=1)
+        UserSettings.objects.filter(pk=self.settings.pk).update(trakt_last_synced_at=watermark)
+
+        self._run_import(history_error=requests.RequestException('Trakt down'))
+
+        self.assertEqual(self.task.status, 'completed')
+        self.assertIn('incomplete', self.task.error_message)
+        self.assertEqual(self.settings.trakt_last_synced_at, watermark)
+
+    def test_watermark_kept_when_titles_fail(self):
+        watermark = timezone.now() - timedelta(days=1)
+        UserSettings.objects.filter(pk=self.settings.pk).update(trakt_last_synced_at=watermark)
+        history_movies = [
+            {'tmdb_id': tmdb_id, 'media_type': 'movie', 'title': f'Movie {tmdb_id}',
+             'last_watched_at': '2030-01-01T00:00:00Z'}
+            for tmdb_id in (1, 2)
+        ]
+        details = lambda media_type, tmdb_id, *args: {} if tmdb_id == 2 else {'title': f'TMDB {tmdb_id}'}
+
+        self._run_import(history_movies, details=details)
+
+        self.assertEqual(self.task.status, 'completed')
+        self.assertEqual(self.task.imported_count, 1)
+        self.assertIn('1 titles could not be imported (Movie 2)', self.task.error_message)
+        self.assertEqual(self.settings.trakt_last_synced_at, watermark)
+
+    def test_watermark_kept_when_titles_cannot_be_written(self):
+        watermark = timezone.now() - timedelta(days=1)
+        UserSettings.objects.filter(pk=self.settings.pk).update(trakt_last_synced_at=watermark)
+        history_movies = [{'tmdb_id': 1, 'media_type': 'movie', 'title': 'Movie 1',
+                           'last_watched_at': '2030-01-01T00:00:00Z'}]
+
+        with patch('catalog.tasks.write_import_batch', side_effect=ValueError('bad row')):
+            self._run_import(history_movies)
+
+        self.assertEqual(self.task.imported_count, 0)
+        self.assertIn('(Movie 1)', self.task.error_message)
+        self.assertEqual(self.settings.trakt_last_synced_at, watermark)
+
+    def test_incremental_without_watermark_runs_full_import(self):
+        watched_movies = [{'tmdb_id': 3, 'media_type': 'movie', 'title': 'Movie 3', 'last_watched_at': None}]
+
+        history, watched = self._run_import(watched_movies=watched_movies)
+
+        history.assert_not_called()
+        watched.assert_called_once()
+        self.assertTrue(Movie.objects.filter(tmdb_id=3).exists())
+        self.assertIsNotNone(self.settings.trakt_last_synced_at)
+
+
+class TraktFetchTest(TestCase):
+    def _watched(self, media_type, tmdb_id):
+        return {'tmdb_id': tmdb_id, 'media_type': media_type, 'title': f'{media_type} {tmdb_id}',
+                'last_watched_at': '2024-01-01T00:00:00Z'}
+
+    def test_lists_are_fetched_concurrently(self):
+        from ..tasks import TraktFetch
+        barrier = threading.Barrier(4, timeout=5)
+
+        def stream(*items):
+            def iterate(*args, **kwargs):
+                barrier.wait()
+                yield from items
+            return iterate
+
+        rated = {'tmdb_id': 1, 'media_type': 'movie', 'title': 'movie 1', 'rating': 8, 'rated_at': None}
+        with patch('catalog.tasks.iter_watched_movies', stream(self._watched('movie', 1))), \
+                patch('catalog.tasks.iter_watched_shows', stream(self._watched('tv', 2))), \
+                patch('catalog.tasks.iter_rated_movies', stream(rated)), \
+                patch('catalog.tasks.iter_rated_shows', stream()):
+            fetch = TraktFetch('trakt_user', 'client', deadline=5)
+            items = fetch.fetch()
+
+        self.assertTrue(fetch.complete)
+        self.assertEqual(fetch.entries, 3)
+        self.assertEqual(list(items), ['movie_1', 'tv_2'])
+        self.assertEqual(items['movie_1']['rating'], 8)
+
+    def test_history_episodes_are_merged_per_show(self):
+        from ..tasks import TraktFetch
+        history = [
+            {'tmdb_id': 2, 'media_type': 'tv', 'title': 'Show', 'last_watched_at': '2024-01-02T00:00:00Z',
+             'episodes': [(1, 2, '2024-01-02T00:00:00Z')]},
+            {'tmdb_id': 2, 'media_type': 'tv', 'title': 'Show', 'last_watched_at': '2024-01-01T00:00:00Z',
+             'episodes': [(1, 1, '2024-01-01T00:00:00Z')]},
+        ]
+        with patch('catalog.tasks.iter_history_movies', return_value=[]), \
+                patch('catalog.tasks.iter_history_shows', return_value=history), \
+                patch('catalog.tasks.iter_rated_movies', return_value=[]), \
+                patch('catalog.tasks.iter_rated_shows', return_value=[]):
+            items = TraktFetch('trakt_user', 'client', since=timezone.now(), deadline=5).fetch()
+
+        self.assertEqual(items['tv_2']['watched_at'], '2024-01-02T00:00:00Z')
+        self.assertEqual(sorted(items['tv_2']['episodes']), [(1, 1, '2024-01-01T00:00:00Z'), (1, 2, '2024-01-02T00:00:00Z')])
+
+    def test_deadline_marks_fetch_incomplete(self):
+        from ..tasks import TraktFetch
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def slow(*args, **kwargs):
+            yield self._watched('tv', 2)
+            release.wait(5)
+            yield self._watched('tv', 3)
+
+        with patch('catalog.tasks.iter_watched_movies', return_value=[self._watched('movie', 1)]), \
+                patch('catalog.tasks.iter_watched_shows', slow), \
+                patch('catalog.tasks.iter_rated_movies', return_value=[]), \
+                patch('catalog.tasks.iter_rated_shows', return_value=[]):
+            fetch = TraktFetch('trakt_user', 'client', deadline=0.2)
+            started = time.monotonic()
+            items = fetch.fetch()
+
+        self.assertLess(time.monotonic() - started, 2)
+        self.assertFalse(fetch.complete)
+        # The first page of the late list is kept
+        self.assertEqual(list(items), ['movie_1', 'tv_2'])
+        self.assertEqual(fetch.entries, 2)
+
+    def test_malformed_entry_marks_fetch_incomplete(self):
+        from ..tasks import TraktFetch
+
+        def malformed(*args, **kwargs):
+            yield self._watched('movie', 1)
+            yield {'title': 'no ids'}
+
+        with patch('catalog.tasks.iter_watched_movies', malformed), \
+                patch('catalog.tasks.iter_watched_shows', return_value=[]), \
+                patch('catalog.tasks.iter_rated_movies', return_value=[]), \
+                patch('catalog.tasks.iter_rated_shows', return_value=[]):
+            fetch = TraktFetch('trakt_user', 'client', deadline=5)
+            items = fetch.fetch()
+
+        self.assertFalse(fetch.complete)
+        self.assertEqual(list(items), ['movie_1'])
+
+    def test_import_records_fetching_phase(self):
+        user = User.objects.create_user(username='phased', password='password')
+        task = ImportTask.objects.create(user=user, task_id='phase-task', status='pending')
+        phases = []
+
+        def fetch(fetcher):
+            phases.append(ImportTask.objects.get(pk=task.pk).phase)
+            return {}
+
+        with patch('catalog.tasks.TraktFetch.fetch', autospec=True, side_effect=fetch):
+            from ..tasks import import_trakt_data_task
+            import_trakt_data_task.now('phase-task', user.id, 'trakt_user', 'client', 'tmdb_key')
+
+        task.refresh_from_db()
+        self.assertEqual(phases, ['fetching'])
+        self.assertEqual(task.phase, '')
+        self.assertEqual(task.status, 'completed')
+        self.assertEqual(task.error_message, '')
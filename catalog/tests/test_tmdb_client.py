@@ -1,10 +1,29 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
 from unittest.mock import patch, Mock
+import threading
+import time
+from datetime import timedelta
+from django.utils import timezone
 import requests
-from ..tmdb_client import search_movies, get_movie_details
+from .. import tmdb_client
+from ..tmdb_client import (
+    search_movies, get_movie_details, get_details_cache_stats, clear_details_cache, clear_search_cache,
+    find_show_by_episode,
+)
 
+TEST_CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'tmdb': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tmdb-tests'},
+}
+
+
+@override_settings(CACHES=TEST_CACHES)
 class TMDBClientTest(TestCase):
-    @patch('catalog.tmdb_client.requests.get')
+    def setUp(self):
+        clear_details_cache()
+        clear_search_cache()
+
+    @patch('catalog.tmdb_client.requests_get')
     def test_search_movies_success(self, mock_get):
         mock_response_movie = Mock()
         mock_response_movie.json.return_value = {
@@ -25,7 +44,7 @@ class TMDBClientTest(TestCase):
         mock_response_tv.json.return_value = {'results': []}
         mock_response_tv.raise_for_status.return_value = None
         
-        mock_get.side_effect = [mock_response_movie, mock_response_tv]
+        mock_get.side_effect = lambda url, **kwargs: mock_response_movie if url.endswith('/search/movie') else mock_response_tv
 
         results = search_movies('test', 'fake_api_key')
 
@@ -34,7 +53,50 @@ class TMDBClientTest(TestCase):
         self.assertEqual(results[0]['title'], 'Test Movie')
         self.assertEqual(results[0]['media_type'], 'movie')
 
-    @patch('catalog.tmdb_client.requests.get')
+    @patch('catalog.tmdb_client.requests_get')
+    def test_search_movies_modes_return_same_order(self, mock_get):
+        responses = {
+            '/search/movie': [{'id': 1, 'title': 'Movie One'}, {'id': 2, 'title': 'Movie Two'}],
+            '/search/tv': [{'id': 3, 'name': 'Show Three'}],
+            '/search/multi': [
+                {'id': 3, 'name': 'Show Three', 'media_type': 'tv'},
+                {'id': 1, 'title': 'Movie One', 'media_type': 'movie'},
+                {'id': 9, 'name': 'Some Actor', 'media_type': 'person'},
+                {'id': 2, 'title': 'Movie Two', 'media_type': 'movie'},
+            ],
+        }
+
+        def fake_get(url, **kwargs):
+            response = Mock()
+            response.raise_for_status.return_value = None
+            response.json.return_value = {'results': responses[url[url.index('/search/'):]]}
+            return response
+
+        mock_get.side_effect = fake_get
+
+        expected = [('movie', 1), ('movie', 2), ('tv', 3)]
+        for mode in ('concurrent', 'sequential', 'multi'):
+            results = search_movies('test', 'fake_api_key', mode=mode)
+            self.assertEqual([(r['media_type'], r['id']) for r in results], expected, mode)
+        self.assertEqual(mock_get.call_count, 5)
+
+    @patch('catalog.tmdb_client.requests_get')
+    def test_search_movies_keeps_results_when_one_endpoint_fails(self, mock_get):
+        def fake_get(url, **kwargs):
+            if url.endswith('/search/tv'):
+                raise requests.RequestException('Network error')
+            response = Mock()
+            response.raise_for_status.return_value = None
+            response.json.return_value = {'results': [{'id': 1, 'title': 'Movie One'}]}
+            return response
+
+        mock_get.side_effect = fake_get
+
+        results = search_movies('test', 'fake_api_key')
+
+        self.assertEqual([r['id'] for r in results], [1])
+
+    @patch('catalog.tmdb_client.requests_get')
     def test_search_movies_request_exception(self, mock_get):
         mock_get.side_effect = requests.RequestException('Network error')
 
@@ -42,7 +104,7 @@ class TMDBClientTest(TestCase):
 
         self.assertEqual(results, [])
 
-    @patch('catalog.tmdb_client.requests.get')
+    @patch('catalog.tmdb_client.requests_get')
     def test_search_movies_empty_results(self, mock_get):
         mock_response = Mock()
         mock_response.json.return_value = {'results': []}
@@ -53,7 +115,7 @@ class TMDBClientTest(TestCase):
 
         self.assertEqual(results, [])
 
-    @patch('catalog.tmdb_client.requests.get')
+    @patch('catalog.tmdb_client.requests_get')
     def test_get_movie_details_movie_success(self, mock_get):
         mock_response = Mock()
         mock_response.json.return_value = {
@@ -70,7 +132,7 @@ class TMDBClientTest(TestCase):
         self.assertEqual(result['title'], 'Test Movie RU')
         self.assertEqual(result['media_type'], 'movie')
 
-    @patch('catalog.tmdb_client.requests.get')
+    @patch('catalog.tmdb_client.requests_get')
     def test_get_movie_details_tv_success(self, mock_get):
         mock_response = Mock()
         mock_response.json.return_value = {
@@ -87,7 +149,7 @@ class TMDBClientTest(TestCase):
         self.assertEqual(result['name'], 'Test Show RU')
         self.assertEqual(result['media_type'], 'tv')
 
-    @patch('catalog.tmdb_client.requests.get')
+    @patch('catalog.tmdb_client.requests_get')
     def test_get_movie_details_request_exception(self, mock_get):
         mock_get.side_effect = requests.RequestException('Network error')
 
@@ -95,7 +157,7 @@ class TMDBClientTest(TestCase):
 
         self.assertEqual(result, {})
 
-    @patch('catalog.tmdb_client.requests.get')
+    @patch('catalog.tmdb_client.requests_get')
     def test_get_movie_details_missing_title_fallback(self, mock_get):
         mock_response = Mock()
         mock_response.json.return_value = {
@@ -109,7 +171,7 @@ class TMDBClientTest(TestCase):
 
         self.assertEqual(result['title'], 'Test Movie Original')
 
-    @patch('catalog.tmdb_client.requests.get')
+    @patch('catalog.tmdb_client.requests_get')
     def test_get_movie_details_missing_name_fallback(self, mock_get):
         mock_response = Mock()
         mock_response.json.return_value = {
@@ -121,4 +183,195 @@ class TMDBClientTest(TestCase):
 
         result = get_movie_details('tv', 456, 'fake_api_key')
 
-        self.assertEqual(result['name'], 'Test Show Original')
\ No newline at end of file
+        self.assertEqual(result['name'], 'Test Show Original')
+
+    @patch('catalog.tmdb_client.requests_get')
+    def test_find_show_by_episode(self, mock_get):
+        mock_get.return_value.json.return_value = {'tv_episode_results': [{'id': 62085, 'show_id': 1396}]}
+
+        self.assertEqual(find_show_by_episode('349232', 'tvdb_id', 'fake_api_key'), 1396)
+        self.assertTrue(mock_get.call_args.args[0].endswith('/find/349232'))
+        self.assertEqual(mock_get.call_args.kwargs['params']['external_source'], 'tvdb_id')
+
+        mock_get.return_value.json.return_value = {'tv_episode_results': []}
+        self.assertIsNone(find_show_by_episode('0', 'tvdb_id', 'fake_api_key'))
+        mock_get.side_effect = requests.RequestException('down')
+        self.assertIsNone(find_show_by_episode('349232', 'tvdb_id', 'fake_api_key'))
+
+
+def _details_response(title):
+    response = Mock()
+    response.json.return_value = {'title': title, 'original_title': title}
+    response.raise_for_status.return_value = None
+    return response
+
+
+@override_settings(CACHES=TEST_CACHES, TMDB_CACHE_TTL=60, TMDB_CACHE_STALE_TTL=600)
+class TMDBDetailsCacheTest(TestCase):
+    def setUp(self):
+        clear_details_cache()
+
+    @patch('catalog.tmdb_client.requests_get')
+    def test_repeated_details_served_from_memory(self, mock_get):
+        mock_get.return_value = _details_response('Cached Movie')
+
+        first = get_movie_details('movie', 123, 'fake_api_key')
+        second = get_movie_details('movie', 123, 'fake_api_key')
+
+        self.assertEqual(first, second)
+        self.assertEqual(mock_get.call_count, 1)
+        stats = get_details_cache_stats()
+        self.assertEqual(stats['misses'], 1)
+        self.assertEqual(stats['memory_hits'], 1)
+
+    @patch('catalog.tmdb_client.requests_get')
+    def test_cache_key_includes_language_and_media_type(self, mock_get):
+        mock_get.return_value = _details_response('Any')
+
+        get_movie_details('movie', 123, 'fake_api_key', 'en-US')
+        get_movie_details('movie', 123, 'fake_api_key', 'ru-RU')
+        get_movie_details('tv', 123, 'fake_api_key', 'en-US')
+
+        self.assertEqual(mock_get.call_count, 3)
+
+    @patch('catalog.tmdb_client.requests_get')
+    def test_persistent_tier_survives_memory_eviction(self, mock_get):
+        mock_get.return_value = _details_response('Stored Movie')
+
+        get_movie_details('movie', 123, 'fake_api_key')
+        tmdb_client._details_cache.clear()
+        result = get_movie_details('movie', 123, 'fake_api_key')
+
+        self.assertEqual(result['title'], 'Stored Movie')
+        self.assertEqual(mock_get.call_count, 1)
+        self.assertEqual(get_details_cache_stats()['store_hits'], 1)
+
+    @patch('catalog.tmdb_client.requests_get')
+    def test_failed_fetch_not_cached(self, mock_get):
+        mock_get.side_effect = [requests.RequestException('Network error'), _details_response('Recovered')]
+
+        self.assertEqual(get_movie_details('movie', 123, 'fake_api_key'), {})
+        result = get_movie_details('movie', 123, 'fake_api_key')
+
+        self.assertEqual(result['title'], 'Recovered')
+
+    @patch('catalog.tmdb_client._schedule_refresh')
+    @patch('catalog.tmdb_client.requests_get')
+    def test_stale_entry_served_while_revalidating(self, mock_get, mock_refresh):
+        mock_get.return_value = _details_response('Old Title')
+        get_movie_details('movie', 123, 'fake_api_key')
+
+        with patch('catalog.tmdb_client.time.time', return_value=time.time() + 120):
+            result = get_movie_details('movie', 123, 'fake_api_key')
+
+        self.assertEqual(result['title'], 'Old Title')
+        self.assertEqual(mock_get.call_count, 1)
+        mock_refresh.assert_called_once()
+        self.assertEqual(get_details_cache_stats()['stale_hits'], 1)
+
+    @patch('catalog.tmdb_client._schedule_refresh')
+    @patch('catalog.tmdb_client.requests_get')
+    def test_cached_details_keep_their_fetch_time(self, mock_get, mock_refresh):
+        mock_get.return_value = _details_response('Old Title')
+        first = get_movie_details('movie', 123, 'fake_api_key')
+
+        with patch('catalog.tmdb_client.time.time', return_value=time.time() + 120):
+            stale = get_movie_details('movie', 123, 'fake_api_key')
+
+        self.assertEqual(stale.fetched_at, first.fetched_at)
+        self.assertLess(abs(first.fetched_at - timezone.now()), timedelta(seconds=5))
+
+    @patch('catalog.tmdb_client.requests_get')
+    def test_expired_entry_refetched(self, mock_get):
+        mock_get.side_effect = [_details_response('Old Title'), _details_response('New Title')]
+        get_movie_details('movie', 123, 'fake_api_key')
+
+        with patch('catalog.tmdb_client.time.time', return_value=time.time() + 1000):
+            result = get_movie_details('movie', 123, 'fake_api_key')
+
+        self.assertEqual(result['title'], 'New Title')
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('catalog.tmdb_client.requests_get')
+    def test_use_cache_false_bypasses_cache(self, mock_get):
+        mock_get.return_value = _details_response('Fresh')
+
+        get_movie_details('movie', 123, 'fake_api_key', use_cache=False)
+        get_movie_details('movie', 123, 'fake_api_key', use_cache=False)
+
+        self.assertEqual(mock_get.call_count, 2)
+
+
+
+def _search_response(results):
+    response = Mock()
+    response.json.return_value = {'results': results}
+    response.raise_for_status.return_value = None
+    return response
+
+
+class TMDBSearchCacheTest(TestCase):
+    def setUp(self):
+        clear_search_cache()
+
+    @patch('catalog.tmdb_client.requests_get')
+    def test_normalized_query_served_from_cache(self, mock_get):
+        mock_get.return_value = _search_response([{'id': 1, 'title': 'Interstellar'}])
+
+        first = search_movies('Interstellar', 'key_one', mode='multi')
+        second = search_movies('  interstellar ', 'key_two', mode='multi')
+
+        self.assertEqual(first, second)
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('catalog.tmdb_client.requests_get')
+    def test_cache_key_includes_language(self, mock_get):
+        mock_get.return_value = _search_response([])
+
+        search_movies('test', 'fake_api_key', 'en-US', mode='multi')
+        search_movies('test', 'fake_api_key', 'ru-RU', mode='multi')
+
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('catalog.tmdb_client.requests_get')
+    def test_cached_results_are_copies(self, mock_get):
+        mock_get.return_value = _search_response([{'id': 1, 'title': 'Movie', 'media_type': 'movie'}])
+
+        results = search_movies('test', 'fake_api_key', mode='multi')
+        results[0]['is_in_collection'] = True
+
+        self.assertNotIn('is_in_collection', search_movies('test', 'fake_api_key', mode='multi')[0])
+
+    @patch('catalog.tmdb_client.requests_get')
+    def test_failed_search_not_cached(self, mock_get):
+        mock_get.side_effect = [requests.RequestException('Network error'), _search_response([])]
+
+        search_movies('test', 'fake_api_key', mode='multi')
+        search_movies('test', 'fake_api_key', mode='multi')
+
+        self.assertEqual(mock_get.call_count, 2)
+
+    @patch('catalog.tmdb_client._search_tmdb')
+    def test_identical_inflight_searches_are_joined(self, mock_search):
+        started = threading.Event()
+        release = threading.Event()
+
+        def slow_search(*args):
+            started.set()
+            release.wait(5)
+            return [{'id': 1}], True
+
+        mock_search.side_effect = slow_search
+        results = []
+        owner = threading.Thread(target=lambda: results.append(search_movies('test', 'fake_api_key')))
+        owner.start()
+        started.wait(5)
+        follower = threading.Thread(target=lambda: results.append(search_movies('TEST', 'fake_api_key')))
+        follower.start()
+        time.sleep(0.05)
+        release.set()
+        owner.join(5)
+        follower.join(5)
+
+        self.assertEqual(results, [[{'id': 1}], [{'id': 1}]])
+        self.assertEqual(mock_search.call_count, 1)
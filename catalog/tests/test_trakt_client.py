@@ -1,10 +1,15 @@
 from django.test import TestCase
 from unittest.mock import patch, Mock
 import requests
-from ..trakt_client import get_watched_movies, get_watched_shows, get_rated_movies, get_rated_shows
+import tracemalloc
+from datetime import datetime, timezone
+from ..trakt_client import (
+    get_watched_movies, get_watched_shows, get_rated_movies, get_rated_shows,
+    get_history_movies, get_history_shows, iter_history_movies, rated_since,
+)
 
 class TraktClientTest(TestCase):
-    @patch('catalog.trakt_client.requests.get')
+    @patch('catalog.trakt_client.requests_get')
     def test_get_watched_movies_success(self, mock_get):
         mock_response = Mock()
         mock_response.json.return_value = [
@@ -14,7 +19,8 @@ class TraktClientTest(TestCase):
                     'year': 2023,
                     'ids': {'trakt': 1, 'tmdb': 123}
                 },
-                'last_watched_at': '2023-01-01T00:00:00Z'
+                'last_watched_at': '2023-01-01T00:00:00Z',
+                'plays': 5,
             }
         ]
         mock_response.raise_for_status.return_value = None
@@ -26,8 +32,9 @@ class TraktClientTest(TestCase):
         self.assertEqual(results[0]['title'], 'Test Movie')
         self.assertEqual(results[0]['tmdb_id'], 123)
         self.assertEqual(results[0]['media_type'], 'movie')
+        self.assertEqual(results[0]['plays'], 5)
 
-    @patch('catalog.trakt_client.requests.get')
+    @patch('catalog.trakt_client.requests_get')
     def test_get_watched_movies_request_exception(self, mock_get):
         mock_get.side_effect = requests.RequestException('Network error')
 
@@ -35,7 +42,7 @@ class TraktClientTest(TestCase):
 
         self.assertEqual(results, [])
 
-    @patch('catalog.trakt_client.requests.get')
+    @patch('catalog.trakt_client.requests_get')
     def test_get_watched_movies_empty_results(self, mock_get):
         mock_response = Mock()
         mock_response.json.return_value = []
@@ -46,7 +53,7 @@ class TraktClientTest(TestCase):
 
         self.assertEqual(results, [])
 
-    @patch('catalog.trakt_client.requests.get')
+    @patch('catalog.trakt_client.requests_get')
     def test_get_watched_shows_success(self, mock_get):
         mock_response = Mock()
         mock_response.json.return_value = [
@@ -56,7 +63,13 @@ class TraktClientTest(TestCase):
                     'year': 2023,
                     'ids': {'trakt': 2, 'tmdb': 456}
                 },
-                'last_watched_at': '2023-01-01T00:00:00Z'
+                'last_watched_at': '2023-01-01T00:00:00Z',
+                'seasons': [
+                    {'number': 1, 'episodes': [
+                        {'number': 1, 'plays': 2, 'last_watched_at': '2022-12-01T00:00:00Z'},
+                        {'number': 2, 'plays': 1, 'last_watched_at': '2023-01-01T00:00:00Z'},
+                    ]},
+                ]
             }
         ]
         mock_response.raise_for_status.return_value = None
@@ -68,8 +81,12 @@ class TraktClientTest(TestCase):
         self.assertEqual(results[0]['title'], 'Test Show')
         self.assertEqual(results[0]['tmdb_id'], 456)
         self.assertEqual(results[0]['media_type'], 'tv')
+        self.assertEqual(results[0]['episodes'], [
+            (1, 1, '2022-12-01T00:00:00Z'),
+            (1, 2, '2023-01-01T00:00:00Z'),
+        ])
 
-    @patch('catalog.trakt_client.requests.get')
+    @patch('catalog.trakt_client.requests_get')
     def test_get_rated_movies_success(self, mock_get):
         mock_response = Mock()
         mock_response.json.return_value = [
@@ -93,7 +110,7 @@ class TraktClientTest(TestCase):
         self.assertEqual(results[0]['rating'], 8)
         self.assertEqual(results[0]['tmdb_id'], 123)
 
-    @patch('catalog.trakt_client.requests.get')
+    @patch('catalog.trakt_client.requests_get')
     def test_get_rated_shows_success(self, mock_get):
         mock_response = Mock()
         mock_response.json.return_value = [
@@ -117,7 +134,7 @@ class TraktClientTest(TestCase):
         self.assertEqual(results[0]['rating'], 9)
         self.assertEqual(results[0]['tmdb_id'], 456)
 
-    @patch('catalog.trakt_client.requests.get')
+    @patch('catalog.trakt_client.requests_get')
     def test_get_watched_movies_missing_tmdb_id(self, mock_get):
         mock_response = Mock()
         mock_response.json.return_value = [
@@ -139,7 +156,7 @@ class TraktClientTest(TestCase):
         self.assertEqual(results[0]['title'], 'Test Movie')
         self.assertIsNone(results[0]['tmdb_id'])
 
-    @patch('catalog.trakt_client.requests.get')
+    @patch('catalog.trakt_client.requests_get')
     def test_get_rated_movies_missing_tmdb_id(self, mock_get):
         mock_response = Mock()
         mock_response.json.return_value = [
@@ -160,4 +177,131 @@ class TraktClientTest(TestCase):
 
         self.assertEqual(len(results), 1)
         self.assertEqual(results[0]['title'], 'Test Movie')
-        self.assertIsNone(results[0]['tmdb_id'])
\ No newline at end of file
+        self.assertIsNone(results[0]['tmdb_id'])
+
+    @patch('catalog.trakt_client.requests_get')
+    def test_get_watched_movies_raise_errors(self, mock_get):
+        mock_get.side_effect = requests.RequestException('Network error')
+
+        with self.assertRaises(requests.RequestException):
+            get_watched_movies('test_user', 'fake_client_id', raise_errors=True)
+
+
+class TraktHistoryTest(TestCase):
+    def _page(self, items, page_count):
+        response = Mock()
+        response.json.return_value = items
+        response.headers = {'X-Pagination-Page-Count': str(page_count)}
+        response.raise_for_status.return_value = None
+        return response
+
+    @patch('catalog.trakt_client.requests_get')
+    def test_history_movies_follows_pages_and_passes_start_at(self, mock_get):
+        entry = lambda tmdb_id: {
+            'watched_at': '2024-03-01T10:00:00.000Z',
+            'movie': {'title': f'Movie {tmdb_id}', 'year': 2020, 'ids': {'trakt': tmdb_id, 'tmdb': tmdb_id}},
+        }
+        mock_get.side_effect = [self._page([entry(1), entry(2)], 2), self._page([entry(3)], 2)]
+        since = datetime(2024, 2, 1, 8, 30, tzinfo=timezone.utc)
+
+        results = get_history_movies('test_user', 'fake_client_id', start_at=since)
+
+        self.assertEqual([r['tmdb_id'] for r in results], [1, 2, 3])
+        self.assertEqual(results[0]['last_watched_at'], '2024-03-01T10:00:00.000Z')
+        self.assertEqual(mock_get.call_count, 2)
+        params = mock_get.call_args_list[1].kwargs['params']
+        self.assertEqual(params['page'], 2)
+        self.assertEqual(params['start_at'], '2024-02-01T08:30:00.000Z')
+
+    @patch('catalog.trakt_client.requests_get')
+    def test_history_shows_maps_episodes_to_shows(self, mock_get):
+        mock_get.return_value = self._page([{
+            'watched_at': '2024-03-01T10:00:00.000Z',
+            'episode': {'season': 1, 'number': 2},
+            'show': {'title': 'Show', 'year': 2019, 'ids': {'trakt': 5, 'tmdb': 50}},
+        }], 1)
+
+        results = get_history_shows('test_user', 'fake_client_id')
+
+        self.assertEqual(results[0]['media_type'], 'tv')
+        self.assertEqual(results[0]['tmdb_id'], 50)
+        self.assertEqual(results[0]['episodes'], [(1, 2, '2024-03-01T10:00:00.000Z')])
+        self.assertNotIn('start_at', mock_get.call_args.kwargs['params'])
+
+    def test_rated_since_filters_by_rated_at(self):
+        items = [
+            {'tmdb_id': 1, 'rated_at': '2024-01-01T00:00:00.000Z'},
+            {'tmdb_id': 2, 'rated_at': '2024-03-01T00:00:00.000Z'},
+            {'tmdb_id': 3, 'rated_at': None},
+        ]
+        since = datetime(2024, 2, 1, tzinfo=timezone.utc)
+
+        self.assertEqual([i['tmdb_id'] for i in rated_since(items, since)], [2])
+        self.assertEqual(list(rated_since(items, None)), items)
+
+
+class _FakePage:
+    def __init__(self, items, page_count):
+        self._items = items
+        self.headers = {'X-Pagination-Page-Count': str(page_count)}
+        self.status_code = 200
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._items
+
+
+class TraktStreamingTest(TestCase):
+    PAGES = 200
+
+    def _history_page(self, url, params=None, **kwargs):
+        page = params['page']
+        items = [
+            {
+                'watched_at': '2024-03-01T10:00:00.000Z',
+                'movie': {'title': f'Movie {page}-{i}' + ' ' * 200, 'year': 2020,
+                          'ids': {'trakt': page * 1000 + i, 'tmdb': page * 1000 + i}},
+            }
+            for i in range(params['limit'])
+        ]
+        return _FakePage(items, self.PAGES)
+
+    @patch('catalog.trakt_client.requests_get')
+    def test_history_stream_is_lazy(self, mock_get):
+        mock_get.side_effect = self._history_page
+
+        stream = iter_history_movies('test_user', 'fake_client_id')
+        mock_get.assert_not_called()
+        next(stream)
+
+        self.assertEqual(mock_get.call_count, 1)
+
+    @patch('catalog.trakt_client.requests_get')
+    def test_streaming_peak_memory_stays_flat(self, mock_get):
+        mock_get.side_effect = self._history_page
+
+        def peak_of(consume):
+            tracemalloc.start()
+            try:
+                consume(iter_history_movies('test_user', 'fake_client_id'))
+                return tracemalloc.get_traced_memory()[1]
+            finally:
+                tracemalloc.stop()
+
+        count = 0
+
+        def drain(stream):
+            nonlocal count
+            for _ in stream:
+                count += 1
+
+        streamed_peak = peak_of(drain)
+        mock_get.reset_mock()
+        listed_peak = peak_of(list)
+
+        self.assertEqual(count, self.PAGES * 100)
+        # Одна страница в памяти вместо всей истории
+        self.assertLess(streamed_peak, 2 * 1024 * 1024)
+        self.assertLess(streamed_peak * 5, listed_peak)
@@ -1,10 +1,12 @@
 import json
 from django.test import TestCase, RequestFactory
 from django.contrib.auth.models import User, AnonymousUser
+from django.core.files.uploadedfile import SimpleUploadedFile
 from django.contrib.messages.storage.fallback import FallbackStorage
 from django.urls import reverse
 from unittest.mock import patch, MagicMock
-from ..models import Movie, UserRating, UserSettings, ImportTask
+from ..models import Movie, UserRating, UserSettings, ImportTask, PlexWebhookEvent, WatchEvent
+from ..plex_utils import DiscardFilesUploadHandler, clear_webhook_auth_cache, get_webhook_auth
 
 class ViewsTest(TestCase):
     def setUp(self):
@@ -58,6 +60,53 @@ class ViewsTest(TestCase):
         self.assertEqual(response.status_code, 200)
         mock_search.assert_called_once_with('test', 'test_tmdb_key_32_characters_long_')
 
+    @patch('catalog.views.search_movies')
+    def test_movie_search_drops_stale_sequence(self, mock_search):
+        mock_search.return_value = []
+        from catalog.views import movie_search
+
+        newer = self.factory.get('/search/?query=interstellar&seq=200')
+        newer.user = self.user
+        newer.META['HTTP_HX_REQUEST'] = 'true'
+        older = self.factory.get('/search/?query=inter&seq=100')
+        older.user = self.user
+        older.META['HTTP_HX_REQUEST'] = 'true'
+
+        self.assertEqual(movie_search(newer).status_code, 200)
+        self.assertEqual(movie_search(older).status_code, 204)
+        mock_search.assert_called_once()
+
+    def _search_with_results(self, results):
+        from catalog.views import movie_search
+        request = self.factory.get('/search/?query=test')
+        request.user = self.user
+        request.META['HTTP_HX_REQUEST'] = 'true'
+        with patch('catalog.views.search_movies', return_value=results):
+            return movie_search(request)
+
+    def test_movie_search_collection_flags(self):
+        UserRating.objects.create(user=self.user, movie=self.movie)
+        results = [
+            {'id': 123, 'media_type': 'movie', 'title': 'Test Movie'},
+            {'id': 123, 'media_type': 'tv', 'title': 'Same ID Show'},
+            {'id': 456, 'media_type': 'movie', 'title': 'Other Movie'},
+        ]
+
+        self._search_with_results(results)
+
+        self.assertEqual([r['is_in_collection'] for r in results], [True, False, False])
+
+    def test_movie_search_query_budget_is_constant(self):
+        UserRating.objects.create(user=self.user, movie=self.movie)
+        for size in (1, 40):
+            results = [
+                {'id': 100 + i, 'media_type': 'movie' if i % 2 else 'tv', 'title': f'Result {i}'}
+                for i in range(size)
+            ]
+            with self.assertNumQueries(2):
+                response = self._search_with_results(results)
+            self.assertEqual(response.status_code, 200)
+
     @patch('catalog.views.get_movie_details')
     def test_add_movie_success(self, mock_get_details):
         mock_get_details.return_value = {'title': 'Test Movie', 'overview': 'Test'}
@@ -113,6 +162,21 @@ class ViewsTest(TestCase):
         user_rating.refresh_from_db()
         self.assertEqual(user_rating.rating, 8)
 
+    def test_movie_detail_post_watched(self):
+        UserRating.objects.create(user=self.user, movie=self.movie, rating=6)
+
+        request = self.factory.post(f'/movie/{self.movie.tmdb_id}/', {'watched': '1'})
+        request.user = self.user
+        request = self._add_messages_to_request(request)
+
+        from catalog.views import movie_detail
+        response = movie_detail(request, self.movie.tmdb_id)
+
+        self.assertEqual(response.status_code, 302)
+        user_rating = UserRating.objects.get(user=self.user, movie=self.movie)
+        self.assertEqual((user_rating.rating, user_rating.play_count), (6, 1))
+        self.assertTrue(WatchEvent.objects.filter(user=self.user, movie=self.movie, source='manual').exists())
+
     def test_my_library_authenticated(self):
         user_rating = UserRating(user=self.user, movie=self.movie)
         user_rating.save()
@@ -192,6 +256,22 @@ class ViewsTest(TestCase):
         self.assertEqual(response.status_code, 302)  # Redirect
         mock_import_task.assert_called_once()
 
+    @patch('catalog.views.import_trakt_data_task')
+    def test_import_from_trakt_incremental_mode(self, mock_import_task):
+        self.user_settings.trakt_username = 'test_user'
+        self.user_settings.trakt_client_id = 'test_client_id'
+        self.user_settings.save()
+
+        request = self.factory.post('/import/', {'mode': 'incremental'})
+        request.user = self.user
+        request = self._add_messages_to_request(request)
+
+        from catalog.views import import_from_trakt
+        import_from_trakt(request)
+
+        self.assertTrue(mock_import_task.call_args.kwargs['incremental'])
+        self.assertEqual(ImportTask.objects.get(user=self.user).mode, 'incremental')
+
     @patch('catalog.views.import_trakt_data_task')
     def test_import_from_trakt_duplicate_task_blocked(self, mock_import_task):
         # Setup user with complete settings
@@ -293,4 +373,96 @@ class ViewsTest(TestCase):
 
         self.assertEqual(response.status_code, 404)
         response_data = response.content.decode()
-        self.assertIn('error', response_data)
\ No newline at end of file
+        self.assertIn('error', response_data)
+
+class PlexWebhookReceiverTest(TestCase):
+    def setUp(self):
+        clear_webhook_auth_cache()
+        self.user = User.objects.create_user(username='plexuser', password='password')
+        UserSettings.objects.create(
+            user=self.user,
+            plex_webhook_token='webhook-token',
+            plex_webhook_enabled=True,
+        )
+        self.url = reverse('catalog:plex_webhook', args=['webhook-token'])
+
+    def _post(self, event, url=None):
+        payload = {'event': event, 'Metadata': {'type': 'movie', 'guid': 'tmdb://1', 'title': 'Movie'}}
+        return self.client.post(url or self.url, {'payload': json.dumps(payload)})
+
+    @patch('catalog.views.process_plex_events_task')
+    @patch('catalog.plex_utils.process_plex_event')
+    def test_event_is_stored_and_queued(self, mock_process, mock_task):
+        response = self._post('media.scrobble')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['queued'])
+        mock_process.assert_not_called()
+        mock_task.assert_called_once_with(self.user.id)
+        event = PlexWebhookEvent.objects.get(user=self.user)
+        self.assertEqual(event.event_type, 'media.scrobble')
+        self.assertIsNone(event.processed_at)
+
+    @patch('catalog.views.process_plex_events_task')
+    def test_unsupported_event_is_not_queued(self, mock_task):
+        response = self._post('media.pause')
+
+        self.assertFalse(response.json()['queued'])
+        mock_task.assert_not_called()
+        self.assertIsNotNone(PlexWebhookEvent.objects.get(user=self.user).processed_at)
+
+    @patch('catalog.views.process_plex_events_task')
+    def test_invalid_token_rejected(self, mock_task):
+        response = self._post('media.scrobble', reverse('catalog:plex_webhook', args=['wrong']))
+
+        self.assertEqual(response.status_code, 403)
+        mock_task.assert_not_called()
+        self.assertFalse(PlexWebhookEvent.objects.exists())
+
+    @patch('catalog.views.process_plex_events_task')
+    def test_thumbnail_part_is_ignored(self, mock_task):
+        payload = {'event': 'media.scrobble', 'Metadata': {'type': 'movie', 'guid': 'tmdb://1', 'title': 'Movie'}}
+        thumb = SimpleUploadedFile('thumb.jpg', b'\xff\xd8' + b'0' * 200000, content_type='image/jpeg')
+
+        response = self.client.post(self.url, {'payload': json.dumps(payload), 'thumb': thumb})
+
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.json()['queued'])
+        self.assertEqual(PlexWebhookEvent.objects.get(user=self.user).event_type, 'media.scrobble')
+
+    def test_discard_handler_skips_file_parts(self):
+        thumb = SimpleUploadedFile('thumb.jpg', b'\xff\xd8' + b'0' * 200000, content_type='image/jpeg')
+        request = RequestFactory().post('/webhook/', {'payload': '{"event": "media.play"}', 'thumb': thumb})
+        request.upload_handlers = [DiscardFilesUploadHandler(request)]
+
+        self.assertEqual(request.POST['payload'], '{"event": "media.play"}')
+        self.assertEqual(len(request.FILES), 0)
+
+    @patch('catalog.views.process_plex_events_task')
+    def test_cached_token_needs_no_auth_query(self, mock_task):
+        self._post('media.pause')
+
+        # Only the dedup lookup and repeat counter update remain once the token is cached
+        with self.assertNumQueries(2):
+            response = self._post('media.pause')
+
+        self.assertEqual(response.status_code, 200)
+
+    @patch('catalog.views.process_plex_events_task')
+    def test_disabling_webhook_invalidates_cached_token(self, mock_task):
+        self._post('media.pause')
+        self.client.force_login(self.user)
+
+        self.client.post(reverse('catalog:disable_plex_webhook'))
+
+        self.assertIsNone(get_webhook_auth('webhook-token'))
+        self.assertEqual(self._post('media.pause').status_code, 403)
+
+    def test_regenerated_token_replaces_cached_one(self):
+        self.assertIsNotNone(get_webhook_auth('webhook-token'))
+        self.client.force_login(self.user)
+
+        new_token = self.client.post(reverse('catalog:generate_plex_webhook')).json()['token']
+
+        self.assertIsNone(get_webhook_auth('webhook-token'))
+        self.assertEqual(get_webhook_auth(new_token).user_id, self.user.id)
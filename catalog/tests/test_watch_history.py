@@ -0,0 +1,144 @@
+import threading
+from datetime import datetime, timedelta, timezone
+from unittest.mock import patch
+from django.db import connection
+from django.test import TestCase, TransactionTestCase, override_settings
+from django.contrib.auth.models import User
+from ..models import Movie, EpisodeWatch, ShowProgress, UserRating, WatchEvent
+from ..watch_history import record_episode_watches, record_watches
+
+
+def at(day):
+    return datetime(2024, 1, day, 20, 0, tzinfo=timezone.utc)
+
+
+class RecordWatchesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        Movie.objects.create(tmdb_id=100, media_type='movie', title='Movie')
+        Movie.objects.create(tmdb_id=200, media_type='movie', title='Other Movie')
+
+    def test_counters_follow_appended_watches(self):
+        record_watches(self.user.id, {100: [at(5)]}, WatchEvent.SOURCE_PLEX)
+        record_watches(self.user.id, {100: [at(1), at(9)]}, WatchEvent.SOURCE_TRAKT)
+
+        rating = UserRating.objects.get(user=self.user, movie_id=100)
+        self.assertEqual((rating.play_count, rating.first_watched_at, rating.watched_at), (3, at(1), at(9)))
+        self.assertEqual(
+            sorted(WatchEvent.objects.values_list('watched_at', 'source')),
+            [(at(1), 'trakt'), (at(5), 'plex'), (at(9), 'trakt')],
+        )
+
+    def test_same_watch_is_recorded_once(self):
+        self.assertEqual(record_watches(self.user.id, {100: [at(1), at(1)]}, WatchEvent.SOURCE_TRAKT), 1)
+        self.assertEqual(record_watches(self.user.id, {100: [at(1)]}, WatchEvent.SOURCE_PLEX), 0)
+
+        self.assertEqual(UserRating.objects.get(user=self.user, movie_id=100).play_count, 1)
+
+    @override_settings(WATCH_DEDUP_TOLERANCE=300)
+    def test_same_viewing_from_two_sources_is_recorded_once(self):
+        record_watches(self.user.id, {100: [at(5)]}, WatchEvent.SOURCE_PLEX)
+
+        self.assertEqual(record_watches(self.user.id, {100: [at(5) + timedelta(seconds=40)]}, WatchEvent.SOURCE_TRAKT), 0)
+        self.assertEqual(record_watches(self.user.id, {100: [at(5) + timedelta(minutes=30)]}, WatchEvent.SOURCE_TRAKT), 1)
+        # The tolerance only merges reports from different sources
+        self.assertEqual(record_watches(self.user.id, {100: [at(5) + timedelta(seconds=40)]}, WatchEvent.SOURCE_PLEX), 1)
+
+        self.assertEqual(UserRating.objects.get(user=self.user, movie_id=100).play_count, 3)
+
+    def test_play_count_raised_to_source_plays(self):
+        record_watches(self.user.id, {100: [at(5)]}, WatchEvent.SOURCE_PLEX)
+
+        record_watches(self.user.id, {100: [at(9)], 200: []}, WatchEvent.SOURCE_TRAKT, {100: 4, 200: 2})
+        record_watches(self.user.id, {100: [at(9)]}, WatchEvent.SOURCE_TRAKT, {100: 4})
+
+        rating = UserRating.objects.get(user=self.user, movie_id=100)
+        self.assertEqual((rating.play_count, rating.first_watched_at, rating.watched_at), (4, at(5), at(9)))
+        self.assertEqual(UserRating.objects.get(user=self.user, movie_id=200).play_count, 2)
+
+    def test_existing_rating_keeps_its_score(self):
+        UserRating.objects.create(user=self.user, movie_id=100, rating=7)
+
+        record_watches(self.user.id, {100: [at(2)], 200: [at(3)], 300: []}, WatchEvent.SOURCE_MANUAL)
+
+        self.assertEqual(
+            sorted(UserRating.objects.values_list('movie_id', 'rating', 'play_count')),
+            [(100, 7, 1), (200, None, 1)],
+        )
+
+
+class RecordEpisodeWatchesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        Movie.objects.create(tmdb_id=100, media_type='tv', title='Show')
+        Movie.objects.create(tmdb_id=200, media_type='tv', title='Other Show')
+
+    def test_rollup_counts_episodes_and_rewatches(self):
+        record_episode_watches(self.user.id, {100: [(1, 1, at(1)), (1, 2, at(2))]})
+        record_episode_watches(self.user.id, {100: [(1, 1, at(5))]})
+
+        progress = ShowProgress.objects.get(user=self.user, show_id=100)
+        self.assertEqual(progress.episodes_watched, 2)
+        self.assertEqual(progress.watch_count, 3)
+        self.assertEqual((progress.last_season, progress.last_episode, progress.last_watched_at), (1, 1, at(5)))
+        self.assertEqual(EpisodeWatch.objects.filter(user=self.user).count(), 3)
+
+    def test_same_watch_is_recorded_once(self):
+        self.assertEqual(record_episode_watches(self.user.id, {100: [(1, 1, at(1)), (1, 1, at(1))]}), 1)
+        self.assertEqual(record_episode_watches(self.user.id, {100: [(1, 1, at(1))]}), 0)
+
+        progress = ShowProgress.objects.get(user=self.user, show_id=100)
+        self.assertEqual((progress.episodes_watched, progress.watch_count), (1, 1))
+
+    def test_older_watch_keeps_latest_episode(self):
+        record_episode_watches(self.user.id, {100: [(2, 3, at(10))]})
+        record_episode_watches(self.user.id, {100: [(1, 1, at(1))]})
+
+        progress = ShowProgress.objects.get(user=self.user, show_id=100)
+        self.assertEqual((progress.last_season, progress.last_episode), (2, 3))
+        self.assertEqual(progress.episodes_watched, 2)
+
+    def test_several_shows_in_one_call(self):
+        record_episode_watches(self.user.id, {100: [(1, 1, at(1))], 200: [(3, 4, at(2)), (3, 5, at(3))], 300: []})
+
+        self.assertEqual(
+            dict(ShowProgress.objects.values_list('show_id', 'episodes_watched')),
+            {100: 1, 200: 2},
+        )
+
+
+class ConcurrentRecordWatchesTest(TransactionTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='viewer', password='password')
+        Movie.objects.create(tmdb_id=100, media_type='movie', title='Movie')
+
+    def test_concurrent_writers_do_not_fail(self):
+        bulk_create = WatchEvent.objects.bulk_create
+        both_read = threading.Barrier(2)
+        errors = []
+
+        def read_then_write(*args, **kwargs):
+            # Let the other writer read too; with immediate transactions it waits for us instead
+            try:
+                both_read.wait(timeout=0.5)
+            except threading.BrokenBarrierError:
+                pass
+            return bulk_create(*args, **kwargs)
+
+        def record(day):
+            try:
+                record_watches(self.user.id, {100: [at(day)]}, WatchEvent.SOURCE_PLEX)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        with patch.object(WatchEvent.objects, 'bulk_create', side_effect=read_then_write):
+            threads = [threading.Thread(target=record, args=(day,)) for day in (1, 2)]
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+
+        self.assertEqual(errors, [])
+        self.assertEqual(UserRating.objects.get(user=self.user, movie_id=100).play_count, 2)
@@ -1,7 +1,16 @@
+import os
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor
+from datetime import datetime, timezone as dt_timezone
+
 import requests
 from django.conf import settings
+from django.core.cache import caches
 from .logger import logger, mask_sensitive
-from .http_client import requests_get
+from .http_client import requests_get, RateLimiter
+from .cache_utils import LRUCache
+from .counters import SharedCounters
 
 TMDB_BASE_URL = 'https://api.themoviedb.org/3'
 TMDB_HEADERS = {
@@ -10,6 +19,10 @@ TMDB_HEADERS = {
     'Accept-Language': 'en-US,en;q=0.9',
 }
 
+# Shared by every thread of the process so parallel imports stay within TMDB limits
+tmdb_rate_limiter = RateLimiter(getattr(settings, 'TMDB_RATE_LIMIT', 40))
+
+
 def get_tmdb_language(user_language: str) -> str:
     """Convert Django language code to TMDB API language format."""
     language_map = {
@@ -18,65 +31,336 @@ def get_tmdb_language(user_language: str) -> str:
     }
     return language_map.get(user_language, 'en-US')
 
-def search_movies(query: str, api_key: str, language: str = 'en-US') -> list[dict]:
-    """Search for movies and TV shows using TMDB API."""
-    results = []
-    logger.debug(f"Searching TMDB for query: '{query}' with language: {language}")
-    
-    try:
-        url = f"{TMDB_BASE_URL}/search/movie"
-        params = {
-            'api_key': api_key,
-            'query': query,
-            'language': language,
+SEARCH_MODES = ('concurrent', 'sequential', 'multi')
+
+
+def _search_result(item: dict, media_type: str) -> dict:
+    if media_type == 'movie':
+        return {
+            'id': item['id'],
+            'media_type': 'movie',
+            'title': item.get('title', item.get('original_title', '')),
+            'release_date': item.get('release_date', ''),
+            'overview': item.get('overview', ''),
+            'poster_path': item.get('poster_path', ''),
         }
+    return {
+        'id': item['id'],
+        'media_type': 'tv',
+        'title': item.get('name', item.get('original_name', '')),
+        'release_date': item.get('first_air_date', ''),
+        'overview': item.get('overview', ''),
+        'poster_path': item.get('poster_path', ''),
+    }
+
+
+def _search_endpoint(endpoint: str, query: str, api_key: str, language: str):
+    """Query a single /search/{endpoint} and return raw TMDB results, or None on error."""
+    url = f"{TMDB_BASE_URL}/search/{endpoint}"
+    params = {
+        'api_key': api_key,
+        'query': query,
+        'language': language,
+    }
+    try:
+        tmdb_rate_limiter.acquire()
         response = requests_get(url, params=params, headers=TMDB_HEADERS)
         response.raise_for_status()
-        data = response.json()
-        movie_count = len(data.get('results', []))
-        logger.info(f"Found {movie_count} movies for query '{query}'")
-        
-        for item in data.get('results', []):
-            results.append({
-                'id': item['id'],
-                'media_type': 'movie',
-                'title': item.get('title', item.get('original_title', '')),
-                'release_date': item.get('release_date', ''),
-                'overview': item.get('overview', ''),
-                'poster_path': item.get('poster_path', ''),
-            })
+        items = response.json().get('results', [])
+        logger.info(f"Found {len(items)} results in /search/{endpoint} for query '{query}'")
+        return items
     except requests.RequestException as e:
-        logger.error(f"Error searching movies: {e}")
+        logger.error(f"Error searching /search/{endpoint}: {e}")
+        return None
+
+
+_search_executor = None
+_search_executor_lock = threading.Lock()
+
+
+def _get_search_executor():
+    global _search_executor
+    if _search_executor is None:
+        with _search_executor_lock:
+            if _search_executor is None:
+                _search_executor = ThreadPoolExecutor(
+                    max_workers=getattr(settings, 'TMDB_SEARCH_WORKERS', 8),
+                    thread_name_prefix='tmdb-search',
+                )
+    return _search_executor
+
+
+def _search_tmdb(query: str, api_key: str, language: str, mode: str) -> tuple[list[dict], bool]:
+    """Run an uncached search. Returns (results, complete) where complete is False if any request failed."""
+    if mode == 'multi':
+        items = _search_endpoint('multi', query, api_key, language)
+        movie_items = [item for item in items or [] if item.get('media_type') == 'movie']
+        tv_items = [item for item in items or [] if item.get('media_type') == 'tv']
+        complete = items is not None
+    else:
+        if mode == 'sequential':
+            movie_items = _search_endpoint('movie', query, api_key, language)
+            tv_items = _search_endpoint('tv', query, api_key, language)
+        else:
+            executor = _get_search_executor()
+            movie_future = executor.submit(_search_endpoint, 'movie', query, api_key, language)
+            tv_future = executor.submit(_search_endpoint, 'tv', query, api_key, language)
+            movie_items = movie_future.result()
+            tv_items = tv_future.result()
+        complete = movie_items is not None and tv_items is not None
+
+    results = [_search_result(item, 'movie') for item in movie_items or []]
+    results += [_search_result(item, 'tv') for item in tv_items or []]
+    return results, complete
+
+
+_search_cache = LRUCache(
+    maxsize=getattr(settings, 'TMDB_SEARCH_CACHE_MAX_ENTRIES', 1024),
+    ttl=getattr(settings, 'TMDB_SEARCH_CACHE_TTL', 600),
+)
+_search_inflight = {}
+_search_inflight_lock = threading.Lock()
+
+
+def normalize_query(query: str) -> str:
+    """Normalize a search query for cache lookups: case-folded, single-spaced."""
+    return ' '.join(query.casefold().split())
+
+
+def clear_search_cache():
+    _search_cache.clear()
+
+
+def search_movies(query: str, api_key: str, language: str = 'en-US', mode: str = None,
+                  use_cache: bool = True) -> list[dict]:
+    """
+    Search for movies and TV shows using TMDB API.
+
+    Modes (default TMDB_SEARCH_MODE):
+    - concurrent: /search/movie and /search/tv issued in parallel
+    - sequential: the same two requests one after the other
+    - multi: a single /search/multi request, people filtered out
+
+    Movies are always listed before TV shows, each in TMDB relevance order.
+
+    Results are cached per normalized query and language for all users,
+    and identical searches already in flight are joined instead of being
+    sent to TMDB again. Searches where a request failed are not cached.
+    """
+    mode = mode or getattr(settings, 'TMDB_SEARCH_MODE', 'concurrent')
+    logger.debug(f"Searching TMDB for query: '{query}' with language: {language}, mode: {mode}")
+
+    if not use_cache:
+        results, _ = _search_tmdb(query, api_key, language, mode)
+        return results
+
+    key = (normalize_query(query), language, mode)
+    cached = _search_cache.get(key)
+    if cached is not None:
+        logger.debug(f"Search cache hit for '{query}'")
+        return [dict(result) for result in cached]
+
+    with _search_inflight_lock:
+        future = _search_inflight.get(key)
+        is_owner = future is None
+        if is_owner:
+            future = Future()
+            _search_inflight[key] = future
+
+    if not is_owner:
+        logger.debug(f"Joining in-flight search for '{query}'")
+        return [dict(result) for result in future.result()]
 
     try:
-        url = f"{TMDB_BASE_URL}/search/tv"
-        params = {
-            'api_key': api_key,
-            'query': query,
-            'language': language,
-        }
-        response = requests_get(url, params=params, headers=TMDB_HEADERS)
+        results, complete = _search_tmdb(query, api_key, language, mode)
+        if complete:
+            _search_cache.set(key, results)
+        future.set_result(results)
+    except Exception as e:
+        future.set_exception(e)
+        raise
+    finally:
+        with _search_inflight_lock:
+            _search_inflight.pop(key, None)
+
+    logger.debug(f"Total results for '{query}': {len(results)}")
+    return [dict(result) for result in results]
+
+_details_cache = LRUCache(maxsize=getattr(settings, 'TMDB_CACHE_MAX_ENTRIES', 2048))
+_details_stats = SharedCounters('tmdb_details', ['memory_hits', 'store_hits', 'stale_hits', 'misses', 'refreshes'])
+_details_lock = threading.Lock()
+_refreshing = set()
+_refresh_executor = None
+
+
+class MovieDetails(dict):
+    """TMDB details payload that remembers when it was fetched from TMDB"""
+
+    def __init__(self, data: dict, fetched_at: float):
+        super().__init__(data)
+        self.fetched_at = datetime.fromtimestamp(fetched_at, tz=dt_timezone.utc)
+
+
+def _details_cache_key(media_type: str, tmdb_id: int, language: str) -> str:
+    return f"tmdb:details:{media_type}:{tmdb_id}:{language}"
+
+
+def _details_store():
+    return caches[getattr(settings, 'TMDB_CACHE_ALIAS', 'tmdb')]
+
+
+def _count(stat: str):
+    _details_stats.incr(stat)
+
+
+def get_details_cache_stats() -> dict:
+    """
+    Hit/miss counters of the TMDB details cache summed over all processes,
+    and the number of entries in this process's memory tier.
+    """
+    stats = _details_stats.totals()
+    stats['memory_size'] = len(_details_cache)
+    return stats
+
+
+def reset_details_cache_stats():
+    """Reset the hit/miss counters, keeping the cached entries."""
+    _details_stats.reset()
+
+
+def clear_details_cache():
+    """Drop both cache tiers and reset counters."""
+    _details_cache.clear()
+    _details_store().clear()
+    _details_stats.reset()
+
+
+def _get_cached_details(key: str):
+    entry = _details_cache.get(key)
+    if entry is not None:
+        return entry, 'memory_hits'
+    entry = _details_store().get(key)
+    if entry is not None:
+        _details_cache.set(key, entry)
+        return entry, 'store_hits'
+    return None, None
+
+
+def _store_details(key: str, data: dict, fetched_at: float):
+    entry = {'fetched_at': fetched_at, 'data': data}
+    timeout = settings.TMDB_CACHE_TTL + settings.TMDB_CACHE_STALE_TTL
+    _details_cache.set(key, entry)
+    _details_store().set(key, entry, timeout=timeout)
+
+
+def _get_refresh_executor():
+    global _refresh_executor
+    if _refresh_executor is None:
+        with _details_lock:
+            if _refresh_executor is None:
+                _refresh_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix='tmdb-refresh')
+    return _refresh_executor
+
+
+def _reset_after_fork():
+    global _details_lock, _refresh_executor, _search_executor_lock, _search_executor, _search_inflight_lock
+    _details_lock = threading.Lock()
+    _refresh_executor = None
+    _search_executor_lock = threading.Lock()
+    _search_executor = None
+    _search_inflight_lock = threading.Lock()
+    _search_inflight.clear()
+    _refreshing.clear()
+
+
+if hasattr(os, 'register_at_fork'):
+    os.register_at_fork(after_in_child=_reset_after_fork)
+
+
+def _refresh_details(key: str, media_type: str, tmdb_id: int, api_key: str, language: str):
+    try:
+        fetched_at = time.time()
+        data = fetch_movie_details(media_type, tmdb_id, api_key, language)
+        if data:
+            _store_details(key, data, fetched_at)
+            _count('refreshes')
+    finally:
+        with _details_lock:
+            _refreshing.discard(key)
+
+
+def _schedule_refresh(key: str, media_type: str, tmdb_id: int, api_key: str, language: str):
+    """Revalidate a stale entry in the background, at most once per key."""
+    with _details_lock:
+        if key in _refreshing:
+            return
+        _refreshing.add(key)
+    logger.debug(f"Scheduling TMDB details refresh for {media_type}/{tmdb_id}")
+    _get_refresh_executor().submit(_refresh_details, key, media_type, tmdb_id, api_key, language)
+
+
+def get_movie_details(media_type: str, tmdb_id: int, api_key: str, language: str = 'en-US',
+                      use_cache: bool = True) -> dict:
+    """
+    Get detailed movie/TV information, served from cache when possible.
+
+    Entries younger than TMDB_CACHE_TTL are returned directly. Older entries
+    are still returned for another TMDB_CACHE_STALE_TTL seconds while a
+    background refresh fetches a new copy. Failed fetches are never cached.
+    Payloads are MovieDetails, whose fetched_at is when TMDB sent them, so
+    data served from the cache is not stored as newer than it is.
+    """
+    fetched_at = time.time()
+    if not use_cache or not getattr(settings, 'TMDB_CACHE_ENABLED', True):
+        data = fetch_movie_details(media_type, tmdb_id, api_key, language)
+        return MovieDetails(data, fetched_at) if data else data
+
+    key = _details_cache_key(media_type, tmdb_id, language)
+    entry, tier = _get_cached_details(key)
+    if entry is not None:
+        age = time.time() - entry['fetched_at']
+        if age < settings.TMDB_CACHE_TTL:
+            _count(tier)
+            logger.debug(f"TMDB details cache hit ({tier}) for {media_type}/{tmdb_id}")
+            return MovieDetails(entry['data'], entry['fetched_at'])
+        if age < settings.TMDB_CACHE_TTL + settings.TMDB_CACHE_STALE_TTL:
+            _count('stale_hits')
+            _schedule_refresh(key, media_type, tmdb_id, api_key, language)
+            return MovieDetails(entry['data'], entry['fetched_at'])
+
+    _count('misses')
+    data = fetch_movie_details(media_type, tmdb_id, api_key, language)
+    if not data:
+        return data
+    _store_details(key, data, fetched_at)
+    return MovieDetails(data, fetched_at)
+
+
+def find_show_by_episode(external_id: str, external_source: str, api_key: str):
+    """
+    TMDB ID of the show an episode belongs to, looked up by the episode's
+    ID in another database (external_source 'tvdb_id' or 'imdb_id').
+
+    Returns None when TMDB does not know the episode or the request fails.
+    """
+    try:
+        tmdb_rate_limiter.acquire()
+        response = requests_get(
+            f"{TMDB_BASE_URL}/find/{external_id}",
+            params={'api_key': api_key, 'external_source': external_source},
+            headers=TMDB_HEADERS,
+        )
         response.raise_for_status()
-        data = response.json()
-        tv_count = len(data.get('results', []))
-        logger.info(f"Found {tv_count} TV shows for query '{query}'")
-        
-        for item in data.get('results', []):
-            results.append({
-                'id': item['id'],
-                'media_type': 'tv',
-                'title': item.get('name', item.get('original_name', '')),
-                'release_date': item.get('first_air_date', ''),
-                'overview': item.get('overview', ''),
-                'poster_path': item.get('poster_path', ''),
-            })
+        episodes = response.json().get('tv_episode_results') or []
     except requests.RequestException as e:
-        logger.error(f"Error searching TV shows: {e}")
+        logger.error(f"Error looking up episode {external_source}={external_id}: {e}")
+        return None
+    show_id = episodes[0].get('show_id') if episodes else None
+    logger.debug(f"TMDB episode {external_source}={external_id} belongs to show {show_id}")
+    return show_id
 
-    logger.debug(f"Total results for '{query}': {len(results)}")
-    return results
 
-def get_movie_details(media_type: str, tmdb_id: int, api_key: str, language: str = 'en-US') -> dict:
+def fetch_movie_details(media_type: str, tmdb_id: int, api_key: str, language: str = 'en-US') -> dict:
     """Get detailed movie/TV information from TMDB API."""
     try:
         url = f"{TMDB_BASE_URL}/{media_type}/{tmdb_id}"
@@ -85,6 +369,7 @@ def get_movie_details(media_type: str, tmdb_id: int, api_key: str, language: str
             'language': language,
         }
         logger.debug(f"Fetching TMDB details: {media_type}/{tmdb_id} with language: {language}")
+        tmdb_rate_limiter.acquire()
         response = requests_get(url, params=params, headers=TMDB_HEADERS)
         response.raise_for_status()
         data = response.json()
@@ -105,4 +390,4 @@ def get_movie_details(media_type: str, tmdb_id: int, api_key: str, language: str
         return data
     except requests.RequestException as e:
         logger.error(f"Error getting {media_type} details for {tmdb_id}: {e}")
-        return {}
\ No newline at end of file
+        return {}
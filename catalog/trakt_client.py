@@ -1,9 +1,11 @@
 import requests
+from datetime import datetime
 from django.conf import settings
 from .logger import logger, mask_sensitive
 from .http_client import requests_get
 
 TRAKT_BASE_URL = 'https://api.trakt.tv'
+TRAKT_PAGE_LIMIT = 100
 
 def _get_trakt_headers(client_id: str) -> dict:
     """Get common headers for Trakt API requests."""
@@ -15,127 +17,164 @@ def _get_trakt_headers(client_id: str) -> dict:
         'Accept-Language': 'en-US,en;q=0.9',
     }
 
-def get_watched_movies(username: str, client_id: str) -> list[dict]:
-    """Get watched movies from Trakt.tv."""
+def _page_count(response) -> int:
     try:
-        url = f"{TRAKT_BASE_URL}/users/{username}/watched/movies"
-        headers = _get_trakt_headers(client_id)
-        logger.info(f"Requesting watched movies for user: {username}")
-        logger.debug(f"Trakt API URL: {url}, client_id: {mask_sensitive(client_id)}")
-        
-        response = requests_get(url, headers=headers, timeout=30)
-        logger.debug(f"Trakt API response status: {response.status_code}")
+        return int(response.headers.get('X-Pagination-Page-Count', 1))
+    except (TypeError, ValueError):
+        return 1
+
+def _iter_pages(url: str, headers: dict, params: dict = None, limit: int = None):
+    """
+    Yield raw items of a Trakt endpoint, one page in memory at a time.
+
+    With a limit, pages are requested via Trakt's page/limit parameters until
+    X-Pagination-Page-Count is reached; without one a single request is made.
+    """
+    page = 1
+    while True:
+        page_params = dict(params or {})
+        if limit:
+            page_params.update(page=page, limit=limit)
+        response = requests_get(url, headers=headers, params=page_params or None, timeout=30)
+        logger.debug(f"Trakt API response status: {response.status_code} for {url} page {page}")
         response.raise_for_status()
-        
-        data = response.json()
-        logger.info(f"Received {len(data)} watched movies for {username}")
-        
-        results = []
-        for item in data:
-            movie = item['movie']
-            results.append({
-                'trakt_id': movie['ids']['trakt'],
-                'tmdb_id': movie['ids'].get('tmdb'),
-                'title': movie['title'],
-                'year': movie.get('year'),
-                'media_type': 'movie',
-                'last_watched_at': item.get('last_watched_at'),
-            })
-        return results
-    except requests.RequestException as e:
-        logger.error(f"Error getting Trakt watched movies for {username}: {e}")
-        return []
+        yield from response.json()
+        if not limit or page >= _page_count(response):
+            return
+        page += 1
 
-def get_watched_shows(username: str, client_id: str) -> list[dict]:
-    """Get watched TV shows from Trakt.tv."""
+def _iter_trakt(kind: str, username: str, client_id: str, path: str, parse, params: dict = None,
+                paginated: bool = False, raise_errors: bool = False):
+    """Stream parsed entries of a Trakt user endpoint, logging request errors."""
+    url = f"{TRAKT_BASE_URL}/users/{username}/{path}"
+    logger.info(f"Requesting {kind} for user: {username}")
+    logger.debug(f"Trakt API URL: {url}, client_id: {mask_sensitive(client_id)}")
+    count = 0
     try:
-        url = f"{TRAKT_BASE_URL}/users/{username}/watched/shows"
-        headers = _get_trakt_headers(client_id)
-        logger.info(f"Requesting watched shows for user: {username}")
-        
-        response = requests_get(url, headers=headers, timeout=30)
-        logger.debug(f"Trakt shows response status: {response.status_code}")
-        response.raise_for_status()
-        
-        data = response.json()
-        logger.info(f"Received {len(data)} watched shows for {username}")
-        
-        results = []
-        for item in data:
-            show = item['show']
-            results.append({
-                'trakt_id': show['ids']['trakt'],
-                'tmdb_id': show['ids'].get('tmdb'),
-                'title': show['title'],
-                'year': show.get('year'),
-                'media_type': 'tv',
-                'last_watched_at': item.get('last_watched_at'),
-            })
-        return results
+        pages = _iter_pages(url, _get_trakt_headers(client_id), params, TRAKT_PAGE_LIMIT if paginated else None)
+        for item in pages:
+            count += 1
+            yield parse(item)
     except requests.RequestException as e:
-        logger.error(f"Error getting Trakt watched shows for {username}: {e}")
-        return []
+        logger.error(f"Error getting Trakt {kind} for {username}: {e}")
+        if raise_errors:
+            raise
+        return
+    logger.info(f"Received {count} {kind} for {username}")
+
+def _episode_watches(item: dict, watched_at_key: str) -> list[tuple]:
+    """(season, episode, watched_at) of a show entry: one per history entry, or the last watch of each episode."""
+    episode = item.get('episode')
+    if episode:
+        return [(episode['season'], episode['number'], item.get(watched_at_key))]
+    return [
+        (season['number'], episode['number'], episode.get('last_watched_at'))
+        for season in item.get('seasons') or []
+        for episode in season.get('episodes') or []
+    ]
+
+def _watched_entry(item: dict, media_type: str, watched_at_key: str = 'last_watched_at') -> dict:
+    media = item['movie' if media_type == 'movie' else 'show']
+    entry = {
+        'trakt_id': media['ids']['trakt'],
+        'tmdb_id': media['ids'].get('tmdb'),
+        'title': media['title'],
+        'year': media.get('year'),
+        'media_type': media_type,
+        'last_watched_at': item.get(watched_at_key),
+        # Total plays from the watched endpoints; history entries are one play each and have none
+        'plays': item.get('plays'),
+    }
+    if media_type == 'tv':
+        entry['episodes'] = _episode_watches(item, watched_at_key)
+    return entry
+
+def _rated_entry(item: dict, media_type: str) -> dict:
+    media = item['movie' if media_type == 'movie' else 'show']
+    result = {
+        'trakt_id': media['ids']['trakt'],
+        'tmdb_id': media['ids'].get('tmdb'),
+        'title': media['title'],
+        'rating': item['rating'],
+        'rated_at': item.get('rated_at'),
+        'media_type': media_type,
+    }
+    logger.debug(f"Rated {media_type}: {result['title']} (rating: {result['rating']}, tmdb_id: {result['tmdb_id']})")
+    return result
+
+def _history_params(start_at) -> dict:
+    params = {}
+    if start_at:
+        params['start_at'] = start_at.strftime('%Y-%m-%dT%H:%M:%S.000Z')
+    return params
+
+def iter_watched_movies(username: str, client_id: str, raise_errors: bool = False):
+    """Stream watched movies from Trakt.tv."""
+    return _iter_trakt('watched movies', username, client_id, 'watched/movies',
+                       lambda item: _watched_entry(item, 'movie'), raise_errors=raise_errors)
+
+def iter_watched_shows(username: str, client_id: str, raise_errors: bool = False):
+    """Stream watched TV shows from Trakt.tv."""
+    return _iter_trakt('watched shows', username, client_id, 'watched/shows',
+                       lambda item: _watched_entry(item, 'tv'), raise_errors=raise_errors)
+
+def iter_rated_movies(username: str, client_id: str, raise_errors: bool = False):
+    """Stream rated movies from Trakt.tv, page by page."""
+    return _iter_trakt('rated movies', username, client_id, 'ratings/movies',
+                       lambda item: _rated_entry(item, 'movie'), paginated=True, raise_errors=raise_errors)
+
+def iter_rated_shows(username: str, client_id: str, raise_errors: bool = False):
+    """Stream rated TV shows from Trakt.tv, page by page."""
+    return _iter_trakt('rated shows', username, client_id, 'ratings/shows',
+                       lambda item: _rated_entry(item, 'tv'), paginated=True, raise_errors=raise_errors)
 
-def get_rated_movies(username: str, client_id: str) -> list[dict]:
+def iter_history_movies(username: str, client_id: str, start_at=None, raise_errors: bool = False):
+    """Stream movie watch history from Trakt.tv, optionally only since start_at."""
+    return _iter_trakt('movie history entries', username, client_id, 'history/movies',
+                       lambda item: _watched_entry(item, 'movie', 'watched_at'),
+                       params=_history_params(start_at), paginated=True, raise_errors=raise_errors)
+
+def iter_history_shows(username: str, client_id: str, start_at=None, raise_errors: bool = False):
+    """Stream episode watch history from Trakt.tv as show entries, optionally only since start_at."""
+    return _iter_trakt('episode history entries', username, client_id, 'history/shows',
+                       lambda item: _watched_entry(item, 'tv', 'watched_at'),
+                       params=_history_params(start_at), paginated=True, raise_errors=raise_errors)
+
+def get_watched_movies(username: str, client_id: str, raise_errors: bool = False) -> list[dict]:
+    """Get watched movies from Trakt.tv."""
+    return list(iter_watched_movies(username, client_id, raise_errors))
+
+def get_watched_shows(username: str, client_id: str, raise_errors: bool = False) -> list[dict]:
+    """Get watched TV shows from Trakt.tv."""
+    return list(iter_watched_shows(username, client_id, raise_errors))
+
+def get_rated_movies(username: str, client_id: str, raise_errors: bool = False) -> list[dict]:
     """Get rated movies from Trakt.tv."""
-    try:
-        url = f"{TRAKT_BASE_URL}/users/{username}/ratings/movies"
-        headers = _get_trakt_headers(client_id)
-        logger.info(f"Requesting rated movies for user: {username}")
-        
-        response = requests_get(url, headers=headers, timeout=30)
-        logger.debug(f"Trakt rated movies response status: {response.status_code}")
-        response.raise_for_status()
-        
-        data = response.json()
-        logger.info(f"Received {len(data)} rated movies for {username}")
-        
-        results = []
-        for item in data:
-            movie = item['movie']
-            result = {
-                'trakt_id': movie['ids']['trakt'],
-                'tmdb_id': movie['ids'].get('tmdb'),
-                'title': movie['title'],
-                'rating': item['rating'],
-                'rated_at': item.get('rated_at'),
-                'media_type': 'movie',
-            }
-            logger.debug(f"Rated movie: {result['title']} (rating: {result['rating']}, tmdb_id: {result['tmdb_id']})")
-            results.append(result)
-        return results
-    except requests.RequestException as e:
-        logger.error(f"Error getting Trakt rated movies for {username}: {e}")
-        return []
+    return list(iter_rated_movies(username, client_id, raise_errors))
 
-def get_rated_shows(username: str, client_id: str) -> list[dict]:
+def get_rated_shows(username: str, client_id: str, raise_errors: bool = False) -> list[dict]:
     """Get rated TV shows from Trakt.tv."""
-    try:
-        url = f"{TRAKT_BASE_URL}/users/{username}/ratings/shows"
-        headers = _get_trakt_headers(client_id)
-        logger.info(f"Requesting rated shows for user: {username}")
-        
-        response = requests_get(url, headers=headers, timeout=30)
-        logger.debug(f"Trakt rated shows response status: {response.status_code}")
-        response.raise_for_status()
-        
-        data = response.json()
-        logger.info(f"Received {len(data)} rated shows for {username}")
-        
-        results = []
-        for item in data:
-            show = item['show']
-            result = {
-                'trakt_id': show['ids']['trakt'],
-                'tmdb_id': show['ids'].get('tmdb'),
-                'title': show['title'],
-                'rating': item['rating'],
-                'rated_at': item.get('rated_at'),
-                'media_type': 'tv',
-            }
-            logger.debug(f"Rated show: {result['title']} (rating: {result['rating']}, tmdb_id: {result['tmdb_id']})")
-            results.append(result)
-        return results
-    except requests.RequestException as e:
-        logger.error(f"Error getting Trakt rated shows for {username}: {e}")
-        return []
\ No newline at end of file
+    return list(iter_rated_shows(username, client_id, raise_errors))
+
+def get_history_movies(username: str, client_id: str, start_at=None, raise_errors: bool = False) -> list[dict]:
+    """Get movie watch history from Trakt.tv, optionally only since start_at."""
+    return list(iter_history_movies(username, client_id, start_at, raise_errors))
+
+def get_history_shows(username: str, client_id: str, start_at=None, raise_errors: bool = False) -> list[dict]:
+    """Get episode watch history from Trakt.tv as show entries, optionally only since start_at."""
+    return list(iter_history_shows(username, client_id, start_at, raise_errors))
+
+def rated_since(items, since):
+    """Yield only ratings made after `since` (Trakt rating lists cannot be filtered server-side)."""
+    for item in items:
+        if not since:
+            yield item
+            continue
+        rated_at = item.get('rated_at')
+        if not rated_at:
+            continue
+        try:
+            if datetime.fromisoformat(rated_at.replace('Z', '+00:00')) > since:
+                yield item
+        except ValueError:
+            continue
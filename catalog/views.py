@@ -6,15 +6,41 @@ from django.urls import reverse
 from django.core.paginator import Paginator
 from django.utils import timezone
 from datetime import datetime
-from .models import Movie, UserRating, UserSettings, ImportTask
+from .models import Movie, UserRating, UserSettings, ImportTask, ShowProgress, WatchEvent
 from .tmdb_client import search_movies, get_movie_details, get_tmdb_language
 from .trakt_client import get_watched_movies, get_watched_shows, get_rated_movies, get_rated_shows
 from .tasks import import_trakt_data_task, cache_poster_task
+from .watch_history import record_watches
 from .logger import logger, mask_sensitive
+from .cache_utils import LRUCache
 import time
 import re
+import threading
 from django.contrib import messages
 
+_latest_search_seq = LRUCache(maxsize=4096, ttl=300)
+_latest_search_lock = threading.Lock()
+
+
+def _is_stale_search(user_id, seq):
+    """
+    Track the newest search sequence number per user.
+
+    Returns True when a newer query from the same user has already been
+    seen, so an older debounced request can be dropped without calling TMDB.
+    """
+    try:
+        seq = int(seq)
+    except (TypeError, ValueError):
+        return False
+    with _latest_search_lock:
+        latest = _latest_search_seq.get(user_id)
+        if latest is not None and seq < latest:
+            return True
+        _latest_search_seq.set(user_id, seq)
+        return False
+
+
 @login_required
 def movie_search(request):
     # Get user settings for TMDB API key
@@ -30,16 +56,23 @@ def movie_search(request):
     # Check if this is an HTMX request
     if request.META.get('HTTP_HX_REQUEST'):
         results = []
+        seq = request.GET.get('seq')
+        if _is_stale_search(request.user.id, seq):
+            logger.debug(f"Dropping stale search '{query}' for {request.user.username}")
+            return HttpResponse(status=204)
         if query:
             results = search_movies(query, tmdb_api_key, user_language)
-            # Add is_in_collection flag
+            if _is_stale_search(request.user.id, seq):
+                return HttpResponse(status=204)
+            # Add is_in_collection flag, resolved for the whole page in one query
+            in_collection = set(
+                UserRating.objects.filter(
+                    user=request.user,
+                    movie_id__in={result['id'] for result in results},
+                ).values_list('movie__media_type', 'movie_id')
+            )
             for result in results:
-                movie_exists = Movie.objects.filter(tmdb_id=result['id']).exists()
-                if movie_exists:
-                    movie = Movie.objects.get(tmdb_id=result['id'])
-                    result['is_in_collection'] = UserRating.objects.filter(user=request.user, movie=movie).exists()
-                else:
-                    result['is_in_collection'] = False
+                result['is_in_collection'] = (result['media_type'], result['id']) in in_collection
         return render(request, 'catalog/partials/search_results.html', {'results': results, 'query': query})
     
     return render(request, 'catalog/search.html')
@@ -58,21 +91,20 @@ def add_movie(request, media_type, tmdb_id):
         return HttpResponse('<p>Please configure TMDB API Key in settings</p>', status=400)
 
     if request.method in ['POST', 'PUT']:
-        movie_data = get_movie_details(media_type, tmdb_id, tmdb_api_key, user_language)
-        if not movie_data:
-            return HttpResponse('<p>Data loading error.</p>', status=500)
-        title = movie_data.get('title', movie_data.get('name', 'Unknown'))
-        movie, created = Movie.objects.get_or_create(
-            tmdb_id=tmdb_id,
-            media_type=media_type,
-            defaults={
-                'title': title,
-                'data': movie_data,
-            }
-        )
-        if not created:
-            movie.data = movie_data
-            movie.save()
+        movie = Movie.objects.filter(tmdb_id=tmdb_id, media_type=media_type).first()
+        if movie is None or not movie.is_data_fresh(user_language):
+            movie_data = get_movie_details(media_type, tmdb_id, tmdb_api_key, user_language)
+            if not movie_data:
+                return HttpResponse('<p>Data loading error.</p>', status=500)
+            if movie is None:
+                title = movie_data.get('title', movie_data.get('name', 'Unknown'))
+                movie = Movie(tmdb_id=tmdb_id, media_type=media_type, title=title)
+                movie.set_data(movie_data, user_language)
+                movie.save(force_insert=True)
+            elif movie.set_data(movie_data, user_language):
+                movie.save()
+            else:
+                movie.save(update_fields=['data_fetched_at', 'data_language'])
         # Create UserRating if not exists
         UserRating.objects.get_or_create(user=request.user, movie=movie)
         
@@ -89,11 +121,18 @@ def movie_detail(request, tmdb_id):
     
     # Get user rating only for authenticated users
     user_rating = None
+    show_progress = None
     if request.user.is_authenticated:
         user_rating, created = UserRating.objects.get_or_create(user=request.user, movie=movie)
+        if movie.media_type == 'tv':
+            show_progress = ShowProgress.objects.filter(user=request.user, show=movie).first()
         
         # Handle rating update (only for authenticated users)
         if request.method == 'POST':
+            if request.POST.get('watched'):
+                record_watches(request.user.id, {movie.tmdb_id: [timezone.now()]}, WatchEvent.SOURCE_MANUAL)
+                messages.success(request, 'Marked as watched!')
+                return redirect('catalog:movie_detail', tmdb_id=tmdb_id)
             rating = request.POST.get('rating')
             if rating:
                 user_rating.rating = int(rating)
@@ -111,6 +150,7 @@ def movie_detail(request, tmdb_id):
     context = {
         'movie': movie,
         'user_rating': user_rating,
+        'show_progress': show_progress,
         'title': title,
         'release_date': release_date,
         'overview': overview,
@@ -215,12 +255,15 @@ def import_from_trakt(request):
         messages.warning(request, 'Импорт уже запущен. Дождитесь завершения текущей задачи.')
         return redirect('catalog:user_settings')
 
+    incremental = request.POST.get('mode') == 'incremental'
+
     # Создаем запись о задаче
     task_id = f"import_{request.user.id}_{int(time.time())}"
     task = ImportTask.objects.create(
         user=request.user,
         task_id=task_id,
-        status='pending'
+        status='pending',
+        mode='incremental' if incremental else 'full'
     )
 
     logger.info(f"Starting import task {task_id} for user {request.user.username}")
@@ -233,7 +276,8 @@ def import_from_trakt(request):
         username=username,
         client_id=trakt_client_id,
         tmdb_key=tmdb_key,
-        language=user_language
+        language=user_language,
+        incremental=incremental
     )
 
     # Проверяем, AJAX ли запрос
@@ -254,6 +298,7 @@ def import_status(request, task_id):
         task = ImportTask.objects.get(task_id=task_id, user=request.user)
         data = {
             'status': task.status,
+            'phase': task.phase,
             'progress': task.progress,
             'imported_count': task.imported_count,
             'total_items': task.total_items,
@@ -324,26 +369,32 @@ def disable_plex_webhook(request):
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
 import json
-from .plex_utils import process_plex_event, log_webhook_event
+from django.contrib.auth.models import User
+from .plex_utils import queue_webhook_event, log_webhook_event, get_webhook_auth, DiscardFilesUploadHandler
+from .tasks import process_plex_events_task
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def plex_webhook_receiver(request, token):
     """
-    Receive and process Plex webhooks
+    Receive Plex webhooks
+
+    The event is stored and acknowledged right away; TMDB lookups and
+    library updates run in the background worker, one user at a time in
+    arrival order.
     """
     logger.info(f"Received Plex webhook with token: {mask_sensitive(token)}")
     
-    try:
-        settings = UserSettings.objects.get(
-            plex_webhook_token=token,
-            plex_webhook_enabled=True
-        )
-        user = settings.user
-        logger.info(f"Webhook matched to user: {user.username}")
-    except UserSettings.DoesNotExist:
+    auth = get_webhook_auth(token)
+    if auth is None:
         logger.warning(f"Invalid or disabled webhook token: {mask_sensitive(token)}")
         return JsonResponse({'error': 'Invalid token'}, status=403)
+    # Stand-in for the owner, enough for foreign keys and logging without a query
+    user = User(id=auth.user_id, username=auth.username)
+    logger.info(f"Webhook matched to user: {user.username}")
+    
+    # Only the payload field is used; thumbnail parts are skipped unread
+    request.upload_handlers = [DiscardFilesUploadHandler(request)]
     
     try:
         payload_json = request.POST.get('payload')
@@ -356,17 +407,11 @@ def plex_webhook_receiver(request, token):
         
         logger.info(f"Plex event: {event} for user {user.username}")
         
-        processed = process_plex_event(user, event, payload)
-        
-        log_webhook_event(
-            user=user,
-            event_type=event,
-            payload=payload,
-            processed=processed,
-            error_message='' if processed else 'Event not processed'
-        )
+        _, queued = queue_webhook_event(user, event, payload)
+        if queued:
+            process_plex_events_task(user.id)
         
-        return JsonResponse({'status': 'ok', 'processed': processed})
+        return JsonResponse({'status': 'ok', 'queued': queued})
         
     except json.JSONDecodeError as e:
         logger.error(f"Invalid JSON payload: {e}")
@@ -0,0 +1,166 @@
+from datetime import timedelta
+from django.conf import settings
+from django.db import transaction
+from .models import EpisodeWatch, ShowProgress, UserRating, WatchEvent
+from .logger import logger
+
+
+def _is_recorded(recorded, watched_at, source, tolerance):
+    """Whether a watch matches a recorded one: same time, or close to one from another source"""
+    return any(
+        recorded_at == watched_at or (recorded_source != source and abs(recorded_at - watched_at) <= tolerance)
+        for recorded_at, recorded_source in recorded
+    )
+
+
+def record_watches(user_id, watches_by_movie, source, plays_by_movie=None):
+    """
+    Append watch events and update the counters on UserRating.
+
+    Args:
+        user_id: Owner of the watches
+        watches_by_movie: Dict of TMDB ID -> iterable of watched_at
+            datetimes; the movies must exist
+        source: One of the WatchEvent.SOURCE_* values
+        plays_by_movie: Optional dict of TMDB ID -> total plays the source
+            knows of (Trakt's `plays`), which may exceed the watches it
+            lists with a date
+
+    Watches already recorded with the same timestamp are skipped, as are
+    watches within WATCH_DEDUP_TOLERANCE seconds of one recorded by another
+    source (the same viewing reported by Plex and by Trakt). Missing
+    UserRating rows are created; play_count, first_watched_at and
+    watched_at are adjusted by the new events only, in the same
+    transaction, so the library can sort on UserRating without touching
+    WatchEvent. play_count is raised to plays_by_movie where that is higher.
+
+    Returns:
+        int: Number of new watches
+    """
+    plays_by_movie = {movie_id: plays for movie_id, plays in (plays_by_movie or {}).items() if plays}
+    watches_by_movie = {movie_id: set(watches) for movie_id, watches in watches_by_movie.items()}
+    watches_by_movie = {movie_id: watches for movie_id, watches in watches_by_movie.items() if watches}
+    movie_ids = set(watches_by_movie) | set(plays_by_movie)
+    if not movie_ids:
+        return 0
+    tolerance = timedelta(seconds=getattr(settings, 'WATCH_DEDUP_TOLERANCE', 300))
+
+    with transaction.atomic():
+        recorded = {}
+        for movie_id, watched_at, recorded_source in WatchEvent.objects.filter(
+            user_id=user_id, movie_id__in=watches_by_movie
+        ).values_list('movie_id', 'watched_at', 'source'):
+            recorded.setdefault(movie_id, []).append((watched_at, recorded_source))
+        ratings = {
+            row.movie_id: row
+            for row in UserRating.objects.select_for_update().filter(user_id=user_id, movie_id__in=movie_ids)
+        }
+        new_events = []
+        new_ratings = []
+        changed_ratings = []
+        for movie_id in movie_ids:
+            known = recorded.get(movie_id, [])
+            added = sorted(
+                watched_at for watched_at in watches_by_movie.get(movie_id, ())
+                if not _is_recorded(known, watched_at, source, tolerance)
+            )
+            plays = plays_by_movie.get(movie_id, 0)
+            row = ratings.get(movie_id)
+            if not added and (row.play_count if row else 0) >= plays:
+                continue
+            new_events.extend(
+                WatchEvent(user_id=user_id, movie_id=movie_id, watched_at=watched_at, source=source)
+                for watched_at in added
+            )
+
+            if row is None:
+                row = UserRating(user_id=user_id, movie_id=movie_id)
+                new_ratings.append(row)
+            else:
+                changed_ratings.append(row)
+            row.play_count = max(row.play_count + len(added), plays)
+            if added and (row.first_watched_at is None or added[0] < row.first_watched_at):
+                row.first_watched_at = added[0]
+            if added and (row.watched_at is None or added[-1] > row.watched_at):
+                row.watched_at = added[-1]
+
+        WatchEvent.objects.bulk_create(new_events)
+        UserRating.objects.bulk_create(new_ratings)
+        UserRating.objects.bulk_update(changed_ratings, ['play_count', 'first_watched_at', 'watched_at'])
+
+    logger.debug(f"Recorded {len(new_events)} {source} watches across {len(movie_ids)} titles for user {user_id}")
+    return len(new_events)
+
+
+def record_episode_watches(user_id, watches_by_show):
+    """
+    Append episode watches and update the per-show rollups.
+
+    Args:
+        user_id: Owner of the watches
+        watches_by_show: Dict of show TMDB ID -> iterable of
+            (season, episode, watched_at) tuples; the shows must exist
+
+    Watches already recorded with the same timestamp are skipped, so
+    re-importing the same history is harmless. ShowProgress counters are
+    adjusted by the new rows only and never recomputed from EpisodeWatch.
+
+    Returns:
+        int: Number of new watches
+    """
+    watches_by_show = {
+        show_id: {(season, episode, watched_at) for season, episode, watched_at in watches}
+        for show_id, watches in watches_by_show.items()
+    }
+    watches_by_show = {show_id: watches for show_id, watches in watches_by_show.items() if watches}
+    if not watches_by_show:
+        return 0
+
+    with transaction.atomic():
+        recorded = {}
+        for show_id, season, episode, watched_at in EpisodeWatch.objects.filter(
+            user_id=user_id, show_id__in=watches_by_show
+        ).values_list('show_id', 'season', 'episode', 'watched_at'):
+            recorded.setdefault(show_id, set()).add((season, episode, watched_at))
+
+        progress = {
+            row.show_id: row
+            for row in ShowProgress.objects.select_for_update().filter(user_id=user_id, show_id__in=watches_by_show)
+        }
+        new_watches = []
+        new_progress = []
+        changed_progress = []
+        for show_id, watches in watches_by_show.items():
+            known = recorded.get(show_id, set())
+            added = sorted(watches - known, key=lambda watch: watch[2])
+            if not added:
+                continue
+            known_episodes = {(season, episode) for season, episode, _ in known}
+            new_episodes = {(season, episode) for season, episode, _ in added} - known_episodes
+            new_watches.extend(
+                EpisodeWatch(user_id=user_id, show_id=show_id, season=season, episode=episode, watched_at=watched_at)
+                for season, episode, watched_at in added
+            )
+
+            row = progress.get(show_id)
+            if row is None:
+                row = ShowProgress(user_id=user_id, show_id=show_id)
+                new_progress.append(row)
+            else:
+                changed_progress.append(row)
+            row.episodes_watched += len(new_episodes)
+            row.watch_count += len(added)
+            last_season, last_episode, last_watched_at = added[-1]
+            if row.last_watched_at is None or last_watched_at >= row.last_watched_at:
+                row.last_season = last_season
+                row.last_episode = last_episode
+                row.last_watched_at = last_watched_at
+
+        EpisodeWatch.objects.bulk_create(new_watches)
+        ShowProgress.objects.bulk_create(new_progress)
+        ShowProgress.objects.bulk_update(
+            changed_progress, ['episodes_watched', 'watch_count', 'last_season', 'last_episode', 'last_watched_at']
+        )
+
+    logger.debug(f"Recorded {len(new_watches)} episode watches across {len(watches_by_show)} shows for user {user_id}")
+    return len(new_watches)
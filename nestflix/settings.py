@@ -46,6 +46,7 @@ INSTALLED_APPS = [
 MIDDLEWARE = [
     "django.middleware.security.SecurityMiddleware",
     "whitenoise.middleware.WhiteNoiseMiddleware",
+    "catalog.middleware.PosterServingMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.locale.LocaleMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -85,6 +86,12 @@ DATABASES = {
     "default": {
         "ENGINE": "django.db.backends.sqlite3",
         "NAME": BASE_DIR / "db/db.sqlite3",
+        # Take the write lock when a transaction starts: with SQLite's default deferred
+        # transactions, two writers that read first fail with "database is locked"
+        # instead of waiting for each other
+        "OPTIONS": {"transaction_mode": "IMMEDIATE"},
+        # A file, unlike the shared-cache in-memory default, locks like the real database
+        "TEST": {"NAME": BASE_DIR / "db/test_db.sqlite3"},
     }
 }
 
@@ -148,9 +155,78 @@ STORAGES = {
 MEDIA_URL = '/media/'
 MEDIA_ROOT = BASE_DIR / 'media'
 
+# Caches
+# The "tmdb" cache is the persistent tier of the TMDB details cache and
+# lives next to the database so it survives restarts and is shared by
+# the web and worker processes.
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    "tmdb": {
+        "BACKEND": "django.core.cache.backends.filebased.FileBasedCache",
+        "LOCATION": BASE_DIR / "db" / "cache" / "tmdb",
+        "OPTIONS": {"MAX_ENTRIES": 50000},
+    },
+}
+
+# TMDB details cache settings (seconds)
+TMDB_CACHE_ENABLED = config('TMDB_CACHE_ENABLED', default=True, cast=bool)
+TMDB_CACHE_TTL = config('TMDB_CACHE_TTL', default=60 * 60 * 24, cast=int)
+TMDB_CACHE_STALE_TTL = config('TMDB_CACHE_STALE_TTL', default=60 * 60 * 24 * 7, cast=int)
+TMDB_CACHE_MAX_ENTRIES = config('TMDB_CACHE_MAX_ENTRIES', default=2048, cast=int)
+TMDB_CACHE_ALIAS = 'tmdb'
+
+# Movie rows whose TMDB data is younger than this are not refetched by imports and Plex events
+TMDB_DATA_FRESH_DAYS = config('TMDB_DATA_FRESH_DAYS', default=7, cast=int)
+
+# TMDB search: 'concurrent', 'sequential' or 'multi' (single /search/multi request)
+TMDB_RATE_LIMIT = config('TMDB_RATE_LIMIT', default=40, cast=float)  # requests per second, per process
+TMDB_SEARCH_MODE = config('TMDB_SEARCH_MODE', default='concurrent')
+TMDB_SEARCH_WORKERS = config('TMDB_SEARCH_WORKERS', default=8, cast=int)
+TMDB_SEARCH_CACHE_TTL = config('TMDB_SEARCH_CACHE_TTL', default=600, cast=int)
+TMDB_SEARCH_CACHE_MAX_ENTRIES = config('TMDB_SEARCH_CACHE_MAX_ENTRIES', default=1024, cast=int)
+
+# Trakt import settings
+IMPORT_BATCH_SIZE = config('IMPORT_BATCH_SIZE', default=200, cast=int)
+IMPORT_PROGRESS_INTERVAL = config('IMPORT_PROGRESS_INTERVAL', default=2.0, cast=float)  # seconds
+TMDB_IMPORT_WORKERS = config('TMDB_IMPORT_WORKERS', default=8, cast=int)
+TRAKT_FETCH_DEADLINE = config('TRAKT_FETCH_DEADLINE', default=60.0, cast=float)  # seconds, all Trakt lists
+# Watches from different sources (Plex, Trakt) this close together are one viewing
+WATCH_DEDUP_TOLERANCE = config('WATCH_DEDUP_TOLERANCE', default=300, cast=int)  # seconds
+
+# Repeated Plex webhooks for the same user, event and item within this window are collapsed
+PLEX_WEBHOOK_DEDUP_WINDOW = config('PLEX_WEBHOOK_DEDUP_WINDOW', default=300, cast=int)  # seconds, 0 disables
+PLEX_WEBHOOK_AUTH_CACHE_TTL = config('PLEX_WEBHOOK_AUTH_CACHE_TTL', default=60, cast=int)  # seconds
+
+# Runtime counters (webhooks, caches) are added to the shared StatCounter rows at most this often
+STATS_FLUSH_INTERVAL = config('STATS_FLUSH_INTERVAL', default=60.0, cast=float)  # seconds
+
+# Plex webhook event storage, pruned by the prune_plex_events command (0 disables a limit)
+PLEX_EVENT_RETENTION_DAYS = config('PLEX_EVENT_RETENTION_DAYS', default=90, cast=int)
+PLEX_EVENT_MAX_PER_USER = config('PLEX_EVENT_MAX_PER_USER', default=1000, cast=int)
+PLEX_EVENT_KEEP_RAW_PAYLOAD = config('PLEX_EVENT_KEEP_RAW_PAYLOAD', default=False, cast=bool)  # zlib-compressed
+
 # Poster cache settings
 POSTER_CACHE_DAYS = 30  # Re-download posters after 30 days
-POSTER_CACHE_SIZE = 'w300'  # Default TMDB image size
+POSTER_CACHE_SIZE = config('POSTER_CACHE_SIZE', default='w500')  # Master size downloaded from TMDB
+POSTER_SIZES = config('POSTER_SIZES', default='w200,w300', cast=lambda v: [s.strip() for s in v.split(',') if s.strip()])  # Derived locally from the master
+POSTER_JPEG_QUALITY = config('POSTER_JPEG_QUALITY', default=85, cast=int)
+# Extra formats cached posters are transcoded to, in order of preference (e.g. 'avif,webp'); empty disables
+POSTER_FORMATS = config('POSTER_FORMATS', default='', cast=lambda v: [s.strip().lower() for s in v.split(',') if s.strip()])
+POSTER_WEBP_QUALITY = config('POSTER_WEBP_QUALITY', default=80, cast=int)
+POSTER_AVIF_QUALITY = config('POSTER_AVIF_QUALITY', default=60, cast=int)
+
+# Bulk poster downloads (cache_posters --workers)
+POSTER_DOWNLOAD_WORKERS = config('POSTER_DOWNLOAD_WORKERS', default=8, cast=int)
+POSTER_DOWNLOAD_PER_HOST = config('POSTER_DOWNLOAD_PER_HOST', default=8, cast=int)  # keep <= HTTP_POOL_MAXSIZE
+POSTER_DOWNLOAD_MAX_KBPS = config('POSTER_DOWNLOAD_MAX_KBPS', default=0, cast=int)  # KiB/s, 0 disables the cap
+
+# Serving cached posters (catalog.middleware.PosterServingMiddleware)
+POSTER_MAX_AGE = config('POSTER_MAX_AGE', default=86400, cast=int)  # seconds, for posters cached before content hashing
+# 'x-accel-redirect' (nginx) or 'x-sendfile' (Apache, lighttpd) to let the front proxy send the file; empty serves it from Django
+POSTER_SENDFILE = config('POSTER_SENDFILE', default='')
+POSTER_SENDFILE_PREFIX = config('POSTER_SENDFILE_PREFIX', default='/protected-posters/')  # nginx internal location of MEDIA_ROOT/posters
 
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
@@ -188,3 +264,10 @@ if PROXY_ENABLED:
             PROXIES['http'] = HTTP_PROXY
         if HTTPS_PROXY:
             PROXIES['https'] = HTTPS_PROXY
+
+# Outgoing HTTP connection pooling (TMDB, Trakt, poster downloads)
+HTTP_POOL_CONNECTIONS = config('HTTP_POOL_CONNECTIONS', default=4, cast=int)
+HTTP_POOL_MAXSIZE = config('HTTP_POOL_MAXSIZE', default=10, cast=int)
+HTTP_MAX_RETRIES = config('HTTP_MAX_RETRIES', default=3, cast=int)
+HTTP_BACKOFF_FACTOR = config('HTTP_BACKOFF_FACTOR', default=0.5, cast=float)
+HTTP_TIMEOUT = config('HTTP_TIMEOUT', default=15, cast=float)